@@ -1,6 +1,5 @@
 # AWS SES Email Sender for FastAPI
 
-import boto3
 from fastapi import FastAPI, HTTPException, Depends
 from pydantic import BaseModel, EmailStr
 from typing import List, Optional
@@ -8,6 +7,7 @@ from dotenv import load_dotenv
 import os
 from fastapi.security import APIKeyHeader
 from starlette.status import HTTP_403_FORBIDDEN
+from app.services.aws_clients import get_aws_client
 
 load_dotenv()  
 AWS_ACCESS_KEY_ID = os.getenv("AWS_ACCESS_KEY_ID")  
@@ -53,7 +53,7 @@ class EmailResponse(BaseModel):
 
 
 def get_ses_client():
-    return boto3.client(
+    return get_aws_client(
         'ses',
         aws_access_key_id= AWS_ACCESS_KEY_ID,
         aws_secret_access_key= AWS_SECRET_ACCESS_KEY,
@@ -16,6 +16,112 @@ class Settings(BaseSettings):
     AWS_ACCESS_KEY_ID: str = os.getenv("AWS_ACCESS_KEY_ID", "")
     AWS_SECRET_ACCESS_KEY: str = os.getenv("AWS_SECRET_ACCESS_KEY", "")
     AWS_REGION: str = os.getenv("AWS_REGION", "us-east-1")
+    AWS_MAX_POOL_CONNECTIONS: int = int(os.getenv("AWS_MAX_POOL_CONNECTIONS", "50"))
+    AWS_TCP_KEEPALIVE: bool = os.getenv("AWS_TCP_KEEPALIVE", "True").lower() == "true"
+    AWS_CONNECT_TIMEOUT: float = float(os.getenv("AWS_CONNECT_TIMEOUT", "5"))
+    AWS_READ_TIMEOUT: float = float(os.getenv("AWS_READ_TIMEOUT", "30"))
+
+    # Executor for blocking SES calls (defaults to one thread per pooled connection)
+    SES_EXECUTOR_MAX_WORKERS: int = int(os.getenv("SES_EXECUTOR_MAX_WORKERS", os.getenv("AWS_MAX_POOL_CONNECTIONS", "50")))
+    SES_EXECUTOR_MAX_PENDING: int = int(os.getenv("SES_EXECUTOR_MAX_PENDING", "100"))
+
+    # SES transport: "boto3" (executor threads) or "async" (native asyncio, SigV4-signed)
+    SES_TRANSPORT: str = os.getenv("SES_TRANSPORT", "boto3").lower()
+    SES_ENDPOINT_URL: str = os.getenv("SES_ENDPOINT_URL", "")  # e.g. a local SES stand-in
+    SES_ASYNC_MAX_CONNECTIONS: int = int(os.getenv("SES_ASYNC_MAX_CONNECTIONS", "200"))
+
+    # Account-wide SES send-rate limiting (rate from GetSendQuota, shared via MySQL leases)
+    SES_RATE_LIMIT_ENABLED: bool = os.getenv("SES_RATE_LIMIT_ENABLED", "True").lower() == "true"
+    SES_DEFAULT_MAX_SEND_RATE: float = float(os.getenv("SES_DEFAULT_MAX_SEND_RATE", "14"))
+    SES_QUOTA_REFRESH_SECONDS: float = float(os.getenv("SES_QUOTA_REFRESH_SECONDS", "60"))
+    SES_RATE_LEASE_TTL_SECONDS: int = int(os.getenv("SES_RATE_LEASE_TTL_SECONDS", "150"))
+    SES_BULK_QUOTA_RESERVE: float = float(os.getenv("SES_BULK_QUOTA_RESERVE", "0.1"))  # share of 24h quota kept for transactional email
+
+    # SES retry and circuit breaker settings
+    SES_RETRY_MAX_ATTEMPTS: int = int(os.getenv("SES_RETRY_MAX_ATTEMPTS", "4"))
+    SES_RETRY_BASE_DELAY: float = float(os.getenv("SES_RETRY_BASE_DELAY", "0.2"))
+    SES_RETRY_MAX_DELAY: float = float(os.getenv("SES_RETRY_MAX_DELAY", "5"))
+    SES_CIRCUIT_FAILURE_THRESHOLD: int = int(os.getenv("SES_CIRCUIT_FAILURE_THRESHOLD", "5"))
+    SES_CIRCUIT_RESET_SECONDS: float = float(os.getenv("SES_CIRCUIT_RESET_SECONDS", "30"))
+
+    # Batch send settings
+    BATCH_SEND_CONCURRENCY: int = int(os.getenv("BATCH_SEND_CONCURRENCY", "20"))
+    BATCH_MAX_ITEMS: int = int(os.getenv("BATCH_MAX_ITEMS", "1000"))
+
+    # Stored Jinja2 email templates
+    TEMPLATE_CACHE_MAX_SIZE: int = int(os.getenv("TEMPLATE_CACHE_MAX_SIZE", "256"))  # compiled template versions
+    TEMPLATE_VERSION_TTL_SECONDS: float = float(os.getenv("TEMPLATE_VERSION_TTL_SECONDS", "5"))  # how fast other nodes see edits
+    TEMPLATE_RENDER_CHUNK_SIZE: int = int(os.getenv("TEMPLATE_RENDER_CHUNK_SIZE", "200"))
+    TEMPLATE_RENDER_WORKERS: int = int(os.getenv("TEMPLATE_RENDER_WORKERS", "4"))
+    SES_TEMPLATE_PREFIX: str = os.getenv("SES_TEMPLATE_PREFIX", "notification-api")  # names of templates synced to SES
+
+    # Attachments (content-addressed in the database, cached per node on disk) and raw MIME sends
+    ATTACHMENT_STORE_DIR: str = os.getenv("ATTACHMENT_STORE_DIR", "data/attachments")
+    ATTACHMENT_MAX_BYTES: int = int(os.getenv("ATTACHMENT_MAX_BYTES", str(7 * 1024 * 1024)))
+    ATTACHMENT_METADATA_CACHE_SIZE: int = int(os.getenv("ATTACHMENT_METADATA_CACHE_SIZE", "10000"))
+    ATTACHMENT_ENCODED_CACHE_BYTES: int = int(os.getenv("ATTACHMENT_ENCODED_CACHE_BYTES", str(128 * 1024 * 1024)))
+    ATTACHMENT_IO_WORKERS: int = int(os.getenv("ATTACHMENT_IO_WORKERS", "4"))
+    SES_RAW_MESSAGE_MAX_BYTES: int = int(os.getenv("SES_RAW_MESSAGE_MAX_BYTES", str(10 * 1024 * 1024)))
+
+    # Email log listing (/api/email/logs)
+    EMAIL_LOGS_PAGE_MAX_SIZE: int = int(os.getenv("EMAIL_LOGS_PAGE_MAX_SIZE", "500"))
+
+    # Idempotency-Key handling for /api/send/email
+    IDEMPOTENCY_TTL_SECONDS: int = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+    IDEMPOTENCY_LEASE_SECONDS: int = int(os.getenv("IDEMPOTENCY_LEASE_SECONDS", "300"))  # in-flight claim lifetime
+    IDEMPOTENCY_CACHE_MAX_SIZE: int = int(os.getenv("IDEMPOTENCY_CACHE_MAX_SIZE", "10000"))
+    IDEMPOTENCY_CLEANUP_INTERVAL_SECONDS: float = float(os.getenv("IDEMPOTENCY_CLEANUP_INTERVAL_SECONDS", "300"))
+    IDEMPOTENCY_CLEANUP_BATCH_SIZE: int = int(os.getenv("IDEMPOTENCY_CLEANUP_BATCH_SIZE", "5000"))
+
+    # Suppression list (hard bounces, complaints and manual entries)
+    SUPPRESSION_ENABLED: bool = os.getenv("SUPPRESSION_ENABLED", "True").lower() == "true"
+    SUPPRESSION_SYNC_INTERVAL_SECONDS: float = float(os.getenv("SUPPRESSION_SYNC_INTERVAL_SECONDS", "30"))
+    SUPPRESSION_REBUILD_INTERVAL_SECONDS: float = float(os.getenv("SUPPRESSION_REBUILD_INTERVAL_SECONDS", "3600"))
+    SUPPRESSION_CACHE_MAX_SIZE: int = int(os.getenv("SUPPRESSION_CACHE_MAX_SIZE", "10000"))
+    SUPPRESSION_CACHE_TTL_SECONDS: float = float(os.getenv("SUPPRESSION_CACHE_TTL_SECONDS", "300"))
+    SUPPRESSION_BLOOM_ERROR_RATE: float = float(os.getenv("SUPPRESSION_BLOOM_ERROR_RATE", "0.001"))
+    SUPPRESSION_BLOOM_MIN_CAPACITY: int = int(os.getenv("SUPPRESSION_BLOOM_MIN_CAPACITY", "100000"))
+
+    # Admin endpoints (/api/admin/...) are disabled unless a token is configured
+    ADMIN_API_TOKEN: str = os.getenv("ADMIN_API_TOKEN", "")
+
+    # Email log export (/api/email/logs/export)
+    EXPORT_FETCH_SIZE: int = int(os.getenv("EXPORT_FETCH_SIZE", "1000"))
+    EXPORT_MAX_CONCURRENT: int = int(os.getenv("EXPORT_MAX_CONCURRENT", "2"))
+    EXPORT_NET_WRITE_TIMEOUT: int = int(os.getenv("EXPORT_NET_WRITE_TIMEOUT", "600"))
+
+    # Deferred email log writes (final status of each send is batched)
+    EMAIL_LOG_DEFERRED_WRITES: bool = os.getenv("EMAIL_LOG_DEFERRED_WRITES", "True").lower() == "true"
+    EMAIL_LOG_FLUSH_INTERVAL_MS: int = int(os.getenv("EMAIL_LOG_FLUSH_INTERVAL_MS", "200"))
+    EMAIL_LOG_FLUSH_MAX_BATCH: int = int(os.getenv("EMAIL_LOG_FLUSH_MAX_BATCH", "500"))
+
+    # SES webhook event buffering
+    SES_EVENT_BUFFER_ENABLED: bool = os.getenv("SES_EVENT_BUFFER_ENABLED", "True").lower() == "true"
+    SES_EVENT_FLUSH_INTERVAL_MS: int = int(os.getenv("SES_EVENT_FLUSH_INTERVAL_MS", "500"))
+    SES_EVENT_FLUSH_MAX_EVENTS: int = int(os.getenv("SES_EVENT_FLUSH_MAX_EVENTS", "1000"))
+    # Events for message ids not logged yet (their send is still in the log writer) are retried this long
+    SES_EVENT_UNMATCHED_RETRY_SECONDS: float = float(os.getenv("SES_EVENT_UNMATCHED_RETRY_SECONDS", "30"))
+    SES_EVENT_DEDUPE_CACHE_SIZE: int = int(os.getenv("SES_EVENT_DEDUPE_CACHE_SIZE", "100000"))  # recent SNS MessageIds
+    SES_EVENT_DEDUPE_TTL_SECONDS: int = int(os.getenv("SES_EVENT_DEDUPE_TTL_SECONDS", "86400"))
+    SES_EVENT_DEDUPE_CLEANUP_INTERVAL_SECONDS: float = float(os.getenv("SES_EVENT_DEDUPE_CLEANUP_INTERVAL_SECONDS", "600"))
+
+    # SNS message signature verification for /api/email/events
+    SNS_VERIFY_SIGNATURES: bool = os.getenv("SNS_VERIFY_SIGNATURES", "True").lower() == "true"
+    SNS_CERT_ALLOWED_HOSTS: str = os.getenv("SNS_CERT_ALLOWED_HOSTS", "sns.*.amazonaws.com,sns.*.amazonaws.com.cn")  # * = one DNS label
+    SNS_ALLOWED_TOPIC_ARNS: str = os.getenv("SNS_ALLOWED_TOPIC_ARNS", "")  # comma-separated, empty = any topic
+    SNS_CERT_CACHE_MAX_SIZE: int = int(os.getenv("SNS_CERT_CACHE_MAX_SIZE", "16"))
+    SNS_CERT_FETCH_TIMEOUT: float = float(os.getenv("SNS_CERT_FETCH_TIMEOUT", "5"))
+
+    # Outbox (queued send) settings
+    OUTBOX_WORKERS: int = int(os.getenv("OUTBOX_WORKERS", "2"))
+    OUTBOX_BATCH_SIZE: int = int(os.getenv("OUTBOX_BATCH_SIZE", "20"))
+    OUTBOX_POLL_INTERVAL_SECONDS: float = float(os.getenv("OUTBOX_POLL_INTERVAL_SECONDS", "1"))
+    OUTBOX_CLAIM_TIMEOUT_SECONDS: int = int(os.getenv("OUTBOX_CLAIM_TIMEOUT_SECONDS", "300"))
+    OUTBOX_MAX_ATTEMPTS: int = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "5"))
+    # Failed attempts are retried after OUTBOX_RETRY_BASE_SECONDS, doubling per attempt up to
+    # OUTBOX_RETRY_MAX_SECONDS (or later if SES asked for it); deferrals do not use up attempts
+    OUTBOX_RETRY_BASE_SECONDS: int = int(os.getenv("OUTBOX_RETRY_BASE_SECONDS", "5"))
+    OUTBOX_RETRY_MAX_SECONDS: int = int(os.getenv("OUTBOX_RETRY_MAX_SECONDS", "600"))
     
     # # API security
     # API_KEY: str = os.getenv("API_KEY", "your_secure_api_key")
@@ -26,6 +132,33 @@ class Settings(BaseSettings):
     DB_SERVER: str = os.getenv("DB_SERVER")
     DB_NAME: str = os.getenv("DB_NAME")
     DB_PORT: str = os.getenv("DB_PORT")
+
+    # Database connection pool settings
+    DB_POOL_MIN_SIZE: int = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+    DB_POOL_MAX_SIZE: int = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+    DB_POOL_RECYCLE_SECONDS: int = int(os.getenv("DB_POOL_RECYCLE_SECONDS", "1800"))
+    DB_POOL_ACQUIRE_TIMEOUT: float = float(os.getenv("DB_POOL_ACQUIRE_TIMEOUT", "10"))
+    DB_POOL_AUTOCOMMIT: bool = os.getenv("DB_POOL_AUTOCOMMIT", "False").lower() == "true"
+
+    # Schema migrations (app/database/migrations.py)
+    DB_RUN_MIGRATIONS: bool = os.getenv("DB_RUN_MIGRATIONS", "True").lower() == "true"
+    DB_REQUIRE_INDEXES: bool = os.getenv("DB_REQUIRE_INDEXES", "False").lower() == "true"
+
+    # Application token cache settings. The cache is per process: a revoked or rotated token
+    # keeps working for up to TOKEN_CACHE_TTL_SECONDS on every process that cached it, unless
+    # POST /api/admin/applications/{app_id}/token-cache/invalidate is sent to that process
+    TOKEN_CACHE_MAX_SIZE: int = int(os.getenv("TOKEN_CACHE_MAX_SIZE", "1024"))
+    TOKEN_CACHE_TTL_SECONDS: float = float(os.getenv("TOKEN_CACHE_TTL_SECONDS", "300"))
+    TOKEN_CACHE_NEGATIVE_TTL_SECONDS: float = float(os.getenv("TOKEN_CACHE_NEGATIVE_TTL_SECONDS", "30"))
+
+    # /api/email/metrics response cache and response compression
+    METRICS_CACHE_TTL_SECONDS: float = float(os.getenv("METRICS_CACHE_TTL_SECONDS", "15"))
+    METRICS_CACHE_MAX_SIZE: int = int(os.getenv("METRICS_CACHE_MAX_SIZE", "256"))
+    # Rollup deltas of sends are summed in memory and upserted once per interval
+    METRICS_ROLLUP_BATCHED: bool = os.getenv("METRICS_ROLLUP_BATCHED", "True").lower() == "true"
+    METRICS_ROLLUP_FLUSH_INTERVAL_MS: int = int(os.getenv("METRICS_ROLLUP_FLUSH_INTERVAL_MS", "1000"))
+    GZIP_MINIMUM_SIZE: int = int(os.getenv("GZIP_MINIMUM_SIZE", "1000"))
+    GZIP_COMPRESS_LEVEL: int = int(os.getenv("GZIP_COMPRESS_LEVEL", "6"))
     
     class Config:
         env_file = ".env"
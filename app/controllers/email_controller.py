@@ -1,21 +1,336 @@
-from fastapi import HTTPException
-from app.models.email_models import EmailRequest, EmailResponse
+import base64
+import json
+import math
+from datetime import datetime
+from fastapi import HTTPException, Response
+from fastapi.responses import StreamingResponse
+from app.models.email_models import (
+    EmailRequest, EmailResponse, EmailQueuedResponse, BatchEmailRequest, BatchEmailResponse, EmailLogPage,
+    RecipientLookupRequest, RecipientLookupResponse, SuppressionRequest, SuppressionResponse,
+    SuppressionCheckResponse, TemplateRequest, TemplateResponse, AttachmentResponse
+)
+from app.repositories.email_repositories import EmailRepository
+from app.repositories.recipient_repositories import RecipientRepository
+from app.repositories.template_repositories import TemplateRepository
+from app.config import settings
 from app.services.ses_service import SESService
+from app.services.ses_resilience import SESSendError, PERMANENT, THROTTLE
+from app.services.log_export import EXPORT_FORMATS, export_slot_available, stream_export
+from app.services.suppression import suppression_list, RecipientsSuppressed
+from app.services.templates import (
+    template_store, CompiledTemplate, TemplateError, TemplateInvalid, TemplateNotFound
+)
+from app.services.attachments import attachment_store, AttachmentEmpty, AttachmentError, AttachmentTooLarge
+from app.services.token_cache import invalidate_application_token
+from app.services.idempotency import idempotency_store, IdempotencyStore, IdempotencyKeyReused, IdempotencyKeyInFlight
 from sqlalchemy.orm import Session
 
+# Failures that guarantee nothing was sent, so an Idempotency-Key may be retried
+NOT_SENT_ERRORS = (SESSendError, RecipientsSuppressed, TemplateError, AttachmentError)
+
 class EmailController:
     """Controller for email-related operations"""
     
     @staticmethod
-    async def send_email(email_request: EmailRequest, db: Session) -> EmailResponse:
-        """Handle sending an email through AWS SES"""
+    async def send_email(email_request: EmailRequest, db: Session, app_id: int, idempotency_key: str = None,
+                         response: Response = None) -> EmailResponse:
+        """
+        Handle sending an email through AWS SES.
+        With an idempotency_key, a retry of the same request returns the original
+        result (marked with an Idempotent-Replayed header) instead of sending again.
+        """
+        EmailController.bind_app(app_id, email_request)
         try:
-            result = await SESService.send_email(email_request, db)
+            if idempotency_key:
+                result, replayed = await idempotency_store.run(
+                    app_id,
+                    idempotency_key,
+                    IdempotencyStore.fingerprint(email_request),
+                    lambda conn: SESService.send_email(email_request, conn),
+                    release_on=NOT_SENT_ERRORS
+                )
+                if replayed and response is not None:
+                    response.headers["Idempotent-Replayed"] = "true"
+            else:
+                result = await SESService.send_email(email_request, db)
             
             return EmailResponse(
                 message_id=result["message_id"],
                 status=result["status"]
             )
             
+        except SESSendError as e:
+            raise EmailController.send_error_to_http(e)
+        except (RecipientsSuppressed, IdempotencyKeyReused, AttachmentError) as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        except IdempotencyKeyInFlight as e:
+            raise HTTPException(status_code=409, detail=str(e), headers={"Retry-After": "1"})
+        except TemplateError as e:
+            raise EmailController.template_error_to_http(e)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+    @staticmethod
+    def bind_app(app_id: int, *requests):
+        """
+        Attribute requests to the application authenticated by verify_token. Stored
+        templates and attachment grants are looked up by app_id, so the app_id of the
+        body is never trusted.
+        """
+        for request in requests:
+            if request is not None:
+                request.app_id = app_id
+
+    @staticmethod
+    def template_error_to_http(error: TemplateError) -> HTTPException:
+        """Missing templates are 404s; templates that do not compile or render are the caller's 422s"""
+        if isinstance(error, TemplateNotFound):
+            return HTTPException(status_code=404, detail=str(error))
+        return HTTPException(status_code=422, detail=str(error))
+
+    @staticmethod
+    def send_error_to_http(error: SESSendError) -> HTTPException:
+        """Map a classified SES failure to an HTTP error clients can act on"""
+        detail = f"Failed to send email: {error}"
+        if error.kind == PERMANENT:
+            return HTTPException(status_code=500, detail=detail)
+
+        # Throttled/transient/circuit-open: tell the client when retrying makes sense
+        status_code = 429 if error.kind == THROTTLE else 503
+        retry_after = str(max(1, math.ceil(error.retry_after or 1)))
+        return HTTPException(status_code=status_code, detail=detail, headers={"Retry-After": retry_after})
+
+    @staticmethod
+    async def queue_email(email_request: EmailRequest, db: Session, app_id: int) -> EmailQueuedResponse:
+        """Validate an email and write it to the outbox for a background worker to send"""
+        EmailController.bind_app(app_id, email_request)
+        try:
+            # Render now: the outbox stores a plain content email
+            email_request = await template_store.render_request(email_request)
+            if email_request.attachments:
+                # Only the references are queued; the worker reads the content from the store
+                await attachment_store.resolve(app_id, email_request.attachments)
+            log_id = await EmailRepository.enqueue_email(db, email_request)
+        except TemplateError as e:
+            raise EmailController.template_error_to_http(e)
+        except AttachmentError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+        return EmailQueuedResponse(id=log_id, status="Queued")
+
+    @staticmethod
+    async def send_batch(batch_request: BatchEmailRequest, db: Session, app_id: int) -> BatchEmailResponse:
+        """Handle sending a batch of emails through AWS SES"""
+        EmailController.bind_app(app_id, batch_request.template, *(batch_request.items or []))
+        if batch_request.bulk:
+            if not (batch_request.template and batch_request.template.template_id and batch_request.recipients):
+                raise HTTPException(status_code=400, detail="Bulk batches need a template with template_id, and recipients")
+            if batch_request.template.attachments:
+                raise HTTPException(status_code=400, detail="Bulk batches cannot carry attachments")
+            count = len(batch_request.recipients)
+        else:
+            email_requests = batch_request.expand()
+            if not email_requests:
+                raise HTTPException(status_code=400, detail="Batch must contain items, or a template and recipients")
+            count = len(email_requests)
+        if count > settings.BATCH_MAX_ITEMS:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Batch too large: {count} items (max {settings.BATCH_MAX_ITEMS})"
+            )
+
+        try:
+            if batch_request.bulk:
+                results = await SESService.send_bulk_templated(batch_request.template, batch_request.recipients, db)
+            else:
+                results = await SESService.send_batch(email_requests, db)
+        except TemplateError as e:
+            raise EmailController.template_error_to_http(e)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+        sent = sum(1 for result in results if result["status"] == "Sent")
+        return BatchEmailResponse(
+            total=len(results),
+            sent=sent,
+            failed=len(results) - sent,
+            results=results
+        )
+
+    @staticmethod
+    async def upload_attachment(app_id: int, chunks, filename: str, content_type: str,
+                                content_length: int = None) -> AttachmentResponse:
+        """Store a streamed attachment upload; identical content is stored only once"""
+        if content_length is not None and content_length > settings.ATTACHMENT_MAX_BYTES:
+            raise HTTPException(status_code=413, detail=f"Attachment exceeds {settings.ATTACHMENT_MAX_BYTES} bytes")
+        try:
+            metadata = await attachment_store.save_stream(app_id, chunks, filename, content_type)
+        except AttachmentTooLarge as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        except AttachmentEmpty as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+        return AttachmentResponse(
+            attachment_id=metadata["sha256"],
+            filename=metadata["filename"],
+            content_type=metadata["content_type"],
+            size=metadata["size"]
+        )
+
+    @staticmethod
+    async def save_template(db, app_id: int, template_id: str, request: TemplateRequest) -> TemplateResponse:
+        """Create or replace a stored template after checking that it compiles"""
+        try:
+            CompiledTemplate(template_id, 0, request.subject, request.body_text, request.body_html)
+        except TemplateInvalid as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        try:
+            version = await TemplateRepository.save(
+                db, app_id, template_id, request.subject, request.body_text, request.body_html
+            )
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+        template_store.forget(app_id, template_id)
+        return TemplateResponse(template_id=template_id, version=version)
+
+    @staticmethod
+    async def get_template(db, app_id: int, template_id: str) -> TemplateResponse:
+        try:
+            template = await TemplateRepository.get(db, app_id, template_id)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+        if template is None:
+            raise HTTPException(status_code=404, detail=f"Template {template_id!r} not found")
+        return TemplateResponse(**template)
+
+    @staticmethod
+    async def delete_template(db, app_id: int, template_id: str) -> dict:
+        try:
+            deleted = await TemplateRepository.delete(db, app_id, template_id)
         except Exception as e:
-            raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+            raise HTTPException(status_code=500, detail=str(e))
+        template_store.forget(app_id, template_id)
+        if not deleted:
+            raise HTTPException(status_code=404, detail=f"Template {template_id!r} not found")
+        return {"status": "deleted", "template_id": template_id}
+
+    @staticmethod
+    def encode_cursor(row: dict) -> str:
+        """Opaque pagination cursor holding the (sent_at, id) of the last row of a page"""
+        raw = json.dumps([row["sent_at"].isoformat(), row["id"]]).encode("utf-8")
+        return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+    @staticmethod
+    def decode_cursor(cursor: str) -> tuple:
+        try:
+            raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+            sent_at, log_id = json.loads(raw)
+            return datetime.fromisoformat(sent_at), int(log_id)
+        except (ValueError, TypeError):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    @staticmethod
+    async def list_email_logs(db, limit: int, cursor: str = None, app_id: int = None, status: str = None,
+                              sent_from: datetime = None, sent_to: datetime = None, fields: str = None) -> EmailLogPage:
+        """Return one keyset-paginated page of email logs"""
+        after = EmailController.decode_cursor(cursor) if cursor else None
+        columns = [field.strip() for field in fields.split(",") if field.strip()] if fields else None
+
+        try:
+            rows, has_more = await EmailRepository.list_email_logs(
+                db, limit=limit, after=after, app_id=app_id, status=status,
+                sent_from=sent_from, sent_to=sent_to, columns=columns
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        next_cursor = EmailController.encode_cursor(rows[-1]) if has_more and rows else None
+        return EmailLogPage(items=rows, next_cursor=next_cursor)
+
+    @staticmethod
+    def export_email_logs(export_format: str, compress: bool = False, app_id: int = None, status: str = None,
+                          sent_from: datetime = None, sent_to: datetime = None, fields: str = None) -> StreamingResponse:
+        """Stream all matching email logs as NDJSON or CSV"""
+        if export_format not in EXPORT_FORMATS:
+            raise HTTPException(status_code=400, detail=f"Unsupported export format: {export_format}")
+        columns = [field.strip() for field in fields.split(",") if field.strip()] if fields else None
+        try:
+            columns = EmailRepository.log_columns(columns)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if not export_slot_available():
+            raise HTTPException(status_code=429, detail="Too many exports in progress", headers={"Retry-After": "30"})
+
+        headers = {"Content-Disposition": f'attachment; filename="email_logs.{export_format}"'}
+        if compress:
+            headers["Content-Encoding"] = "gzip"
+        return StreamingResponse(
+            stream_export(
+                export_format, columns, compress,
+                app_id=app_id, status=status, sent_from=sent_from, sent_to=sent_to
+            ),
+            media_type=EXPORT_FORMATS[export_format],
+            headers=headers
+        )
+
+    @staticmethod
+    async def lookup_recipient(lookup: RecipientLookupRequest, db, app_id: int) -> RecipientLookupResponse:
+        """Return what happened to one address across the application's emails"""
+        try:
+            deliveries = await RecipientRepository.find_by_address(db, lookup.address, app_id=app_id, limit=lookup.limit)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+        return RecipientLookupResponse(
+            address_hash=RecipientRepository.address_hash(lookup.address),
+            deliveries=deliveries
+        )
+
+    @staticmethod
+    async def add_suppressions(request: SuppressionRequest) -> SuppressionResponse:
+        """Add addresses to the suppression list"""
+        try:
+            changed = await suppression_list.add(request.addresses, reason=request.reason or "manual")
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+        return SuppressionResponse(requested=len(request.addresses), changed=changed)
+
+    @staticmethod
+    async def remove_suppressions(request: SuppressionRequest) -> SuppressionResponse:
+        """Remove addresses from the suppression list"""
+        try:
+            changed = await suppression_list.remove(request.addresses)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+        return SuppressionResponse(requested=len(request.addresses), changed=changed)
+
+    @staticmethod
+    async def check_suppressions(request: SuppressionRequest) -> SuppressionCheckResponse:
+        """Report which of the given addresses are suppressed"""
+        hashes = {address: RecipientRepository.address_hash(address) for address in request.addresses}
+        try:
+            suppressed = await suppression_list.suppressed_hashes(hashes.values())
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+        return SuppressionCheckResponse(
+            suppressed=[address for address, address_hash in hashes.items() if address_hash in suppressed]
+        )
+
+    @staticmethod
+    async def rebuild_suppressions() -> dict:
+        """Reload the in-memory suppression filter from the database now"""
+        try:
+            await suppression_list.rebuild()
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+        return {"status": "rebuilt"}
+
+    @staticmethod
+    def invalidate_token_cache(app_id: int) -> dict:
+        """Forget this process's cached token verifications of an application"""
+        invalidate_application_token(app_id)
+        return {"status": "invalidated", "app_id": app_id}
@@ -68,6 +68,7 @@ import urllib.parse
 import mysql.connector
 
 from contextlib import asynccontextmanager
+import asyncio
 import aiomysql
 
 encoded_password = urllib.parse.quote_plus(settings.DB_PASSWORD)
@@ -119,18 +120,83 @@ Base = declarative_base()
 
 
 
+# Process-wide connection pool, created and closed by the app lifespan
+db_pool = None
+
+
+async def init_db_pool():
+    """Create the shared aiomysql connection pool"""
+    global db_pool
+    if db_pool is None:
+        db_pool = await aiomysql.create_pool(
+            host=settings.DB_SERVER,
+            port=int(settings.DB_PORT or 3306),
+            user=settings.DB_USERNAME,
+            password=settings.DB_PASSWORD,
+            db=settings.DB_NAME,
+            minsize=settings.DB_POOL_MIN_SIZE,
+            maxsize=settings.DB_POOL_MAX_SIZE,
+            pool_recycle=settings.DB_POOL_RECYCLE_SECONDS,
+            autocommit=settings.DB_POOL_AUTOCOMMIT,
+        )
+    return db_pool
+
+
+async def close_db_pool():
+    """Close the shared connection pool and wait for connections to be released"""
+    global db_pool
+    if db_pool is not None:
+        db_pool.close()
+        await db_pool.wait_closed()
+        db_pool = None
+
+
+async def get_db_pool():
+    """Dependency returning the shared pool (for short, self-managed acquires)"""
+    if db_pool is None:
+        await init_db_pool()
+    return db_pool
+
+
+async def acquire_connection():
+    """Acquire a connection from the shared pool, honouring the acquire timeout"""
+    pool = await get_db_pool()
+    return await asyncio.wait_for(pool.acquire(), timeout=settings.DB_POOL_ACQUIRE_TIMEOUT)
+
+
+async def release_connection(conn):
+    """Return a connection to the shared pool, rolling back any open transaction"""
+    try:
+        if not conn.closed and conn.get_transaction_status():
+            await conn.rollback()
+    finally:
+        db_pool.release(conn)
+
+
+async def commit_if_needed(conn):
+    """Commit unless the connection is in autocommit mode (saves a round trip per write)"""
+    if not conn.get_autocommit():
+        await conn.commit()
+
+
+@asynccontextmanager
+async def transaction(conn):
+    """Run the enclosed statements in one explicit transaction, even on autocommit connections"""
+    await conn.begin()
+    try:
+        yield conn
+    except BaseException:
+        await conn.rollback()
+        raise
+    await conn.commit()
+
+
 async def get_db():
-    conn = await aiomysql.connect(
-        host=settings.DB_SERVER,
-        port=3306,
-        user=settings.DB_USERNAME,
-        password=settings.DB_PASSWORD,
-        db=settings.DB_NAME,
-    )
+    conn = await acquire_connection()
     try:
         yield conn
     finally:
-        conn.close()
+        await release_connection(conn)
 
 
 
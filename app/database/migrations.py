@@ -0,0 +1,429 @@
+"""
+Versioned raw-SQL schema migrations.
+
+Each migration runs once, in version order, and is recorded in schema_migrations.
+They run at startup when DB_RUN_MIGRATIONS is enabled, or manually with:
+
+    python -m app.database.migrations          # apply pending migrations
+    python -m app.database.migrations --verify # only check required indexes
+"""
+import asyncio
+import logging
+import sys
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+MIGRATION_LOCK_NAME = "notification_api_schema_migrations"
+MIGRATION_LOCK_TIMEOUT = 60
+
+# Indexes the hot paths rely on: (table, index name)
+REQUIRED_INDEXES = [
+    ("email_logs", "uq_email_logs_message_id"),      # webhook updates by message_id
+    ("email_logs", "ix_email_logs_app_id_sent_at"),  # per-app metrics and listings
+    ("email_logs", "ix_email_logs_sent_at"),         # metrics by date range
+    ("email_logs", "ix_email_logs_status_id"),       # outbox claims
+    ("applications", "ix_applications_id_token"),    # token verification
+    ("email_recipients", "ix_email_recipients_address_hash"),  # per-address lookups
+    ("email_recipients", "ix_email_recipients_message_id"),    # per-recipient SES events
+    ("idempotency_keys", "ix_idempotency_keys_expires_at"),    # TTL cleanup
+    ("sns_processed_events", "ix_sns_processed_events_processed_at"),  # TTL cleanup
+]
+
+
+async def _column_exists(cursor, table: str, column: str) -> bool:
+    await cursor.execute(
+        """
+        SELECT 1 FROM information_schema.columns
+        WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s
+        """,
+        (table, column)
+    )
+    return await cursor.fetchone() is not None
+
+
+async def _index_exists(cursor, table: str, index: str) -> bool:
+    await cursor.execute(
+        """
+        SELECT 1 FROM information_schema.statistics
+        WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s
+        LIMIT 1
+        """,
+        (table, index)
+    )
+    return await cursor.fetchone() is not None
+
+
+async def _add_column(cursor, table: str, column: str, definition: str):
+    if not await _column_exists(cursor, table, column):
+        await cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+
+
+async def _add_index(cursor, table: str, index: str, definition: str):
+    if not await _index_exists(cursor, table, index):
+        await cursor.execute(f"ALTER TABLE {table} ADD {definition}")
+
+
+async def create_base_tables(cursor):
+    await cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS applications (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            app_name VARCHAR(255) NOT NULL,
+            token VARCHAR(255) NOT NULL UNIQUE,
+            is_active TINYINT(1) DEFAULT 1,
+            created_date DATETIME DEFAULT CURRENT_TIMESTAMP,
+            modified_date DATETIME NULL ON UPDATE CURRENT_TIMESTAMP,
+            created_by INT NULL,
+            modified_by INT NULL
+        )
+        """
+    )
+    await cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS email_logs (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            sender_email VARCHAR(255) NOT NULL,
+            sender_name VARCHAR(255) NULL,
+            recipients TEXT NOT NULL,
+            cc TEXT NULL,
+            bcc TEXT NULL,
+            subject VARCHAR(500) NOT NULL,
+            message_id VARCHAR(100) NULL,
+            status VARCHAR(50) NOT NULL,
+            sent_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            error_message TEXT NULL,
+            is_success TINYINT(1) NOT NULL DEFAULT 1,
+            opens INT NOT NULL DEFAULT 0,
+            clicks INT NOT NULL DEFAULT 0,
+            bounces INT NOT NULL DEFAULT 0,
+            complaints INT NOT NULL DEFAULT 0,
+            app_id INT NULL
+        )
+        """
+    )
+
+
+async def add_outbox_columns(cursor):
+    await _add_column(cursor, "email_logs", "app_id", "INT NULL")
+    await _add_column(cursor, "email_logs", "payload", "MEDIUMTEXT NULL")
+    await _add_column(cursor, "email_logs", "attempts", "INT NOT NULL DEFAULT 0")
+    await _add_column(cursor, "email_logs", "claimed_at", "DATETIME NULL")
+
+
+async def create_rate_lease_table(cursor):
+    await cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS ses_rate_leases (
+            worker_id VARCHAR(100) PRIMARY KEY,
+            expires_at DATETIME NOT NULL
+        )
+        """
+    )
+
+
+async def normalize_legacy_message_ids(cursor):
+    # Older code logged a placeholder message_id of 0 for in-flight and failed sends
+    await cursor.execute("UPDATE email_logs SET message_id = NULL WHERE message_id IN ('', '0')")
+    # ...and a second row per send; keep only the newest row for each real message_id
+    await cursor.execute(
+        """
+        DELETE older FROM email_logs older
+        JOIN email_logs newer ON newer.message_id = older.message_id AND newer.id > older.id
+        """
+    )
+
+
+async def add_hot_path_indexes(cursor):
+    await _add_index(cursor, "email_logs", "uq_email_logs_message_id",
+                     "UNIQUE INDEX uq_email_logs_message_id (message_id)")
+    await _add_index(cursor, "email_logs", "ix_email_logs_app_id_sent_at",
+                     "INDEX ix_email_logs_app_id_sent_at (app_id, sent_at)")
+    await _add_index(cursor, "email_logs", "ix_email_logs_sent_at",
+                     "INDEX ix_email_logs_sent_at (sent_at)")
+    await _add_index(cursor, "email_logs", "ix_email_logs_status_id",
+                     "INDEX ix_email_logs_status_id (status, id)")
+    await _add_index(cursor, "applications", "ix_applications_id_token",
+                     "INDEX ix_applications_id_token (id, token)")
+
+
+async def create_metrics_rollup(cursor):
+    await cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS email_metrics_daily (
+            app_id INT NOT NULL DEFAULT 0,
+            day DATE NOT NULL,
+            total INT NOT NULL DEFAULT 0,
+            success INT NOT NULL DEFAULT 0,
+            bounced INT NOT NULL DEFAULT 0,
+            complaints INT NOT NULL DEFAULT 0,
+            opens INT NOT NULL DEFAULT 0,
+            clicks INT NOT NULL DEFAULT 0,
+            PRIMARY KEY (app_id, day),
+            INDEX ix_email_metrics_daily_day (day)
+        )
+        """
+    )
+    # Backfill from the existing history. Inlined on purpose: an applied migration
+    # must not change with later repository code.
+    await cursor.execute("DELETE FROM email_metrics_daily")
+    await cursor.execute(
+        """
+        INSERT INTO email_metrics_daily (app_id, day, total, success, bounced, complaints, opens, clicks)
+        SELECT
+            COALESCE(app_id, 0),
+            DATE(sent_at),
+            COUNT(*),
+            SUM(CASE WHEN is_success = 1 THEN 1 ELSE 0 END),
+            SUM(CASE WHEN status = 'Bounced' THEN 1 ELSE 0 END),
+            SUM(CASE WHEN status = 'Complaint' THEN 1 ELSE 0 END),
+            SUM(COALESCE(opens, 0)),
+            SUM(COALESCE(clicks, 0))
+        FROM email_logs
+        GROUP BY COALESCE(app_id, 0), DATE(sent_at)
+        """
+    )
+
+
+async def create_recipients_table(cursor):
+    await cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS email_recipients (
+            id BIGINT AUTO_INCREMENT PRIMARY KEY,
+            email_log_id INT NOT NULL,
+            message_id VARCHAR(100) NULL,
+            app_id INT NULL,
+            address_hash CHAR(64) NOT NULL,
+            role VARCHAR(10) NOT NULL,
+            status VARCHAR(50) NOT NULL,
+            created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            INDEX ix_email_recipients_address_hash (address_hash, app_id),
+            INDEX ix_email_recipients_message_id (message_id, address_hash),
+            INDEX ix_email_recipients_email_log_id (email_log_id)
+        )
+        """
+    )
+
+
+async def create_suppression_table(cursor):
+    await cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS suppressed_addresses (
+            id BIGINT AUTO_INCREMENT PRIMARY KEY,
+            address_hash CHAR(64) NOT NULL,
+            reason VARCHAR(20) NOT NULL,
+            message_id VARCHAR(100) NULL,
+            created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE INDEX uq_suppressed_addresses_address_hash (address_hash)
+        )
+        """
+    )
+
+
+async def create_idempotency_table(cursor):
+    await cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS idempotency_keys (
+            app_id INT NOT NULL,
+            idempotency_key VARCHAR(255) NOT NULL,
+            request_hash CHAR(64) NOT NULL,
+            response TEXT NULL,
+            created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            expires_at DATETIME NOT NULL,
+            PRIMARY KEY (app_id, idempotency_key),
+            INDEX ix_idempotency_keys_expires_at (expires_at)
+        )
+        """
+    )
+
+
+async def create_sns_events_table(cursor):
+    await cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS sns_processed_events (
+            sns_message_id VARCHAR(100) NOT NULL PRIMARY KEY,
+            batch_id BIGINT NOT NULL,
+            processed_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            INDEX ix_sns_processed_events_processed_at (processed_at)
+        )
+        """
+    )
+
+
+async def create_templates_table(cursor):
+    await cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS email_templates (
+            id BIGINT AUTO_INCREMENT PRIMARY KEY,
+            app_id INT NOT NULL,
+            template_id VARCHAR(100) NOT NULL,
+            version INT NOT NULL DEFAULT 1,
+            subject TEXT NOT NULL,
+            body_text MEDIUMTEXT NOT NULL,
+            body_html MEDIUMTEXT NULL,
+            created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            UNIQUE INDEX uq_email_templates_app_id_template_id (app_id, template_id)
+        )
+        """
+    )
+
+
+async def create_attachments_table(cursor):
+    await cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS email_attachments (
+            app_id INT NOT NULL,
+            sha256 CHAR(64) NOT NULL,
+            filename VARCHAR(255) NOT NULL,
+            content_type VARCHAR(100) NOT NULL,
+            size BIGINT NOT NULL,
+            created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (app_id, sha256)
+        )
+        """
+    )
+
+
+async def create_attachment_content_tables(cursor):
+    # Attachment content, shared by every node; local disk only caches it
+    await cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS attachment_contents (
+            sha256 CHAR(64) NOT NULL PRIMARY KEY,
+            size BIGINT NOT NULL,
+            chunk_count INT NOT NULL,
+            created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+        """
+    )
+    await cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS attachment_chunks (
+            sha256 CHAR(64) NOT NULL,
+            seq INT NOT NULL,
+            data MEDIUMBLOB NOT NULL,
+            PRIMARY KEY (sha256, seq)
+        )
+        """
+    )
+
+
+async def add_outbox_retry_column(cursor):
+    await _add_column(cursor, "email_logs", "next_attempt_at", "DATETIME NULL")
+
+
+async def add_template_deleted_at(cursor):
+    await _add_column(cursor, "email_templates", "deleted_at", "DATETIME NULL")
+
+
+# (version, description, upgrade coroutine) - append only, never renumber
+MIGRATIONS = [
+    (1, "create base tables", create_base_tables),
+    (2, "add outbox columns to email_logs", add_outbox_columns),
+    (3, "create ses_rate_leases", create_rate_lease_table),
+    (4, "normalize legacy message ids", normalize_legacy_message_ids),
+    (5, "add indexes for message_id, sent_at, app_id and token lookups", add_hot_path_indexes),
+    (6, "create and backfill email_metrics_daily", create_metrics_rollup),
+    (7, "create email_recipients", create_recipients_table),
+    (8, "create suppressed_addresses", create_suppression_table),
+    (9, "create idempotency_keys", create_idempotency_table),
+    (10, "create sns_processed_events", create_sns_events_table),
+    (11, "create email_templates", create_templates_table),
+    (12, "create email_attachments", create_attachments_table),
+    (13, "create attachment_contents and attachment_chunks", create_attachment_content_tables),
+    (14, "add next_attempt_at to email_logs", add_outbox_retry_column),
+    (15, "add deleted_at to email_templates", add_template_deleted_at),
+]
+
+
+async def run_migrations(conn) -> list:
+    """Apply pending migrations on the given connection; returns the versions applied"""
+    applied = []
+    async with conn.cursor() as cursor:
+        # Serialise concurrent startups of several API nodes
+        await cursor.execute("SELECT GET_LOCK(%s, %s)", (MIGRATION_LOCK_NAME, MIGRATION_LOCK_TIMEOUT))
+        row = await cursor.fetchone()
+        if not row or row[0] != 1:
+            raise RuntimeError("Timed out waiting for the schema migration lock")
+
+        try:
+            await cursor.execute(
+                """
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    version INT PRIMARY KEY,
+                    description VARCHAR(255) NOT NULL,
+                    applied_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+                )
+                """
+            )
+            await cursor.execute("SELECT version FROM schema_migrations")
+            done = {row[0] for row in await cursor.fetchall()}
+
+            for version, description, upgrade in MIGRATIONS:
+                if version in done:
+                    continue
+                logger.info(f"Applying migration {version}: {description}")
+                await upgrade(cursor)
+                await cursor.execute(
+                    "INSERT INTO schema_migrations (version, description) VALUES (%s, %s)",
+                    (version, description)
+                )
+                await conn.commit()
+                applied.append(version)
+        finally:
+            await cursor.execute("SELECT RELEASE_LOCK(%s)", (MIGRATION_LOCK_NAME,))
+            await cursor.fetchone()
+
+    return applied
+
+
+async def find_missing_indexes(conn) -> list:
+    """Return the REQUIRED_INDEXES that are not present in the database"""
+    async with conn.cursor() as cursor:
+        await cursor.execute(
+            """
+            SELECT DISTINCT table_name, index_name FROM information_schema.statistics
+            WHERE table_schema = DATABASE()
+            """
+        )
+        present = {(row[0], row[1]) for row in await cursor.fetchall()}
+    return [index for index in REQUIRED_INDEXES if index not in present]
+
+
+async def prepare_schema(conn):
+    """Startup hook: apply migrations (if enabled) and verify the hot-path indexes exist"""
+    if settings.DB_RUN_MIGRATIONS:
+        applied = await run_migrations(conn)
+        if applied:
+            logger.info(f"Applied schema migrations: {applied}")
+
+    missing = await find_missing_indexes(conn)
+    if missing:
+        names = ", ".join(f"{table}.{index}" for table, index in missing)
+        if settings.DB_REQUIRE_INDEXES:
+            raise RuntimeError(f"Missing required database indexes: {names}")
+        logger.warning(f"Missing database indexes (queries will be slow): {names}")
+
+
+async def main(argv):
+    from app.database.database import acquire_connection, close_db_pool, init_db_pool, release_connection
+
+    logging.basicConfig(level=logging.INFO)
+    await init_db_pool()
+    conn = await acquire_connection()
+    try:
+        if "--verify" not in argv:
+            print(f"Applied migrations: {await run_migrations(conn) or 'none'}")
+        missing = await find_missing_indexes(conn)
+        print(f"Missing indexes: {missing or 'none'}")
+    finally:
+        await release_connection(conn)
+        await close_db_pool()
+    return 1 if missing else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(sys.argv[1:])))
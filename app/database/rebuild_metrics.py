@@ -0,0 +1,42 @@
+"""
+Backfill or rebuild the email_metrics_daily rollup from email_logs.
+
+    python -m app.database.rebuild_metrics            # rebuild every day
+    python -m app.database.rebuild_metrics --days 7   # rebuild only the last 7 days
+
+Run it after bulk edits to email_logs or to correct drift around midnight
+(inserts are counted against the database's current date).
+"""
+import argparse
+import asyncio
+import logging
+import sys
+from datetime import datetime, timedelta
+
+from app.database.database import acquire_connection, close_db_pool, init_db_pool, release_connection
+from app.repositories.metrics_repositories import MetricsRepository
+
+
+async def main(argv):
+    parser = argparse.ArgumentParser(description="Rebuild the email_metrics_daily rollup")
+    parser.add_argument("--days", type=int, default=None, help="only rebuild the last N days")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    since = None
+    if args.days is not None:
+        since = (datetime.utcnow() - timedelta(days=args.days)).date()
+
+    await init_db_pool()
+    conn = await acquire_connection()
+    try:
+        rows = await MetricsRepository.rebuild(conn, since)
+        print(f"Rebuilt {rows} rollup rows" + (f" since {since}" if since else ""))
+    finally:
+        await release_connection(conn)
+        await close_db_pool()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(sys.argv[1:])))
@@ -1,15 +1,73 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
 
 from app.config import settings
+from app.database.database import init_db_pool, close_db_pool, acquire_connection, release_connection
+from app.database.migrations import prepare_schema
+from app.services.executor import ses_executor
+from app.services.templates import template_executor
+from app.services.attachments import attachment_executor
+from app.services.ses_transport import close_ses_transport
+from app.services.outbox_worker import outbox_worker
+from app.services.rate_limiter import send_rate_limiter
+from app.services.log_writer import email_log_writer
+from app.services.event_buffer import ses_event_buffer
+from app.services.metrics_rollup import metrics_rollup_writer
+from app.services.suppression import suppression_list
+from app.services.idempotency import idempotency_store
 from app.routes import email_routes
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Create shared resources on startup and release them on shutdown"""
+    await init_db_pool()
+    conn = await acquire_connection()
+    try:
+        await prepare_schema(conn)
+    finally:
+        await release_connection(conn)
+    if settings.METRICS_ROLLUP_BATCHED:
+        metrics_rollup_writer.start()
+    if settings.EMAIL_LOG_DEFERRED_WRITES:
+        email_log_writer.start()
+    if settings.SES_EVENT_BUFFER_ENABLED:
+        ses_event_buffer.start()
+    if settings.SUPPRESSION_ENABLED:
+        suppression_list.start()
+    idempotency_store.start()
+    if settings.SES_RATE_LIMIT_ENABLED:
+        send_rate_limiter.start()
+    if settings.OUTBOX_WORKERS > 0:
+        outbox_worker.start()
+    try:
+        yield
+    finally:
+        await outbox_worker.stop()
+        await send_rate_limiter.stop()
+        await email_log_writer.stop()
+        await ses_event_buffer.stop()
+        await suppression_list.stop()
+        await idempotency_store.stop()
+        # Last: the writers above record rollup deltas while they flush
+        await metrics_rollup_writer.stop()
+        await close_ses_transport()
+        ses_executor.shutdown(wait=True)
+        template_executor.shutdown(wait=True)
+        attachment_executor.shutdown(wait=True)
+        await close_db_pool()
+
+
 # Create FastAPI application
 app = FastAPI(
     title=settings.APP_NAME,
     description="A REST API for sending emails using AWS SES",
     version="1.0.0",
-    debug=settings.DEBUG
+    debug=settings.DEBUG,
+    lifespan=lifespan
 )
 
 # Configure CORS
@@ -21,6 +79,13 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress large responses (e.g. long metric ranges) for clients that accept gzip
+app.add_middleware(
+    GZipMiddleware,
+    minimum_size=settings.GZIP_MINIMUM_SIZE,
+    compresslevel=settings.GZIP_COMPRESS_LEVEL,
+)
+
 # Include routers
 app.include_router(email_routes.router, prefix="/api")
 
@@ -1,9 +1,12 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Index
 from sqlalchemy.sql import func
 from app.database.database import Base
 
 class Application(Base):
     __tablename__ = "applications"
+    __table_args__ = (
+        Index("ix_applications_id_token", "id", "token"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     app_name = Column(String, nullable=False)
@@ -12,6 +15,5 @@ class Application(Base):
     created_date = Column(DateTime(timezone=True), server_default=func.now())
     modified_date = Column(DateTime(timezone=True), onupdate=func.now())
     created_by = Column(Integer, nullable=True)
-    modified_by = Column(Integer,nullable=True) 
-    
-    
\ No newline at end of file
+    modified_by = Column(Integer,nullable=True)
+
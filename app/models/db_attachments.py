@@ -0,0 +1,31 @@
+from sqlalchemy import Column, BigInteger, Integer, LargeBinary, String, DateTime
+from sqlalchemy.sql import func
+from app.database.database import Base
+
+class EmailAttachment(Base):
+    """Model for uploaded attachments; the content is stored once by sha256 in attachment_chunks"""
+    __tablename__ = "email_attachments"
+
+    app_id = Column(Integer, primary_key=True)
+    sha256 = Column(String(64), primary_key=True)  # content address, also the attachment_id
+    filename = Column(String(255), nullable=False)
+    content_type = Column(String(100), nullable=False)
+    size = Column(BigInteger, nullable=False)
+    created_at = Column(DateTime, server_default=func.now(), nullable=False)
+
+class AttachmentContent(Base):
+    """Model for stored attachment content; written once every chunk is in place"""
+    __tablename__ = "attachment_contents"
+
+    sha256 = Column(String(64), primary_key=True)
+    size = Column(BigInteger, nullable=False)
+    chunk_count = Column(Integer, nullable=False)
+    created_at = Column(DateTime, server_default=func.now(), nullable=False)
+
+class AttachmentChunk(Base):
+    """Model for one chunk of attachment content (kept below max_allowed_packet)"""
+    __tablename__ = "attachment_chunks"
+
+    sha256 = Column(String(64), primary_key=True)
+    seq = Column(Integer, primary_key=True)
+    data = Column(LargeBinary(16 * 1024 * 1024 - 1), nullable=False)  # MEDIUMBLOB
@@ -14,13 +14,20 @@
 #     error_message = Column(Text, nullable=True)
 #     is_success = Column(Boolean, default=True, nullable=False)
 
-from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean
+from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, Index
 from sqlalchemy.sql import func
 from app.database.database import Base
 
 class EmailLog(Base):
     """Model for storing email sending logs in the database"""
     __tablename__ = "email_logs"
+    # Mirrors the indexes created by app/database/migrations.py
+    __table_args__ = (
+        Index("uq_email_logs_message_id", "message_id", unique=True),
+        Index("ix_email_logs_app_id_sent_at", "app_id", "sent_at"),
+        Index("ix_email_logs_sent_at", "sent_at"),
+        Index("ix_email_logs_status_id", "status", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     sender_email = Column(String(255), nullable=False)
@@ -39,3 +46,10 @@ class EmailLog(Base):
     clicks = Column(Integer, default=0, nullable=False)      # Number of clicks
     bounces = Column(Integer, default=0, nullable=False)     # Bounce count
     complaints = Column(Integer, default=0, nullable=False)  # Complaint count
+    app_id = Column(Integer, nullable=True)
+
+    # Outbox fields used by the queued (202 Accepted) send path
+    payload = Column(Text, nullable=True)                    # Serialized EmailRequest for queued emails
+    attempts = Column(Integer, default=0, nullable=False)    # Number of send attempts by outbox workers
+    claimed_at = Column(DateTime, nullable=True)             # When an outbox worker last claimed the row
+    next_attempt_at = Column(DateTime, nullable=True)        # Queued rows are not claimed before this time
@@ -0,0 +1,17 @@
+from sqlalchemy import Column, Integer, String, Text, DateTime, Index
+from sqlalchemy.sql import func
+from app.database.database import Base
+
+class IdempotencyKey(Base):
+    """Model for the stored outcome of sends made with an Idempotency-Key header"""
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (
+        Index("ix_idempotency_keys_expires_at", "expires_at"),
+    )
+
+    app_id = Column(Integer, primary_key=True)
+    idempotency_key = Column(String(255), primary_key=True)
+    request_hash = Column(String(64), nullable=False)   # sha256 of the request body
+    response = Column(Text, nullable=True)              # JSON response, NULL while the send is in flight
+    created_at = Column(DateTime, server_default=func.now(), nullable=False)
+    expires_at = Column(DateTime, nullable=False)
@@ -0,0 +1,18 @@
+from sqlalchemy import Column, Integer, Date, Index
+from app.database.database import Base
+
+class EmailMetricsDaily(Base):
+    """Daily email metrics rollup per application, maintained alongside email_logs writes"""
+    __tablename__ = "email_metrics_daily"
+    __table_args__ = (
+        Index("ix_email_metrics_daily_day", "day"),
+    )
+
+    app_id = Column(Integer, primary_key=True, default=0)  # 0 for emails logged without an app_id
+    day = Column(Date, primary_key=True)
+    total = Column(Integer, default=0, nullable=False)
+    success = Column(Integer, default=0, nullable=False)
+    bounced = Column(Integer, default=0, nullable=False)
+    complaints = Column(Integer, default=0, nullable=False)
+    opens = Column(Integer, default=0, nullable=False)
+    clicks = Column(Integer, default=0, nullable=False)
@@ -0,0 +1,23 @@
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, Index
+from sqlalchemy.sql import func
+from app.database.database import Base
+
+class EmailRecipient(Base):
+    """Model for the per-recipient delivery status of an email"""
+    __tablename__ = "email_recipients"
+    # Mirrors the indexes created by app/database/migrations.py
+    __table_args__ = (
+        Index("ix_email_recipients_address_hash", "address_hash", "app_id"),
+        Index("ix_email_recipients_message_id", "message_id", "address_hash"),
+        Index("ix_email_recipients_email_log_id", "email_log_id"),
+    )
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    email_log_id = Column(Integer, nullable=False)
+    message_id = Column(String(100), nullable=True)
+    app_id = Column(Integer, nullable=True)
+    address_hash = Column(String(64), nullable=False)   # sha256 of the lower-cased address
+    role = Column(String(10), nullable=False)           # to, cc or bcc
+    status = Column(String(50), nullable=False)
+    created_at = Column(DateTime, server_default=func.now(), nullable=False)
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now(), nullable=False)
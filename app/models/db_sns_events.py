@@ -0,0 +1,14 @@
+from sqlalchemy import Column, BigInteger, String, DateTime, Index
+from sqlalchemy.sql import func
+from app.database.database import Base
+
+class SNSProcessedEvent(Base):
+    """Model for SNS notifications whose SES event has been applied (webhook deduplication)"""
+    __tablename__ = "sns_processed_events"
+    __table_args__ = (
+        Index("ix_sns_processed_events_processed_at", "processed_at"),
+    )
+
+    sns_message_id = Column(String(100), primary_key=True)
+    batch_id = Column(BigInteger, nullable=False)   # flush that applied the event
+    processed_at = Column(DateTime, server_default=func.now(), nullable=False)
@@ -0,0 +1,13 @@
+from sqlalchemy import Column, BigInteger, String, DateTime
+from sqlalchemy.sql import func
+from app.database.database import Base
+
+class SuppressedAddress(Base):
+    """Model for addresses emails must not be sent to (hard bounces, complaints, manual entries)"""
+    __tablename__ = "suppressed_addresses"
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    address_hash = Column(String(64), unique=True, nullable=False)  # sha256 of the lower-cased address
+    reason = Column(String(20), nullable=False)                     # bounce, complaint or manual
+    message_id = Column(String(100), nullable=True)                 # SES message that triggered it
+    created_at = Column(DateTime, server_default=func.now(), nullable=False)
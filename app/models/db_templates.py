@@ -0,0 +1,21 @@
+from sqlalchemy import Column, BigInteger, Integer, String, Text, DateTime, UniqueConstraint
+from sqlalchemy.sql import func
+from app.database.database import Base
+
+class EmailTemplate(Base):
+    """Model for stored Jinja2 email templates, per application"""
+    __tablename__ = "email_templates"
+    __table_args__ = (
+        UniqueConstraint("app_id", "template_id", name="uq_email_templates_app_id_template_id"),
+    )
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    app_id = Column(Integer, nullable=False)
+    template_id = Column(String(100), nullable=False)  # caller-chosen name, unique per application
+    version = Column(Integer, nullable=False, default=1)  # bumped on every change, kept across delete/recreate
+    subject = Column(Text, nullable=False)
+    body_text = Column(Text, nullable=False)
+    body_html = Column(Text, nullable=True)
+    created_at = Column(DateTime, server_default=func.now(), nullable=False)
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now(), nullable=False)
+    deleted_at = Column(DateTime, nullable=True)  # set instead of deleting the row
@@ -1,10 +1,13 @@
-from pydantic import BaseModel, EmailStr
-from typing import List, Optional
+import json
+from pydantic import BaseModel, EmailStr, Field, field_validator, model_validator
+from typing import Any, Dict, List, Optional
+from datetime import datetime
 
 class EmailRecipient(BaseModel):
     """Model for email recipients with name and email"""
     email: EmailStr
     name: Optional[str] = None
+    template_data: Optional[Dict[str, Any]] = None  # per-recipient template variables (batch template mode)
 
 class EmailContent(BaseModel):
     """Model for email content with subject and body"""
@@ -12,6 +15,12 @@ class EmailContent(BaseModel):
     body_text: str
     body_html: Optional[str] = None
 
+class AttachmentReference(BaseModel):
+    """Model for an uploaded attachment referenced by its id (the sha256 of its content)"""
+    attachment_id: str = Field(..., pattern=r"^[0-9a-f]{64}$")
+    filename: Optional[str] = Field(None, max_length=255)  # overrides the uploaded filename
+    content_type: Optional[str] = Field(None, max_length=100)
+
 class EmailRequest(BaseModel):
     """Model for email request with sender, recipients and content"""
     sender: EmailStr
@@ -19,15 +28,146 @@ class EmailRequest(BaseModel):
     recipients: List[EmailRecipient]
     cc: Optional[List[EmailRecipient]] = None
     bcc: Optional[List[EmailRecipient]] = None
-    content: EmailContent
+    content: Optional[EmailContent] = None
+    template_id: Optional[str] = Field(None, max_length=100)  # stored template rendered instead of content
+    template_data: Optional[Dict[str, Any]] = None
+    attachments: Optional[List[AttachmentReference]] = Field(None, max_length=10)  # sent as raw MIME
     reply_to: Optional[List[EmailStr]] = None
     app_id: int
 
+    @model_validator(mode="after")
+    def check_content(self):
+        if (self.content is None) == (self.template_id is None):
+            raise ValueError("Provide either content or template_id")
+        return self
+
 class EmailResponse(BaseModel):
     """Model for email response with message ID and status"""
     message_id: str
     status: str
 
+class EmailQueuedResponse(BaseModel):
+    """Model for the 202 response of a queued email"""
+    id: int
+    status: str
+
+class EmailTemplateRequest(BaseModel):
+    """Model for the shared part of a batch sent to many recipients"""
+    sender: EmailStr
+    sender_name: Optional[str] = None
+    content: Optional[EmailContent] = None
+    template_id: Optional[str] = Field(None, max_length=100)
+    template_data: Optional[Dict[str, Any]] = None  # shared variables, overridden per recipient
+    attachments: Optional[List[AttachmentReference]] = Field(None, max_length=10)
+    reply_to: Optional[List[EmailStr]] = None
+    app_id: int
+
+    @model_validator(mode="after")
+    def check_content(self):
+        if (self.content is None) == (self.template_id is None):
+            raise ValueError("Provide either content or template_id")
+        return self
+
+class BatchEmailRequest(BaseModel):
+    """Model for batch email requests: explicit items, or one template sent to many recipients"""
+    items: Optional[List[EmailRequest]] = None
+    template: Optional[EmailTemplateRequest] = None
+    recipients: Optional[List[EmailRecipient]] = None
+    bulk: bool = False  # template.template_id + recipients only: personalised by SES, 50 per API call
+
+    def expand(self) -> List[EmailRequest]:
+        """Return the individual email requests making up this batch"""
+        if self.items:
+            return list(self.items)
+        if self.template and self.recipients:
+            shared = self.template.model_dump(exclude={"template_data"})
+            if not self.template.template_id:
+                return [EmailRequest(**shared, recipients=[recipient]) for recipient in self.recipients]
+            return [
+                EmailRequest(
+                    **shared,
+                    recipients=[recipient],
+                    template_data={**(self.template.template_data or {}), **(recipient.template_data or {})}
+                )
+                for recipient in self.recipients
+            ]
+        return []
+
+class BatchEmailItemResult(BaseModel):
+    """Model for the outcome of one item of a batch"""
+    index: int
+    message_id: Optional[str] = None
+    status: str
+    error: Optional[str] = None
+
+class BatchEmailResponse(BaseModel):
+    """Model for batch email response with per-item results"""
+    total: int
+    sent: int
+    failed: int
+    results: List[BatchEmailItemResult]
+
+class AttachmentResponse(BaseModel):
+    """Model for a stored attachment"""
+    attachment_id: str
+    filename: str
+    content_type: str
+    size: int
+
+class TemplateRequest(BaseModel):
+    """Model for creating or replacing a stored Jinja2 email template"""
+    subject: str = Field(..., max_length=1000)
+    body_text: str
+    body_html: Optional[str] = None
+
+class TemplateResponse(BaseModel):
+    """Model for a stored email template"""
+    template_id: str
+    version: int
+    subject: Optional[str] = None
+    body_text: Optional[str] = None
+    body_html: Optional[str] = None
+    updated_at: Optional[datetime] = None
+
+class EmailLogPage(BaseModel):
+    """Model for one page of the email log listing"""
+    items: List[Dict[str, Any]]
+    next_cursor: Optional[str] = None
+
+class RecipientLookupRequest(BaseModel):
+    """Model for looking up the delivery history of one address"""
+    address: EmailStr
+    limit: int = Field(100, ge=1, le=1000)
+
+class RecipientDelivery(BaseModel):
+    """Model for the delivery status of one address on one email"""
+    email_log_id: int
+    message_id: Optional[str] = None
+    role: str
+    status: str
+    subject: Optional[str] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+class RecipientLookupResponse(BaseModel):
+    """Model for the delivery history of one address"""
+    address_hash: str
+    deliveries: List[RecipientDelivery]
+
+class SuppressionRequest(BaseModel):
+    """Model for adding, removing or checking suppressed addresses"""
+    addresses: List[EmailStr] = Field(..., min_length=1, max_length=1000)
+    reason: Optional[str] = Field(None, max_length=20)
+
+class SuppressionResponse(BaseModel):
+    """Model for the outcome of a suppression list change"""
+    requested: int
+    changed: int
+
+class SuppressionCheckResponse(BaseModel):
+    """Model for the addresses found on the suppression list"""
+    suppressed: List[str]
+
 class ErrorResponse(BaseModel):
     """Model for error responses"""
     detail: str
@@ -77,9 +217,25 @@ class SNSPayload(BaseModel):
     Type: str
     MessageId: str
     TopicArn: str | None = None
-    Message: SESMessage
+    Subject: str | None = None
+    Message: SESMessage | None = None
     Timestamp: str | None = None
     SubscribeURL: str | None = None
     UnsubscribeURL: str | None = None
+    Token: str | None = None
+    SignatureVersion: str | None = None
+    Signature: str | None = None
+    SigningCertURL: str | None = None
+
+    @field_validator("Message", mode="before")
+    @classmethod
+    def parse_message(cls, value):
+        # SNS sends the SES event as a JSON string; subscription messages carry plain text
+        if isinstance(value, str):
+            try:
+                return json.loads(value)
+            except ValueError:
+                return None
+        return value
     
     
@@ -0,0 +1,80 @@
+from app.database.database import commit_if_needed
+
+ATTACHMENT_COLUMNS = ("sha256", "filename", "content_type", "size", "created_at")
+
+
+class AttachmentRepository:
+    """Repository for email_attachments: per-application metadata of uploaded attachments.
+
+    The content itself is stored once, addressed by its sha256, in attachment_chunks
+    (with an attachment_contents row once complete); an email_attachments row only
+    grants an application the right to reference that content.
+    """
+
+    @staticmethod
+    async def save(db, app_id: int, sha256: str, filename: str, content_type: str, size: int):
+        async with db.cursor() as cursor:
+            await cursor.execute(
+                """
+                INSERT INTO email_attachments (app_id, sha256, filename, content_type, size)
+                VALUES (%s, %s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE filename = VALUES(filename), content_type = VALUES(content_type)
+                """,
+                (app_id, sha256, filename, content_type, size)
+            )
+            await commit_if_needed(db)
+
+    @staticmethod
+    async def get_many(db, app_id: int, hashes: list) -> dict:
+        """{sha256: metadata dict} for the given hashes uploaded by the application"""
+        if not hashes:
+            return {}
+        async with db.cursor() as cursor:
+            await cursor.execute(
+                f"""
+                SELECT {', '.join(ATTACHMENT_COLUMNS)} FROM email_attachments
+                WHERE app_id = %s AND sha256 IN ({', '.join(['%s'] * len(hashes))})
+                """,
+                [app_id] + list(hashes)
+            )
+            rows = await cursor.fetchall()
+            await commit_if_needed(db)
+        return {row[0]: dict(zip(ATTACHMENT_COLUMNS, row)) for row in rows}
+
+    @staticmethod
+    async def get_chunk_count(db, sha256: str):
+        """Number of stored chunks of complete content, or None if it is not stored"""
+        async with db.cursor() as cursor:
+            await cursor.execute("SELECT chunk_count FROM attachment_contents WHERE sha256 = %s", (sha256,))
+            row = await cursor.fetchone()
+            await commit_if_needed(db)
+        return row[0] if row else None
+
+    @staticmethod
+    async def save_chunk(db, sha256: str, seq: int, data: bytes):
+        async with db.cursor() as cursor:
+            await cursor.execute(
+                "INSERT IGNORE INTO attachment_chunks (sha256, seq, data) VALUES (%s, %s, %s)",
+                (sha256, seq, data)
+            )
+            await commit_if_needed(db)
+
+    @staticmethod
+    async def complete_content(db, sha256: str, size: int, chunk_count: int):
+        """Mark content as fully stored, after all of its chunks were saved"""
+        async with db.cursor() as cursor:
+            await cursor.execute(
+                "INSERT IGNORE INTO attachment_contents (sha256, size, chunk_count) VALUES (%s, %s, %s)",
+                (sha256, size, chunk_count)
+            )
+            await commit_if_needed(db)
+
+    @staticmethod
+    async def get_chunk(db, sha256: str, seq: int):
+        async with db.cursor() as cursor:
+            await cursor.execute(
+                "SELECT data FROM attachment_chunks WHERE sha256 = %s AND seq = %s", (sha256, seq)
+            )
+            row = await cursor.fetchone()
+            await commit_if_needed(db)
+        return bytes(row[0]) if row else None
@@ -36,18 +36,26 @@
 
 
 import json
+import logging
+import aiomysql
 from sqlalchemy.orm import Session
 from sqlalchemy import func, case
 from datetime import datetime, timedelta
+from app.database.database import transaction
 from app.models.db_emaillog import EmailLog
 from app.models.email_models import EmailRequest
+from app.repositories.metrics_repositories import MetricsRepository
+from app.repositories.recipient_repositories import LIFECYCLE_STATUSES, RecipientRepository
+from app.repositories.suppression_repositories import SuppressionRepository
+
+logger = logging.getLogger(__name__)
 
 class EmailRepository:
     """Repository for email log operations"""
     
     @staticmethod
-    async def create_email_log(db: Session, email_request: EmailRequest, message_id: str = None, status: str = "Pending", is_success: bool = True, error_message: str = None):
-        """Create a new email log entry"""
+    async def create_email_log(db: Session, email_request: EmailRequest, message_id: str = None, status: str = "Pending", is_success: bool = True, error_message: str = None, suppressed: set = None):
+        """Create a new email log entry and return its row id (suppressed: address hashes not sent to)"""
         
         # Convert recipients, cc, and bcc to JSON strings
         recipients_json = json.dumps([{"email": r.email, "name": r.name} for r in email_request.recipients])
@@ -60,25 +68,10 @@ class EmailRepository:
         if email_request.bcc:
             bcc_json = json.dumps([{"email": r.email, "name": r.name} for r in email_request.bcc])
         
-        # Create email log
-        email_log = EmailLog(
-            sender_email=email_request.sender,
-            sender_name=email_request.sender_name,
-            recipients=recipients_json,
-            cc=cc_json,
-            bcc=bcc_json,
-            subject=email_request.content.subject,
-            message_id=message_id,
-            status=status,
-            is_success=is_success,
-            error_message=error_message
-        )
-        
-        # Add to database
-        # db.add(email_log)
-        # db.commit()
-        # db.refresh(email_log)
-        async with db.cursor() as cursor:
+        deltas = MetricsRepository.new_deltas()
+        MetricsRepository.add_insert(deltas, email_request.app_id, is_success, status)
+
+        async with transaction(db), db.cursor() as cursor:
             await cursor.execute(
                 """
                 INSERT INTO email_logs (
@@ -99,9 +92,224 @@ class EmailRepository:
                     error_message, email_request.app_id 
                 )
             )
+            log_id = cursor.lastrowid
+            await RecipientRepository.insert_recipients(
+                cursor, RecipientRepository.recipient_rows(email_request, log_id, message_id, status, suppressed)
+            )
+        await MetricsRepository.record(db, deltas)
+        return log_id
+
+    @staticmethod
+    async def create_email_logs(db, entries: list):
+        """
+        Create many email log entries with a single multi-row INSERT.
+        Each entry is a dict with email_request, message_id, status, is_success and error_message,
+        plus optionally suppressed (address hashes dropped before sending).
+        """
+        if not entries:
+            return 0
+
+        rows = []
+        deltas = MetricsRepository.new_deltas()
+        for entry in entries:
+            email_request = entry["email_request"]
+            MetricsRepository.add_insert(deltas, email_request.app_id, entry.get("is_success", True), entry["status"])
+            rows.append((
+                email_request.sender,
+                email_request.sender_name,
+                json.dumps([{"email": r.email, "name": r.name} for r in email_request.recipients]),
+                json.dumps([{"email": r.email, "name": r.name} for r in email_request.cc]) if email_request.cc else None,
+                json.dumps([{"email": r.email, "name": r.name} for r in email_request.bcc]) if email_request.bcc else None,
+                email_request.content.subject,
+                entry.get("message_id"),
+                entry["status"],
+                entry.get("is_success", True),
+                entry.get("error_message"),
+                email_request.app_id
+            ))
+
+        # aiomysql rewrites executemany() on an INSERT ... VALUES into multi-row INSERTs
+        async with transaction(db), db.cursor() as cursor:
+            await cursor.executemany(
+                """
+                INSERT INTO email_logs (
+                    sender_email, sender_name, recipients, cc, bcc,
+                    subject, message_id, status, is_success, error_message,app_id
+                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s,%s)
+                """,
+                rows
+            )
+            inserted = cursor.rowcount
+
+            # Link recipients through the (unique) message_id; failed items never reached anyone
+            sent = {entry["message_id"]: entry for entry in entries if entry.get("message_id")}
+            if sent:
+                await cursor.execute(
+                    f"SELECT id, message_id FROM email_logs WHERE message_id IN ({', '.join(['%s'] * len(sent))})",
+                    list(sent)
+                )
+                recipient_rows = []
+                for log_id, message_id in await cursor.fetchall():
+                    entry = sent[message_id]
+                    recipient_rows.extend(
+                        RecipientRepository.recipient_rows(
+                            entry["email_request"], log_id, message_id, entry["status"], entry.get("suppressed")
+                        )
+                    )
+                await RecipientRepository.insert_recipients(cursor, recipient_rows)
+        await MetricsRepository.record(db, deltas)
+        return inserted
+    
+    @staticmethod
+    async def enqueue_email(db, email_request: EmailRequest) -> int:
+        """Write an email to the outbox (email_logs with status "Queued") and return its row id"""
+        recipients_json = json.dumps([{"email": r.email, "name": r.name} for r in email_request.recipients])
+        cc_json = json.dumps([{"email": r.email, "name": r.name} for r in email_request.cc]) if email_request.cc else None
+        bcc_json = json.dumps([{"email": r.email, "name": r.name} for r in email_request.bcc]) if email_request.bcc else None
+
+        deltas = MetricsRepository.new_deltas()
+        MetricsRepository.add_insert(deltas, email_request.app_id, True, "Queued")
+
+        async with transaction(db), db.cursor() as cursor:
+            await cursor.execute(
+                """
+                INSERT INTO email_logs (
+                    sender_email, sender_name, recipients, cc, bcc,
+                    subject, status, is_success, app_id, payload, attempts
+                ) VALUES (%s, %s, %s, %s, %s, %s, 'Queued', %s, %s, %s, 0)
+                """,
+                (
+                    email_request.sender,
+                    email_request.sender_name,
+                    recipients_json,
+                    cc_json,
+                    bcc_json,
+                    email_request.content.subject,
+                    True,
+                    email_request.app_id,
+                    email_request.model_dump_json()
+                )
+            )
+            log_id = cursor.lastrowid
+            await RecipientRepository.insert_recipients(
+                cursor, RecipientRepository.recipient_rows(email_request, log_id, status="Queued")
+            )
+        await MetricsRepository.record(db, deltas)
+        return log_id
+
+    @staticmethod
+    async def claim_queued_emails(db, limit: int, claim_timeout: int):
+        """
+        Claim up to `limit` queued emails for this worker.
+        Rows locked by other workers are skipped (FOR UPDATE SKIP LOCKED), and rows
+        claimed by a worker that died more than `claim_timeout` seconds ago are reclaimed.
+        Queued rows whose next_attempt_at lies in the future are left for later.
+        Returns a list of (id, payload, attempts) tuples.
+        """
+        await db.begin()
+        try:
+            async with db.cursor() as cursor:
+                await cursor.execute(
+                    """
+                    SELECT id, payload, attempts FROM email_logs
+                    WHERE payload IS NOT NULL
+                      AND ((status = 'Queued' AND (next_attempt_at IS NULL OR next_attempt_at <= NOW()))
+                           OR (status = 'Sending' AND claimed_at < NOW() - INTERVAL %s SECOND))
+                    ORDER BY id
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                    """,
+                    (claim_timeout, limit)
+                )
+                rows = await cursor.fetchall()
+
+                if rows:
+                    placeholders = ", ".join(["%s"] * len(rows))
+                    await cursor.execute(
+                        f"""
+                        UPDATE email_logs
+                        SET status = 'Sending', claimed_at = NOW(), attempts = attempts + 1
+                        WHERE id IN ({placeholders})
+                        """,
+                        [row[0] for row in rows]
+                    )
             await db.commit()
-        
-        return email_log
+        except Exception:
+            await db.rollback()
+            raise
+
+        return [(row[0], row[1], (row[2] or 0) + 1) for row in rows]
+
+    @staticmethod
+    async def update_email_log(db, log_id: int, status: str, message_id: str = None,
+                               is_success: bool = True, error_message: str = None):
+        """Update the lifecycle fields of one email log row in place"""
+        return await EmailRepository.update_email_logs(db, [{
+            "id": log_id,
+            "status": status,
+            "message_id": message_id,
+            "is_success": is_success,
+            "error_message": error_message,
+        }])
+
+    @staticmethod
+    async def update_email_logs(db, updates: list):
+        """
+        Update the lifecycle fields (status, message_id, is_success, error_message) of many
+        email log rows with a single UPDATE ... CASE statement. Clears outbox claims.
+        Each update is a dict with id, status, message_id, is_success and error_message.
+        Outbox outcomes may add retry_in (seconds before a requeued row may be claimed
+        again) and deferred (the attempt did not reach SES and is not counted).
+        """
+        if not updates:
+            return 0
+
+        async with transaction(db), db.cursor() as cursor:
+            current = await MetricsRepository.lock_log_rows(cursor, "id", [update["id"] for update in updates])
+            # Rows SES events already moved on (Delivered, Bounced, ...) keep their status
+            updates = [
+                update for update in updates
+                if update["id"] not in current or current[update["id"]][2] in LIFECYCLE_STATUSES
+            ]
+            deltas = MetricsRepository.new_deltas()
+            for update in updates:
+                if update["id"] in current:
+                    MetricsRepository.add_change(deltas, current[update["id"]], update["status"], update.get("is_success"))
+
+            affected = 0
+            if updates:
+                ids = [update["id"] for update in updates]
+                assignments = []
+                params = []
+                for column in ("status", "message_id", "is_success", "error_message"):
+                    assignments.append(f"{column} = CASE id {' '.join(['WHEN %s THEN %s'] * len(updates))} END")
+                    for update in updates:
+                        params.extend((update["id"], update.get(column)))
+                if any("retry_in" in update or "deferred" in update for update in updates):
+                    # NOW() + INTERVAL NULL SECOND is NULL: rows without retry_in become claimable at once
+                    assignments.append(
+                        f"next_attempt_at = NOW() + INTERVAL (CASE id {' '.join(['WHEN %s THEN %s'] * len(updates))} END) SECOND"
+                    )
+                    for update in updates:
+                        params.extend((update["id"], update.get("retry_in")))
+                    assignments.append(
+                        f"attempts = attempts - CASE id {' '.join(['WHEN %s THEN %s'] * len(updates))} END"
+                    )
+                    for update in updates:
+                        params.extend((update["id"], 1 if update.get("deferred") else 0))
+                params.extend(ids)
+                await cursor.execute(
+                    f"""
+                    UPDATE email_logs
+                    SET {', '.join(assignments)}, claimed_at = NULL
+                    WHERE id IN ({', '.join(['%s'] * len(ids))})
+                    """,
+                    params
+                )
+                affected = cursor.rowcount
+                await RecipientRepository.sync_lifecycle(cursor, updates)
+        await MetricsRepository.record(db, deltas)
+        return affected
     
     # @staticmethod
     # def get_email_logs(db: Session, skip: int = 0, limit: int = 100):
@@ -177,18 +385,103 @@ class EmailRepository:
     
     @staticmethod
     async def get_email_logs(db, skip: int = 0, limit: int = 100):
-        """Get all email logs with pagination"""
+        """Get all email logs with offset pagination (prefer list_email_logs for deep paging)"""
         async with db.cursor() as cursor:
             await cursor.execute(
                 """
                 SELECT * FROM email_logs 
-                ORDER BY sent_at DESC 
-                OFFSET %s LIMIT %s
+                ORDER BY sent_at DESC, id DESC
+                LIMIT %s OFFSET %s
                 """,
-                (skip, limit)
+                (limit, skip)
             )
             return await cursor.fetchall()
+
+    @staticmethod
+    def _log_filters(app_id: int = None, status: str = None, sent_from: datetime = None, sent_to: datetime = None):
+        """WHERE clauses and parameters shared by the log listing and export"""
+        clauses = []
+        params = []
+        if app_id is not None:
+            clauses.append("app_id = %s")
+            params.append(app_id)
+        if status:
+            clauses.append("status = %s")
+            params.append(status)
+        if sent_from is not None:
+            clauses.append("sent_at >= %s")
+            params.append(sent_from)
+        if sent_to is not None:
+            clauses.append("sent_at < %s")
+            params.append(sent_to)
+        return clauses, params
+
+    @staticmethod
+    def log_columns(columns=None) -> list:
+        """Requested columns (validated), defaulting to everything but the outbox payload"""
+        if not columns:
+            return [column for column in EmailLog.__table__.columns.keys() if column != "payload"]
+        EmailRepository._select_columns(columns)
+        return list(dict.fromkeys(columns))
+
+    @staticmethod
+    async def list_email_logs(db, limit: int = 50, after: tuple = None, app_id: int = None, status: str = None,
+                              sent_from: datetime = None, sent_to: datetime = None, columns=None):
+        """
+        Keyset-paginated email logs, newest first, ordered by (sent_at, id).
+        `after` is the (sent_at, id) of the last row of the previous page, so every page
+        is an index range scan no matter how deep it is. Returns (rows as dicts, has_more).
+        """
+        columns = EmailRepository.log_columns(columns)
+        # The cursor needs sent_at and id even when the caller did not ask for them
+        selected = columns + [column for column in ("sent_at", "id") if column not in columns]
+
+        clauses, params = EmailRepository._log_filters(app_id, status, sent_from, sent_to)
+        if after is not None:
+            clauses.append("(sent_at < %s OR (sent_at = %s AND id < %s))")
+            params.extend((after[0], after[0], after[1]))
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+
+        async with db.cursor() as cursor:
+            await cursor.execute(
+                f"""
+                SELECT {', '.join(selected)} FROM email_logs
+                {where}
+                ORDER BY sent_at DESC, id DESC
+                LIMIT %s
+                """,
+                params + [limit + 1]
+            )
+            rows = await cursor.fetchall()
+
+        has_more = len(rows) > limit
+        return [dict(zip(selected, row)) for row in rows[:limit]], has_more
     
+    @staticmethod
+    async def stream_email_logs(db, columns: list, fetch_size: int, app_id: int = None, status: str = None,
+                                sent_from: datetime = None, sent_to: datetime = None):
+        """
+        Stream email logs (oldest first) through an unbuffered server-side cursor.
+        Yields lists of up to fetch_size row tuples in the order of `columns` (see
+        log_columns), so memory stays constant however many rows match. If the consumer
+        stops early the caller must close the connection rather than reuse it, since
+        the rest of the result set is still pending on it.
+        """
+        clauses, params = EmailRepository._log_filters(app_id, status, sent_from, sent_to)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+
+        cursor = await db.cursor(aiomysql.SSCursor)
+        await cursor.execute(
+            f"SELECT {', '.join(columns)} FROM email_logs {where} ORDER BY sent_at, id",
+            params
+        )
+        while True:
+            rows = await cursor.fetchmany(fetch_size)
+            if not rows:
+                break
+            yield rows
+        await cursor.close()
+
     @staticmethod
     async def get_email_log_by_id(db, email_log_id: int):
         """Get a specific email log by ID"""
@@ -200,73 +493,142 @@ class EmailRepository:
             return await cursor.fetchone()
     
     @staticmethod
-    async def update_status(db, message_id: str, status: str, is_success: bool):
-        """Update email status"""
+    def _select_columns(columns) -> str:
+        """Validate requested column names against the email_logs model"""
+        allowed = EmailLog.__table__.columns.keys()
+        unknown = [column for column in columns if column not in allowed]
+        if unknown:
+            raise ValueError(f"Unknown email_logs columns: {', '.join(unknown)}")
+        return ", ".join(columns)
+
+    @staticmethod
+    async def _update_by_message_id(db, message_id: str, statuses=None, opens=None, clicks=None, columns=None):
+        affected = await EmailRepository.apply_event_batch(db, statuses or {}, opens or {}, clicks or {})
+        if not columns:
+            return affected
+
+        # Opt-in read-back of just the requested columns
         async with db.cursor() as cursor:
             await cursor.execute(
-                """
-                UPDATE email_logs 
-                SET status = %s, is_success = %s 
-                WHERE message_id = %s
-                """,
-                (status, is_success, message_id)
-            )
-            await db.commit()
-            
-            # Return updated record
-            await cursor.execute(
-                "SELECT * FROM email_logs WHERE message_id = %s",
+                f"SELECT {EmailRepository._select_columns(columns)} FROM email_logs WHERE message_id = %s",
                 (message_id,)
             )
             return await cursor.fetchone()
 
     @staticmethod
-    async def increment_open_count(db, message_id: str):
-        """Increment email open count"""
-        async with db.cursor() as cursor:
-            await cursor.execute(
-                """
-                UPDATE email_logs 
-                SET opens = COALESCE(opens, 0) + 1 
-                WHERE message_id = %s
-                """,
-                (message_id,)
-            )
-            await db.commit()
-            
-            # Return updated record
-            await cursor.execute(
-                "SELECT * FROM email_logs WHERE message_id = %s",
-                (message_id,)
+    async def update_status(db, message_id: str, status: str, is_success: bool, columns=None):
+        """Update email status; returns the affected row count, or the requested columns if given"""
+        return await EmailRepository._update_by_message_id(
+            db, message_id, statuses={message_id: (status, is_success)}, columns=columns
+        )
+
+    @staticmethod
+    async def increment_open_count(db, message_id: str, columns=None):
+        """Increment email open count; returns the affected row count, or the requested columns if given"""
+        return await EmailRepository._update_by_message_id(db, message_id, opens={message_id: 1}, columns=columns)
+
+    @staticmethod
+    async def increment_click_count(db, message_id: str, columns=None):
+        """Increment email click count; returns the affected row count, or the requested columns if given"""
+        return await EmailRepository._update_by_message_id(db, message_id, clicks={message_id: 1}, columns=columns)
+
+    @staticmethod
+    async def apply_event_batch(db, statuses: dict, opens: dict, clicks: dict, recipient_statuses: dict = None,
+                                suppressions: list = None) -> int:
+        """
+        Apply a coalesced batch of SES events in one transaction:
+        - statuses: {message_id: (status, is_success)} applied with one UPDATE ... CASE
+        - opens/clicks: {message_id: count} added with one UPDATE ... CASE
+        - recipient_statuses: {(message_id, address_hash): status} for email_recipients
+        - suppressions: [(address_hash, reason, message_id)] added to suppressed_addresses
+        The daily metrics rollup is adjusted in the same transaction.
+        Returns the row count affected by the email_logs UPDATE statements.
+        """
+        if not statuses and not opens and not clicks and not recipient_statuses and not suppressions:
+            return 0
+        async with transaction(db), db.cursor() as cursor:
+            return await EmailRepository.apply_event_rows(
+                cursor, statuses, opens, clicks, recipient_statuses, suppressions
             )
-            return await cursor.fetchone()
 
     @staticmethod
-    async def increment_click_count(db, message_id: str):
-        """Increment email click count"""
-        async with db.cursor() as cursor:
+    async def find_message_ids(cursor, message_ids) -> set:
+        """The given message ids that some email_logs row already carries"""
+        message_ids = list(message_ids)
+        if not message_ids:
+            return set()
+        await cursor.execute(
+            f"SELECT message_id FROM email_logs WHERE message_id IN ({', '.join(['%s'] * len(message_ids))})",
+            message_ids
+        )
+        return {row[0] for row in await cursor.fetchall()}
+
+    @staticmethod
+    async def apply_event_rows(cursor, statuses: dict, opens: dict, clicks: dict, recipient_statuses: dict = None,
+                               suppressions: list = None) -> int:
+        """apply_event_batch on the cursor of a transaction the caller manages"""
+        recipient_statuses = recipient_statuses or {}
+        suppressions = suppressions or []
+        message_ids = list(set(statuses) | set(opens) | set(clicks))
+
+        affected = 0
+        current = await MetricsRepository.lock_log_rows(cursor, "message_id", message_ids)
+        deltas = MetricsRepository.new_deltas()
+        for message_id, row in current.items():
+            status, is_success = statuses.get(message_id, (None, None))
+            MetricsRepository.add_change(
+                deltas, row, status, is_success, opens.get(message_id, 0), clicks.get(message_id, 0)
+            )
+
+        if opens or clicks:
+            assignments = []
+            params = []
+            for column, counts in (("opens", opens), ("clicks", clicks)):
+                if counts:
+                    whens = " ".join(["WHEN %s THEN %s"] * len(counts))
+                    assignments.append(f"{column} = COALESCE({column}, 0) + CASE message_id {whens} ELSE 0 END")
+                    for message_id, count in counts.items():
+                        params.extend((message_id, count))
+            counted_ids = list(set(opens) | set(clicks))
+            params.extend(counted_ids)
             await cursor.execute(
-                """
-                UPDATE email_logs 
-                SET clicks = COALESCE(clicks, 0) + 1 
-                WHERE message_id = %s
+                f"""
+                UPDATE email_logs
+                SET {', '.join(assignments)}
+                WHERE message_id IN ({', '.join(['%s'] * len(counted_ids))})
                 """,
-                (message_id,)
+                params
             )
-            await db.commit()
-            
-            # Return updated record
+            affected += cursor.rowcount
+
+        if statuses:
+            status_params = []
+            success_params = []
+            for message_id, (status, is_success) in statuses.items():
+                status_params.extend((message_id, status))
+                success_params.extend((message_id, is_success))
+            whens = " ".join(["WHEN %s THEN %s"] * len(statuses))
             await cursor.execute(
-                "SELECT * FROM email_logs WHERE message_id = %s",
-                (message_id,)
+                f"""
+                UPDATE email_logs
+                SET status = CASE message_id {whens} ELSE status END,
+                    is_success = CASE message_id {whens} ELSE is_success END
+                WHERE message_id IN ({', '.join(['%s'] * len(statuses))})
+                """,
+                status_params + success_params + list(statuses)
             )
-            return await cursor.fetchone()
+            affected += cursor.rowcount
+
+        await RecipientRepository.apply_event_statuses(cursor, recipient_statuses)
+        await SuppressionRepository.add_rows(cursor, suppressions)
+        await MetricsRepository.apply_deltas(cursor, deltas)
+        return affected
     
     @staticmethod
     async def get_email_metrics(db, months: int = 3):
         """Get email metrics using raw SQL (MySQL compatible)"""
         start_date = datetime.utcnow() - timedelta(days=30 * months)
-        print(f"Calculating metrics since: {start_date}")
+        logger.debug(f"Calculating metrics since: {start_date}")
         async with db.cursor() as cursor:
             
             await cursor.execute(
@@ -289,7 +651,7 @@ class EmailRepository:
             
             results = await cursor.fetchall()
             
-            print("Raw metrics results:",results)
+            logger.debug(f"Raw metrics results: {len(results)} days")
             
             return [
                 {
@@ -0,0 +1,89 @@
+import json
+
+from app.database.database import commit_if_needed
+
+
+class IdempotencyRepository:
+    """Repository for idempotency_keys: the outcome of sends made with an Idempotency-Key header.
+
+    A row is claimed (response NULL) before the send and completed with the response
+    afterwards. expires_at is short while the send is in flight, so a claim left behind
+    by a crashed process can be taken over, and IDEMPOTENCY_TTL_SECONDS once completed.
+    """
+
+    @staticmethod
+    async def claim(db, app_id: int, key: str, request_hash: str, lease_seconds: int):
+        """
+        Try to take ownership of a key. Returns None when claimed, otherwise the existing
+        (request_hash, response) where response is None while the other send is in flight.
+        """
+        async with db.cursor() as cursor:
+            await cursor.execute(
+                """
+                INSERT IGNORE INTO idempotency_keys (app_id, idempotency_key, request_hash, expires_at)
+                VALUES (%s, %s, %s, NOW() + INTERVAL %s SECOND)
+                """,
+                (app_id, key, request_hash, lease_seconds)
+            )
+            claimed = cursor.rowcount == 1
+            if not claimed:
+                # Expired rows (finished long ago, or abandoned mid-send) are taken over in place
+                await cursor.execute(
+                    """
+                    UPDATE idempotency_keys
+                    SET request_hash = %s, response = NULL, expires_at = NOW() + INTERVAL %s SECOND
+                    WHERE app_id = %s AND idempotency_key = %s AND expires_at < NOW()
+                    """,
+                    (request_hash, lease_seconds, app_id, key)
+                )
+                claimed = cursor.rowcount == 1
+            if claimed:
+                await commit_if_needed(db)
+                return None
+
+            await cursor.execute(
+                "SELECT request_hash, response FROM idempotency_keys WHERE app_id = %s AND idempotency_key = %s",
+                (app_id, key)
+            )
+            row = await cursor.fetchone()
+            await commit_if_needed(db)
+
+        if row is None:
+            # Purged between the two statements: report it as in flight, the client retries
+            return request_hash, None
+        return row[0], json.loads(row[1]) if row[1] is not None else None
+
+    @staticmethod
+    async def complete(db, app_id: int, key: str, response: dict, ttl_seconds: int):
+        """Store the response of a finished send and keep it for ttl_seconds"""
+        async with db.cursor() as cursor:
+            await cursor.execute(
+                """
+                UPDATE idempotency_keys
+                SET response = %s, expires_at = NOW() + INTERVAL %s SECOND
+                WHERE app_id = %s AND idempotency_key = %s
+                """,
+                (json.dumps(response), ttl_seconds, app_id, key)
+            )
+            await commit_if_needed(db)
+
+    @staticmethod
+    async def release(db, app_id: int, key: str):
+        """Drop an in-flight claim whose send failed, so a retry with the same key can send"""
+        async with db.cursor() as cursor:
+            await cursor.execute(
+                "DELETE FROM idempotency_keys WHERE app_id = %s AND idempotency_key = %s AND response IS NULL",
+                (app_id, key)
+            )
+            await commit_if_needed(db)
+
+    @staticmethod
+    async def purge_expired(db, limit: int) -> int:
+        """Delete up to `limit` expired keys; returns the number deleted"""
+        async with db.cursor() as cursor:
+            await cursor.execute(
+                "DELETE FROM idempotency_keys WHERE expires_at < NOW() ORDER BY expires_at LIMIT %s",
+                (limit,)
+            )
+            await commit_if_needed(db)
+            return cursor.rowcount
@@ -0,0 +1,198 @@
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+
+from app.database.database import transaction
+
+ROLLUP_COLUMNS = ("total", "success", "bounced", "complaints", "opens", "clicks")
+
+# email_logs status values counted by their own rollup column
+STATUS_COLUMNS = {"Bounced": "bounced", "Complaint": "complaints"}
+
+
+class PendingRollup:
+    """Rollup deltas recorded by the email_logs write paths, waiting to be applied in a batch"""
+
+    def __init__(self):
+        self.enabled = False
+        self.deltas = defaultdict(Counter)
+
+    def add(self, deltas):
+        for key, counters in deltas.items():
+            self.deltas[key].update(counters)
+
+    def take(self):
+        deltas, self.deltas = self.deltas, defaultdict(Counter)
+        return deltas
+
+
+# Filled while the metrics rollup writer runs (app.services.metrics_rollup)
+pending_rollup = PendingRollup()
+
+
+class MetricsRepository:
+    """Repository for the email_metrics_daily rollup (one row per app_id and day).
+
+    The email_logs write paths compute deltas inside their transaction (from the
+    rows they lock) and record them once it committed. Every send of an application
+    touches the same rollup row, so the upsert is kept out of the log transactions:
+    while the rollup writer runs, deltas are summed in memory and applied in one
+    short transaction per flush; otherwise each is applied on its own right away.
+    Deltas still pending when a process dies are lost until the next rebuild
+    (python -m app.database.rebuild_metrics). The SES event batch applies its deltas
+    in its own (already batched) transaction. A NULL app_id is stored as 0 (it is
+    part of the key).
+    """
+
+    @staticmethod
+    def new_deltas():
+        """Accumulator of rollup changes: {(app_id, day): Counter(column -> delta)}"""
+        return defaultdict(Counter)
+
+    @staticmethod
+    def add_insert(deltas, app_id, is_success: bool, status: str = None, day=None):
+        """Count a newly inserted email_logs row (day=None means today, the sent_at default)"""
+        counters = deltas[(app_id or 0, day)]
+        counters["total"] += 1
+        counters["success"] += int(bool(is_success))
+        if status in STATUS_COLUMNS:
+            counters[STATUS_COLUMNS[status]] += 1
+
+    @staticmethod
+    def add_change(deltas, row, status: str = None, is_success: bool = None, opens: int = 0, clicks: int = 0):
+        """Count the change of one existing row; row is (app_id, day, old_status, old_is_success)"""
+        app_id, day, old_status, old_success = row
+        counters = deltas[(app_id or 0, day)]
+        if status is not None:
+            counters["success"] += int(bool(is_success)) - int(bool(old_success))
+            for value, column in STATUS_COLUMNS.items():
+                counters[column] += int(status == value) - int(old_status == value)
+        counters["opens"] += opens
+        counters["clicks"] += clicks
+
+    @staticmethod
+    async def lock_log_rows(cursor, key_column: str, keys) -> dict:
+        """
+        Lock email_logs rows by id or message_id (SELECT ... FOR UPDATE) and return
+        {key: (app_id, day, status, is_success)} as they are before the update.
+        """
+        keys = list(keys)
+        if not keys:
+            return {}
+        if key_column not in ("id", "message_id"):
+            raise ValueError(f"Unsupported key column: {key_column}")
+        await cursor.execute(
+            f"""
+            SELECT {key_column}, COALESCE(app_id, 0), DATE(sent_at), status, is_success
+            FROM email_logs
+            WHERE {key_column} IN ({', '.join(['%s'] * len(keys))})
+            FOR UPDATE
+            """,
+            keys
+        )
+        return {row[0]: tuple(row[1:]) for row in await cursor.fetchall()}
+
+    @staticmethod
+    async def apply_deltas(cursor, deltas) -> int:
+        """Add the accumulated deltas to the rollup with one multi-row upsert"""
+        rows = []
+        # Stable key order keeps concurrent upserts from deadlocking on the rollup rows
+        for (app_id, day), counters in sorted(deltas.items(), key=lambda item: (item[0][0], str(item[0][1]))):
+            if any(counters[column] for column in ROLLUP_COLUMNS):
+                rows.append((app_id, day) + tuple(counters[column] for column in ROLLUP_COLUMNS))
+        if not rows:
+            return 0
+
+        await cursor.execute(
+            f"""
+            INSERT INTO email_metrics_daily (app_id, day, {', '.join(ROLLUP_COLUMNS)})
+            VALUES {', '.join(['(%s, COALESCE(%s, CURDATE()), %s, %s, %s, %s, %s, %s)'] * len(rows))}
+            ON DUPLICATE KEY UPDATE
+                {', '.join(f'{column} = {column} + VALUES({column})' for column in ROLLUP_COLUMNS)}
+            """,
+            [value for row in rows for value in row]
+        )
+        return len(rows)
+
+    @staticmethod
+    async def record(db, deltas):
+        """Apply deltas of a committed email_logs change, or queue them for the rollup writer"""
+        if pending_rollup.enabled:
+            pending_rollup.add(deltas)
+            return
+        if not any(counters[column] for counters in deltas.values() for column in ROLLUP_COLUMNS):
+            return
+        async with transaction(db), db.cursor() as cursor:
+            await MetricsRepository.apply_deltas(cursor, deltas)
+
+    @staticmethod
+    async def rebuild_rows(cursor, since=None):
+        """Recompute the rollup from email_logs, for every day or for days >= since"""
+        if since is None:
+            await cursor.execute("DELETE FROM email_metrics_daily")
+            where, params = "", ()
+        else:
+            await cursor.execute("DELETE FROM email_metrics_daily WHERE day >= %s", (since,))
+            where, params = "WHERE sent_at >= %s", (since,)
+
+        await cursor.execute(
+            f"""
+            INSERT INTO email_metrics_daily (app_id, day, {', '.join(ROLLUP_COLUMNS)})
+            SELECT
+                COALESCE(app_id, 0),
+                DATE(sent_at),
+                COUNT(*),
+                SUM(CASE WHEN is_success = 1 THEN 1 ELSE 0 END),
+                SUM(CASE WHEN status = 'Bounced' THEN 1 ELSE 0 END),
+                SUM(CASE WHEN status = 'Complaint' THEN 1 ELSE 0 END),
+                SUM(COALESCE(opens, 0)),
+                SUM(COALESCE(clicks, 0))
+            FROM email_logs
+            {where}
+            GROUP BY COALESCE(app_id, 0), DATE(sent_at)
+            """,
+            params
+        )
+        return cursor.rowcount
+
+    @staticmethod
+    async def rebuild(db, since=None) -> int:
+        """Backfill/rebuild the rollup in one transaction; returns the number of rollup rows written"""
+        async with transaction(db):
+            async with db.cursor() as cursor:
+                return await MetricsRepository.rebuild_rows(cursor, since)
+
+    @staticmethod
+    async def get_daily_metrics(db, months: int = 3, app_id: int = None):
+        """Daily email metrics read from the rollup, for one application or all of them"""
+        start_day = (datetime.utcnow() - timedelta(days=30 * months)).date()
+        where = "day >= %s"
+        params = [start_day]
+        if app_id is not None:
+            where += " AND app_id = %s"
+            params.append(app_id)
+
+        async with db.cursor() as cursor:
+            await cursor.execute(
+                f"""
+                SELECT day, SUM(total), SUM(success), SUM(bounced), SUM(complaints), SUM(opens), SUM(clicks)
+                FROM email_metrics_daily
+                WHERE {where}
+                GROUP BY day
+                ORDER BY day
+                """,
+                params
+            )
+            results = await cursor.fetchall()
+
+        return [
+            {
+                "date": row[0].strftime("%Y-%m-%d") if hasattr(row[0], 'strftime') else str(row[0]),
+                "total": int(row[1] or 0),
+                "success": int(row[2] or 0),
+                "bounced": int(row[3] or 0),
+                "complaints": int(row[4] or 0),
+                "opens": int(row[5] or 0),
+                "clicks": int(row[6] or 0),
+            }
+            for row in results
+        ]
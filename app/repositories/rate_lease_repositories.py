@@ -0,0 +1,30 @@
+from app.database.database import commit_if_needed
+
+
+class RateLeaseRepository:
+    """Repository for the ses_rate_leases table used to share the SES send rate between processes"""
+
+    @staticmethod
+    async def renew_lease(db, worker_id: str, ttl_seconds: int) -> int:
+        """Create or extend this worker's lease, expire dead ones and return the number of live leases"""
+        async with db.cursor() as cursor:
+            await cursor.execute(
+                """
+                INSERT INTO ses_rate_leases (worker_id, expires_at)
+                VALUES (%s, NOW() + INTERVAL %s SECOND)
+                ON DUPLICATE KEY UPDATE expires_at = VALUES(expires_at)
+                """,
+                (worker_id, ttl_seconds)
+            )
+            await cursor.execute("DELETE FROM ses_rate_leases WHERE expires_at < NOW()")
+            await cursor.execute("SELECT COUNT(*) FROM ses_rate_leases")
+            row = await cursor.fetchone()
+            await commit_if_needed(db)
+            return max(1, int(row[0] if row else 1))
+
+    @staticmethod
+    async def release_lease(db, worker_id: str):
+        """Drop this worker's lease so the others pick up its share of the rate"""
+        async with db.cursor() as cursor:
+            await cursor.execute("DELETE FROM ses_rate_leases WHERE worker_id = %s", (worker_id,))
+            await commit_if_needed(db)
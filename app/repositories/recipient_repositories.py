@@ -0,0 +1,136 @@
+import hashlib
+
+# Lifecycle statuses mirrored from email_logs; SES event statuses are never overwritten by them
+LIFECYCLE_STATUSES = ("Queued", "Sending", "Pending", "Sent", "Failed")
+# Event statuses a later Delivery event must not overwrite
+FINAL_EVENT_STATUSES = ("Bounced", "Complaint")
+
+
+class RecipientRepository:
+    """Repository for email_recipients: one row per recipient address of a sent email.
+
+    Addresses are stored as sha256 hashes of the normalised (trimmed, lower-cased)
+    address, so "what happened to address X" is an index lookup without keeping
+    a second plain-text copy of every address. Rows are written on the cursor of
+    the caller's transaction alongside the matching email_logs change.
+    """
+
+    @staticmethod
+    def address_hash(address: str) -> str:
+        return hashlib.sha256(address.strip().lower().encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def recipient_rows(email_request, email_log_id: int, message_id: str = None, status: str = "Sending",
+                       suppressed: set = None) -> list:
+        """
+        email_recipients rows (email_log_id, message_id, app_id, address_hash, role, status) for a
+        request; addresses whose hash is in `suppressed` were dropped before sending.
+        """
+        rows = []
+        for role, recipients in (("to", email_request.recipients), ("cc", email_request.cc), ("bcc", email_request.bcc)):
+            for recipient in recipients or []:
+                address_hash = RecipientRepository.address_hash(recipient.email)
+                rows.append((
+                    email_log_id,
+                    message_id,
+                    email_request.app_id,
+                    address_hash,
+                    role,
+                    "Suppressed" if suppressed and address_hash in suppressed else status,
+                ))
+        return rows
+
+    @staticmethod
+    async def insert_recipients(cursor, rows: list) -> int:
+        """Insert recipient rows with one multi-row INSERT"""
+        if not rows:
+            return 0
+        await cursor.execute(
+            f"""
+            INSERT INTO email_recipients (email_log_id, message_id, app_id, address_hash, role, status)
+            VALUES {', '.join(['(%s, %s, %s, %s, %s, %s)'] * len(rows))}
+            """,
+            [value for row in rows for value in row]
+        )
+        return cursor.rowcount
+
+    @staticmethod
+    async def sync_lifecycle(cursor, updates: list) -> int:
+        """
+        Mirror email_logs lifecycle updates (dicts with id, status, message_id) onto the
+        recipients of those rows; statuses already set by SES events are kept.
+        """
+        if not updates:
+            return 0
+        whens = " ".join(["WHEN %s THEN %s"] * len(updates))
+        params = []
+        for column in ("message_id", "status"):
+            for update in updates:
+                params.extend((update["id"], update.get(column)))
+        ids = [update["id"] for update in updates]
+        await cursor.execute(
+            f"""
+            UPDATE email_recipients
+            SET message_id = COALESCE(CASE email_log_id {whens} END, message_id),
+                status = CASE email_log_id {whens} END
+            WHERE email_log_id IN ({', '.join(['%s'] * len(ids))})
+              AND status IN ({', '.join(['%s'] * len(LIFECYCLE_STATUSES))})
+            """,
+            params + ids + list(LIFECYCLE_STATUSES)
+        )
+        return cursor.rowcount
+
+    @staticmethod
+    async def apply_event_statuses(cursor, recipient_statuses: dict) -> int:
+        """
+        Apply per-recipient SES event statuses: {(message_id, address_hash): status}.
+        One UPDATE per distinct status; Delivery never overwrites a bounce or complaint.
+        """
+        by_status = {}
+        for key, status in recipient_statuses.items():
+            by_status.setdefault(status, []).append(key)
+
+        affected = 0
+        for status, keys in sorted(by_status.items()):
+            guard = ""
+            params = [status] + [value for key in keys for value in key]
+            if status not in FINAL_EVENT_STATUSES:
+                guard = f"AND status NOT IN ({', '.join(['%s'] * len(FINAL_EVENT_STATUSES))})"
+                params.extend(FINAL_EVENT_STATUSES)
+            await cursor.execute(
+                f"""
+                UPDATE email_recipients
+                SET status = %s
+                WHERE (message_id, address_hash) IN ({', '.join(['(%s, %s)'] * len(keys))})
+                {guard}
+                """,
+                params
+            )
+            affected += cursor.rowcount
+        return affected
+
+    @staticmethod
+    async def find_by_address(db, address: str, app_id: int = None, limit: int = 100) -> list:
+        """Delivery history of one address, newest first"""
+        where = "r.address_hash = %s"
+        params = [RecipientRepository.address_hash(address)]
+        if app_id is not None:
+            where += " AND r.app_id = %s"
+            params.append(app_id)
+
+        async with db.cursor() as cursor:
+            await cursor.execute(
+                f"""
+                SELECT r.email_log_id, r.message_id, r.role, r.status, r.created_at, r.updated_at, l.subject
+                FROM email_recipients r
+                JOIN email_logs l ON l.id = r.email_log_id
+                WHERE {where}
+                ORDER BY r.id DESC
+                LIMIT %s
+                """,
+                params + [limit]
+            )
+            rows = await cursor.fetchall()
+
+        keys = ("email_log_id", "message_id", "role", "status", "created_at", "updated_at", "subject")
+        return [dict(zip(keys, row)) for row in rows]
@@ -0,0 +1,51 @@
+import secrets
+
+from app.database.database import commit_if_needed
+
+
+class SNSEventRepository:
+    """Repository for sns_processed_events: SNS MessageIds whose SES event was already applied.
+
+    SNS delivers at least once, so a retried notification must not be applied twice.
+    Ids are claimed on the cursor of the transaction that applies their events, so an
+    id is recorded if and only if its event was applied.
+    """
+
+    @staticmethod
+    async def claim(cursor, sns_message_ids: list) -> set:
+        """Record the given ids and return the ones that were not processed before"""
+        if not sns_message_ids:
+            return set()
+        # Rows inserted by this call carry its batch id; already-known ids keep theirs.
+        # A concurrent claim of the same id waits on the row lock until this transaction ends.
+        batch_id = secrets.randbits(63)
+        ids = sorted(set(sns_message_ids))
+        placeholders = ', '.join(['%s'] * len(ids))
+        await cursor.execute(
+            f"""
+            INSERT IGNORE INTO sns_processed_events (sns_message_id, batch_id)
+            VALUES {', '.join(['(%s, %s)'] * len(ids))}
+            """,
+            [value for sns_message_id in ids for value in (sns_message_id, batch_id)]
+        )
+        await cursor.execute(
+            f"SELECT sns_message_id FROM sns_processed_events WHERE sns_message_id IN ({placeholders}) AND batch_id = %s",
+            ids + [batch_id]
+        )
+        return {row[0] for row in await cursor.fetchall()}
+
+    @staticmethod
+    async def purge_expired(db, ttl_seconds: int, limit: int) -> int:
+        """Delete up to `limit` ids processed more than ttl_seconds ago"""
+        async with db.cursor() as cursor:
+            await cursor.execute(
+                """
+                DELETE FROM sns_processed_events
+                WHERE processed_at < NOW() - INTERVAL %s SECOND
+                ORDER BY processed_at
+                LIMIT %s
+                """,
+                (ttl_seconds, limit)
+            )
+            await commit_if_needed(db)
+            return cursor.rowcount
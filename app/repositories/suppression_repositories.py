@@ -0,0 +1,76 @@
+from app.database.database import commit_if_needed
+
+
+class SuppressionRepository:
+    """Repository for suppressed_addresses: hashed addresses SES must not be sent to.
+
+    Addresses are keyed by the same sha256 hash as email_recipients
+    (RecipientRepository.address_hash). The auto-increment id lets processes pick
+    up new entries incrementally.
+    """
+
+    @staticmethod
+    async def add_rows(cursor, entries: list) -> int:
+        """Insert (address_hash, reason, message_id) entries, keeping existing ones as they are"""
+        if not entries:
+            return 0
+        # Stable order keeps concurrent inserts from deadlocking on the unique key
+        entries = sorted(entries)
+        await cursor.execute(
+            f"""
+            INSERT INTO suppressed_addresses (address_hash, reason, message_id)
+            VALUES {', '.join(['(%s, %s, %s)'] * len(entries))}
+            ON DUPLICATE KEY UPDATE address_hash = address_hash
+            """,
+            [value for entry in entries for value in entry]
+        )
+        return cursor.rowcount
+
+    @staticmethod
+    async def add(db, entries: list) -> int:
+        async with db.cursor() as cursor:
+            added = await SuppressionRepository.add_rows(cursor, entries)
+            await commit_if_needed(db)
+            return added
+
+    @staticmethod
+    async def remove(db, address_hashes: list) -> int:
+        if not address_hashes:
+            return 0
+        async with db.cursor() as cursor:
+            await cursor.execute(
+                f"DELETE FROM suppressed_addresses WHERE address_hash IN ({', '.join(['%s'] * len(address_hashes))})",
+                list(address_hashes)
+            )
+            await commit_if_needed(db)
+            return cursor.rowcount
+
+    @staticmethod
+    async def find(db, address_hashes: list) -> set:
+        """Return the subset of address_hashes that are suppressed"""
+        if not address_hashes:
+            return set()
+        async with db.cursor() as cursor:
+            await cursor.execute(
+                f"SELECT address_hash FROM suppressed_addresses WHERE address_hash IN ({', '.join(['%s'] * len(address_hashes))})",
+                list(address_hashes)
+            )
+            return {row[0] for row in await cursor.fetchall()}
+
+    @staticmethod
+    async def stats(db) -> tuple:
+        """(number of suppressed addresses, highest id)"""
+        async with db.cursor() as cursor:
+            await cursor.execute("SELECT COUNT(*), COALESCE(MAX(id), 0) FROM suppressed_addresses")
+            row = await cursor.fetchone()
+            return int(row[0]), int(row[1])
+
+    @staticmethod
+    async def fetch_after(db, after_id: int, limit: int) -> list:
+        """(id, address_hash) rows with id > after_id, in id order (keyset scan)"""
+        async with db.cursor() as cursor:
+            await cursor.execute(
+                "SELECT id, address_hash FROM suppressed_addresses WHERE id > %s ORDER BY id LIMIT %s",
+                (after_id, limit)
+            )
+            return await cursor.fetchall()
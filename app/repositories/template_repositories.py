@@ -0,0 +1,79 @@
+from app.database.database import commit_if_needed, transaction
+
+TEMPLATE_COLUMNS = ("template_id", "version", "subject", "body_text", "body_html", "created_at", "updated_at")
+
+
+class TemplateRepository:
+    """Repository for email_templates: Jinja2 subject/text/HTML templates stored per application.
+
+    Every change of a template bumps its version, so compiled templates can be
+    cached under (app_id, template_id, version) without ever going stale. Deleted
+    templates are only marked deleted: recreating one continues its version
+    sequence instead of starting over at 1.
+    """
+
+    @staticmethod
+    async def save(db, app_id: int, template_id: str, subject: str, body_text: str, body_html: str = None) -> int:
+        """Create or replace a template and return its new version"""
+        async with transaction(db), db.cursor() as cursor:
+            await cursor.execute(
+                """
+                INSERT INTO email_templates (app_id, template_id, version, subject, body_text, body_html)
+                VALUES (%s, %s, 1, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE
+                    version = version + 1,
+                    created_at = IF(deleted_at IS NULL, created_at, NOW()),
+                    deleted_at = NULL,
+                    subject = VALUES(subject),
+                    body_text = VALUES(body_text),
+                    body_html = VALUES(body_html)
+                """,
+                (app_id, template_id, subject, body_text, body_html)
+            )
+            await cursor.execute(
+                "SELECT version FROM email_templates WHERE app_id = %s AND template_id = %s",
+                (app_id, template_id)
+            )
+            row = await cursor.fetchone()
+        return int(row[0])
+
+    @staticmethod
+    async def get(db, app_id: int, template_id: str) -> dict:
+        """The full template, or None"""
+        async with db.cursor() as cursor:
+            await cursor.execute(
+                f"""
+                SELECT {', '.join(TEMPLATE_COLUMNS)} FROM email_templates
+                WHERE app_id = %s AND template_id = %s AND deleted_at IS NULL
+                """,
+                (app_id, template_id)
+            )
+            row = await cursor.fetchone()
+            await commit_if_needed(db)
+        return dict(zip(TEMPLATE_COLUMNS, row)) if row else None
+
+    @staticmethod
+    async def get_version(db, app_id: int, template_id: str) -> int:
+        """Current version of a template (without its bodies), or None"""
+        async with db.cursor() as cursor:
+            await cursor.execute(
+                "SELECT version FROM email_templates WHERE app_id = %s AND template_id = %s AND deleted_at IS NULL",
+                (app_id, template_id)
+            )
+            row = await cursor.fetchone()
+            await commit_if_needed(db)
+        return int(row[0]) if row else None
+
+    @staticmethod
+    async def delete(db, app_id: int, template_id: str) -> bool:
+        """Mark a template deleted; the row keeps its version for a later recreate"""
+        async with db.cursor() as cursor:
+            await cursor.execute(
+                """
+                UPDATE email_templates SET deleted_at = NOW()
+                WHERE app_id = %s AND template_id = %s AND deleted_at IS NULL
+                """,
+                (app_id, template_id)
+            )
+            await commit_if_needed(db)
+            return cursor.rowcount > 0
@@ -1,21 +1,36 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Path, Query, Request, Response
 from typing import Optional
+from datetime import datetime
 from fastapi import Header
 from fastapi.security import APIKeyHeader
 from starlette.status import HTTP_403_FORBIDDEN, HTTP_401_UNAUTHORIZED
 
-from app.models.email_models import EmailRequest, EmailResponse, SNSPayload
+from app.models.email_models import (
+    EmailRequest, EmailResponse, EmailQueuedResponse, BatchEmailRequest, BatchEmailResponse, EmailLogPage,
+    RecipientLookupRequest, RecipientLookupResponse, SuppressionRequest, SuppressionResponse,
+    SuppressionCheckResponse, SNSPayload, TemplateRequest, TemplateResponse, AttachmentResponse
+)
 from app.controllers.email_controller import EmailController
 from app.config import settings
 from sqlalchemy.orm import Session
 from sqlalchemy import select
-from app.database.database import get_db
+from app.database.database import get_db, get_db_pool, acquire_connection, release_connection
 from app.models.db_applications import Application  # Import Application model
 from app.repositories.email_repositories import EmailRepository  # Import EmailRepository
+from app.repositories.metrics_repositories import MetricsRepository
+from app.services.token_cache import token_cache
+from app.services.executor import ses_executor
+from app.services.metrics import metrics
+from app.services.event_buffer import ses_event_buffer
+from app.services.response_cache import metrics_response_cache
+from app.services.sns_verification import sns_verifier, SNSSignatureError
 # import pywhatkit
+import hmac
+import json
 import os
 import logging
 from botocore.exceptions import ClientError
+from pydantic import ValidationError
 
 # Configure logger
 logger = logging.getLogger("email_routes")
@@ -42,7 +57,7 @@ router = APIRouter(tags=["emails"])
 async def verify_token(
     x_api_token: Optional[str] = Header(None),
     app_id: Optional[str] = Header(None),
-    db = Depends(get_db)
+    db = Depends(get_db_pool)
 ):
     """Verify the token provided in request header using aiomysql"""
     if not x_api_token:
@@ -57,6 +72,15 @@ async def verify_token(
             detail="Application ID is missing"
         )
     
+    cached, application = token_cache.get(app_id, x_api_token)
+    if cached:
+        if application is None:
+            raise HTTPException(
+                status_code=HTTP_403_FORBIDDEN,
+                detail="Invalid token or application not found"
+            )
+        return application
+
     try:
         # If db is a connection pool
         if hasattr(db, 'acquire'):
@@ -88,14 +112,19 @@ async def verify_token(
             raise ValueError("Unsupported database connection type")
         
         if not result:
+            token_cache.set(app_id, x_api_token, None)
             raise HTTPException(
                 status_code=HTTP_403_FORBIDDEN,
                 detail="Invalid token or application not found"
             )
         
-        # Return the application data
-        return {"id": result[0], "token": result[1]}
+        # Return the application data; the token is left out so the cache never holds it
+        application = {"id": result[0]}
+        token_cache.set(app_id, x_api_token, application)
+        return application
                 
+    except HTTPException:
+        raise
     except Exception as e:
         # Log the error for debugging
         print(f"Database error: {type(e).__name__}: {str(e)}")
@@ -105,13 +134,25 @@ async def verify_token(
     
         )
         
+async def verify_admin_token(x_admin_token: Optional[str] = Header(None)):
+    """Verify the X-Admin-Token header against ADMIN_API_TOKEN (admin endpoints are off without it)"""
+    if not settings.ADMIN_API_TOKEN:
+        raise HTTPException(status_code=HTTP_403_FORBIDDEN, detail="Admin API is disabled")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, settings.ADMIN_API_TOKEN):
+        raise HTTPException(status_code=HTTP_401_UNAUTHORIZED, detail="Invalid admin token")
+
 @router.post("/send/email",
     response_model=EmailResponse,
-    dependencies=[Depends(verify_token)],
     summary="Send an email using AWS SES",
     description="Send an email with optional HTML content, CC, BCC and Reply-To using AWS SES"
 )
-async def send_email(email_request: EmailRequest, db: Session = Depends(get_db)):
+async def send_email(
+    email_request: EmailRequest,
+    response: Response,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", min_length=1, max_length=255),
+    application = Depends(verify_token),
+    db: Session = Depends(get_db)
+):
     """
     Send an email using AWS SES with the following information:
     - **sender**: Email address of the sender (must be verified in AWS SES)
@@ -121,8 +162,233 @@ async def send_email(email_request: EmailRequest, db: Session = Depends(get_db))
     - **bcc**: Optional list of BCC recipients
     - **content**: Email content with subject, text body and optional HTML body
     - **reply_to**: Optional list of reply-to email addresses
+    - **attachments**: Optional list of uploaded attachments (**attachment_id**, optional
+      **filename**/**content_type** overrides); the email is then sent as raw MIME
+
+    The email is sent for the application authenticated by the app_id/x-api-token headers;
+    the **app_id** of the body is ignored, so templates and attachments of other
+    applications cannot be used.
+
+    Send an **Idempotency-Key** header to make retries safe: a repeat with the same key
+    returns the original response without sending again (422 if the body differs).
+    """
+    return await EmailController.send_email(
+        email_request, db, idempotency_key=idempotency_key, app_id=application["id"], response=response
+    )
+
+@router.post("/send/email/queue",
+    response_model=EmailQueuedResponse,
+    status_code=202,
+    summary="Queue an email for sending using AWS SES",
+    description="Validate and store an email in the outbox, returning 202 immediately; a background worker sends it"
+)
+async def queue_email(email_request: EmailRequest, application = Depends(verify_token), db: Session = Depends(get_db)):
+    """
+    Accept an email for asynchronous delivery. Takes the same body as /send/email.
+    The email is stored in email_logs with status "Queued" and the returned id can be
+    used to follow it; background workers move it to "Sent" or "Failed".
+    """
+    return await EmailController.queue_email(email_request, db, app_id=application["id"])
+
+@router.post("/send/email/batch",
+    response_model=BatchEmailResponse,
+    summary="Send a batch of emails using AWS SES",
+    description="Send many emails in one request, fanned out concurrently, with per-item results"
+)
+async def send_email_batch(batch_request: BatchEmailRequest, application = Depends(verify_token),
+                           db: Session = Depends(get_db)):
+    """
+    Send a batch of emails, either as:
+    - **items**: a list of complete email requests, or
+    - **template** + **recipients**: one sender/content sent separately to each recipient
+
+    Items are sent concurrently up to the configured concurrency limit and logged
+    with a single multi-row INSERT. The response lists a message ID or error per item.
+
+    With **bulk** set, a template referencing a stored **template_id** is sent with SES
+    SendBulkTemplatedEmail: SES personalises up to 50 recipients per API call from
+    their **template_data**.
     """
-    return await EmailController.send_email(email_request,db)
+    return await EmailController.send_batch(batch_request, db, app_id=application["id"])
+
+@router.post("/email/attachments",
+    response_model=AttachmentResponse,
+    status_code=201,
+    summary="Upload an email attachment",
+    description="Stream a file as the raw request body; send requests reference it by the returned attachment_id"
+)
+async def upload_attachment(
+    request: Request,
+    filename: str = Query(..., min_length=1, max_length=255),
+    application = Depends(verify_token)
+):
+    """
+    Upload an attachment as the raw request body (not multipart); its Content-Type header
+    is used as the attachment's type. The **attachment_id** is the sha256 of the content:
+    uploading the same file again returns the same id, and it is stored only once.
+    """
+    content_length = request.headers.get("content-length")
+    return await EmailController.upload_attachment(
+        application["id"],
+        request.stream(),
+        filename,
+        request.headers.get("content-type"),
+        content_length=int(content_length) if content_length and content_length.isdigit() else None
+    )
+
+TEMPLATE_ID_PATTERN = r"^[A-Za-z0-9_.-]{1,100}$"
+
+@router.put("/email/templates/{template_id}",
+    response_model=TemplateResponse,
+    summary="Create or replace an email template",
+    description="Store a Jinja2 subject/text/HTML template that send requests can reference by template_id"
+)
+async def save_template(
+    request: TemplateRequest,
+    template_id: str = Path(..., pattern=TEMPLATE_ID_PATTERN),
+    application = Depends(verify_token),
+    db = Depends(get_db)
+):
+    """
+    Store a template for the calling application. Every change bumps its **version**.
+    Send requests reference it with **template_id** and **template_data** (variables);
+    in batch template mode each recipient may carry its own **template_data**.
+    Templates run in a sandbox and every variable they use must be provided.
+    """
+    return await EmailController.save_template(db, application["id"], template_id, request)
+
+@router.get("/email/templates/{template_id}",
+    response_model=TemplateResponse,
+    summary="Get an email template"
+)
+async def get_template(
+    template_id: str = Path(..., pattern=TEMPLATE_ID_PATTERN),
+    application = Depends(verify_token),
+    db = Depends(get_db)
+):
+    return await EmailController.get_template(db, application["id"], template_id)
+
+@router.delete("/email/templates/{template_id}",
+    summary="Delete an email template"
+)
+async def delete_template(
+    template_id: str = Path(..., pattern=TEMPLATE_ID_PATTERN),
+    application = Depends(verify_token),
+    db = Depends(get_db)
+):
+    return await EmailController.delete_template(db, application["id"], template_id)
+
+@router.get("/email/logs",
+    response_model=EmailLogPage,
+    summary="List email logs",
+    description="Cursor-paginated email logs of the calling application, newest first"
+)
+async def list_email_logs(
+    limit: int = Query(50, ge=1, le=settings.EMAIL_LOGS_PAGE_MAX_SIZE),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    status: Optional[str] = None,
+    sent_from: Optional[datetime] = Query(None, description="Only logs sent at or after this time"),
+    sent_to: Optional[datetime] = Query(None, description="Only logs sent before this time"),
+    fields: Optional[str] = Query(None, description="Comma-separated email_logs columns to return"),
+    application = Depends(verify_token),
+    db = Depends(get_db)
+):
+    """
+    List the email logs of the application identified by the app_id/x-api-token headers.
+    Pages are keyset-paginated on (sent_at, id): pass **next_cursor** back as **cursor**
+    to fetch the next page; every page costs the same regardless of depth.
+    """
+    return await EmailController.list_email_logs(
+        db, limit=limit, cursor=cursor, app_id=application["id"], status=status,
+        sent_from=sent_from, sent_to=sent_to, fields=fields
+    )
+
+@router.get("/email/logs/export",
+    summary="Export email logs",
+    description="Stream all email logs of the calling application as NDJSON or CSV"
+)
+async def export_email_logs(
+    format: str = Query("ndjson", description="ndjson or csv"),
+    gzip: bool = Query(False, description="gzip the stream (sent with Content-Encoding: gzip)"),
+    status: Optional[str] = None,
+    sent_from: Optional[datetime] = Query(None, description="Only logs sent at or after this time"),
+    sent_to: Optional[datetime] = Query(None, description="Only logs sent before this time"),
+    fields: Optional[str] = Query(None, description="Comma-separated email_logs columns to export"),
+    application = Depends(verify_token)
+):
+    """
+    Export the email logs of the application identified by the app_id/x-api-token headers,
+    oldest first, with the same filters as /email/logs. Rows are streamed from a server-side
+    cursor, so exports of any size use constant memory.
+    """
+    return EmailController.export_email_logs(
+        format, compress=gzip, app_id=application["id"], status=status,
+        sent_from=sent_from, sent_to=sent_to, fields=fields
+    )
+
+@router.post("/email/recipients/lookup",
+    response_model=RecipientLookupResponse,
+    summary="Look up the delivery history of an address",
+    description="Per-recipient delivery status (sent, delivered, bounced, complaint) of one address"
+)
+async def lookup_recipient(
+    lookup: RecipientLookupRequest,
+    application = Depends(verify_token),
+    db = Depends(get_db)
+):
+    """
+    Return the emails of the calling application sent to **address**, newest first, with
+    the per-recipient status from SES delivery/bounce/complaint events. The address is
+    sent in the body (not the URL) and only its hash is stored.
+    """
+    return await EmailController.lookup_recipient(lookup, db, application["id"])
+
+@router.post("/admin/suppressions",
+    response_model=SuppressionResponse,
+    dependencies=[Depends(verify_admin_token)],
+    summary="Suppress addresses",
+    description="Add addresses to the suppression list; emails to them are no longer sent"
+)
+async def add_suppressions(request: SuppressionRequest):
+    return await EmailController.add_suppressions(request)
+
+@router.post("/admin/suppressions/remove",
+    response_model=SuppressionResponse,
+    dependencies=[Depends(verify_admin_token)],
+    summary="Unsuppress addresses",
+    description="Remove addresses from the suppression list"
+)
+async def remove_suppressions(request: SuppressionRequest):
+    return await EmailController.remove_suppressions(request)
+
+@router.post("/admin/suppressions/check",
+    response_model=SuppressionCheckResponse,
+    dependencies=[Depends(verify_admin_token)],
+    summary="Check suppressed addresses",
+    description="Return which of the given addresses are on the suppression list"
+)
+async def check_suppressions(request: SuppressionRequest):
+    return await EmailController.check_suppressions(request)
+
+@router.post("/admin/suppressions/rebuild",
+    dependencies=[Depends(verify_admin_token)],
+    summary="Rebuild the suppression filter",
+    description="Reload this process's in-memory suppression filter from the database"
+)
+async def rebuild_suppressions():
+    return await EmailController.rebuild_suppressions()
+
+@router.post("/admin/applications/{app_id}/token-cache/invalidate",
+    dependencies=[Depends(verify_admin_token)],
+    summary="Invalidate cached application tokens",
+    description="Make this process re-check an application's token after it was rotated or deactivated"
+)
+async def invalidate_token_cache(app_id: int = Path(..., ge=1)):
+    """
+    Call on every API process after changing an application's token or is_active flag;
+    processes that are not told keep accepting the old token for up to TOKEN_CACHE_TTL_SECONDS.
+    """
+    return EmailController.invalidate_token_cache(app_id)
 
 @router.post("/send/whatsapp",
     summary="Send a WhatsApp message using Twilio API",
@@ -149,12 +415,46 @@ async def send_whatsapp_message(
     print("Successfully Sent!")
     
     
+@router.get("/service/metrics")
+async def get_service_metrics():
+    """In-process runtime metrics (executor queue wait/execution times, etc.)"""
+    return metrics.snapshot()
+
+
 @router.get("/email/metrics")
 # def get_email_metrics(months: int = 3, db: Session = Depends(get_db)):
 #     return {"metrics": EmailRepository.get_email_metrics(db, months=months)}
-async def get_email_metrics(months: int = 3, db = Depends(get_db)):
-    metrics = await EmailRepository.get_email_metrics(db, months=months)
-    return {"metrics": metrics}
+async def get_email_metrics(request: Request, months: int = 3):
+    """
+    Daily email metrics of all applications, read from the email_metrics_daily rollup.
+    Responses are cached briefly per months; concurrent identical requests share
+    one query, and ETag / Last-Modified validators let unchanged polls return 304.
+    """
+    return await email_metrics_response(request, months)
+
+
+@router.get("/email/metrics/app")
+async def get_application_email_metrics(request: Request, months: int = 3, application = Depends(verify_token)):
+    """
+    Daily email metrics of the application identified by the app_id/x-api-token headers,
+    cached and revalidated like /email/metrics.
+    """
+    return await email_metrics_response(request, months, app_id=application["id"])
+
+
+async def email_metrics_response(request: Request, months: int, app_id: int = None) -> Response:
+    """Daily metrics for one application (app_id from verify_token only) or all of them"""
+    async def load():
+        conn = await acquire_connection()
+        try:
+            return {"metrics": await MetricsRepository.get_daily_metrics(conn, months=months, app_id=app_id)}
+        finally:
+            await release_connection(conn)
+
+    cached = await metrics_response_cache.get_or_compute((months, app_id), load)
+    if cached.not_modified(request.headers.get("if-none-match"), request.headers.get("if-modified-since")):
+        return Response(status_code=304, headers=cached.headers)
+    return Response(content=cached.body, media_type="application/json", headers=cached.headers)
 
 from fastapi import APIRouter, Request, Depends
 from sqlalchemy.orm import Session
@@ -359,12 +659,33 @@ import json
 #         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 @router.post("/email/events")
-async def ses_event_listener(payload: SNSPayload, db: Session = Depends(get_db)):
+async def ses_event_listener(request: Request):
     """
     Endpoint for AWS SES/SNS to send bounce/complaint/delivery/open/click events.
     Handles SubscriptionConfirmation and Notification messages.
+    The SNS signature is verified against the raw body before anything is processed.
+    Events are buffered and applied to email_logs in coalesced batches.
     """
     try:
+        try:
+            message = json.loads(await request.body())
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid JSON body")
+        if not isinstance(message, dict):
+            raise HTTPException(status_code=400, detail="Invalid SNS message")
+
+        if settings.SNS_VERIFY_SIGNATURES:
+            try:
+                await sns_verifier.verify(message)
+            except SNSSignatureError as e:
+                logger.warning(f"Rejected SNS message: {e}")
+                raise HTTPException(status_code=403, detail="Invalid SNS signature")
+
+        try:
+            payload = SNSPayload.model_validate(message)
+        except ValidationError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid SNS message: {e.error_count()} errors")
+
         logger.info(f"SNS message type: {payload.Type}")
         logger.info("=== WEBHOOK CALLED ===")
         logger.info(f"Request headers: {dict(payload)}")
@@ -380,29 +701,39 @@ async def ses_event_listener(payload: SNSPayload, db: Session = Depends(get_db))
         # Notifications (SES events)
         if payload.Type == "Notification":
             ses_message = payload.Message
-            event_type = (ses_message.eventType or ses_message.notificationType or "").lower()
-            message_id = ses_message.mail.messageId if ses_message.mail else None
+            event_type = (ses_message.eventType or ses_message.notificationType or "").lower() if ses_message else ""
+            message_id = ses_message.mail.messageId if ses_message and ses_message.mail else None
 
             if not event_type or not message_id:
                 raise HTTPException(status_code=400, detail="Missing eventType or messageId")
 
             logger.info(f"Processing SES {event_type} for message {message_id}")
 
-            # Update DB according to event type
-            if event_type == "bounce":
-                await EmailRepository.update_status(db, message_id, "Bounced", is_success=False)
-            elif event_type == "complaint":
-                await EmailRepository.update_status(db, message_id, "Complaint", is_success=False)
-            elif event_type == "delivery":
-                await EmailRepository.update_status(db, message_id, "Delivered", is_success=True)
-            elif event_type == "open":
-                await EmailRepository.increment_open_count(db, message_id)
-            elif event_type == "click":
-                await EmailRepository.increment_click_count(db, message_id)
-            else:
+            # Queue the DB update according to event type
+            if not ses_event_buffer.handles(event_type):
                 logger.warning(f"Unhandled event type: {event_type}")
                 return {"status": "ignored", "event_type": event_type}
 
+            # Addresses the event applies to, for per-recipient delivery status
+            recipients = []
+            if ses_message.bounce and ses_message.bounce.bouncedRecipients:
+                recipients = [r.get("emailAddress") for r in ses_message.bounce.bouncedRecipients]
+            elif ses_message.complaint and ses_message.complaint.complainedRecipients:
+                recipients = [r.get("emailAddress") for r in ses_message.complaint.complainedRecipients]
+            elif ses_message.delivery and ses_message.delivery.recipients:
+                recipients = ses_message.delivery.recipients
+
+            # Hard bounces and complaints put the addresses on the suppression list
+            suppress = event_type == "complaint" or (
+                event_type == "bounce" and (ses_message.bounce.bounceType if ses_message.bounce else None) == "Permanent"
+            )
+
+            if not await ses_event_buffer.add(
+                event_type, message_id, recipients, suppress=suppress, sns_message_id=payload.MessageId
+            ):
+                logger.info(f"Duplicate SNS delivery {payload.MessageId} ignored")
+                return {"status": "duplicate", "event_type": event_type, "message_id": message_id}
+
             return {"status": "processed", "event_type": event_type, "message_id": message_id}
 
         return {"status": "ignored", "reason": f"Unhandled SNS Type {payload.Type}"}
@@ -424,7 +755,7 @@ async def setup_email_tracking():
     from app.services.ses_service import SESService
     
     try:
-        result = SESService.setup_real_time_tracking()
+        result = await ses_executor.run(SESService.setup_real_time_tracking)
         return result
     except Exception as e:
         logger.error(f"Setup failed: {e}")
@@ -446,7 +777,8 @@ async def get_configuration_status():
         
         # Check configuration set
         try:
-            config_set = ses_client.describe_configuration_set(
+            config_set = await ses_executor.run(
+                ses_client.describe_configuration_set,
                 ConfigurationSetName=configuration_set_name
             )
             config_exists = True
@@ -457,7 +789,8 @@ async def get_configuration_status():
         event_destinations = []
         if config_exists:
             try:
-                response = ses_client.describe_configuration_set(
+                response = await ses_executor.run(
+                    ses_client.describe_configuration_set,
                     ConfigurationSetName=configuration_set_name
                 )
                 event_destinations = response.get('EventDestinations', [])
@@ -465,7 +798,7 @@ async def get_configuration_status():
                 logger.error(f"Error getting event destinations: {e}")
         
         # Check SNS topics
-        topics = sns_client.list_topics()
+        topics = await ses_executor.run(sns_client.list_topics)
         ses_topics = [topic for topic in topics['Topics'] if 'ses-events' in topic['TopicArn']]
         
         return {
@@ -499,19 +832,20 @@ async def update_configuration():
         webhook_url = "https://api.communication.gotestli.com/api/email/events"
         
         # Get or create SNS topic
-        topic_response = sns_client.create_topic(Name=sns_topic_name)
+        topic_response = await ses_executor.run(sns_client.create_topic, Name=sns_topic_name)
         topic_arn = topic_response['TopicArn']
         logger.info(f"Using SNS Topic ARN: {topic_arn}")
         
         # Ensure webhook is subscribed
-        subscriptions = sns_client.list_subscriptions_by_topic(TopicArn=topic_arn)
+        subscriptions = await ses_executor.run(sns_client.list_subscriptions_by_topic, TopicArn=topic_arn)
         webhook_subscribed = any(
             sub['Endpoint'] == webhook_url and sub['Protocol'] == 'https'
             for sub in subscriptions['Subscriptions']
         )
         
         if not webhook_subscribed:
-            subscription_response = sns_client.subscribe(
+            subscription_response = await ses_executor.run(
+                sns_client.subscribe,
                 TopicArn=topic_arn,
                 Protocol='https',
                 Endpoint=webhook_url
@@ -520,7 +854,8 @@ async def update_configuration():
         
         # Update the event destination (this handles existing destinations)
         try:
-            ses_client.put_configuration_set_event_destination(
+            await ses_executor.run(
+                ses_client.put_configuration_set_event_destination,
                 ConfigurationSetName=configuration_set_name,
                 EventDestination={
                     'Name': 'webhook-destination',
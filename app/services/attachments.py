@@ -0,0 +1,334 @@
+import asyncio
+import base64
+import hashlib
+import logging
+import os
+import re
+import time
+import uuid
+from collections import OrderedDict
+from email.message import Message
+from email.policy import SMTP
+
+from app.config import settings
+from app.database.database import acquire_connection, release_connection
+from app.repositories.attachment_repositories import AttachmentRepository
+from app.services.executor import BlockingExecutor
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONTENT_TYPE = "application/octet-stream"
+CONTENT_TYPE_PATTERN = re.compile(r"^[A-Za-z0-9][A-Za-z0-9!#$&^_.+-]*/[A-Za-z0-9][A-Za-z0-9!#$&^_.+-]*$")
+# Disk writes are batched to this size instead of one executor hop per request body chunk
+WRITE_BUFFER_BYTES = 1024 * 1024
+# A multiple of 57 bytes, so every encoded chunk ends on a full 76-character base64 line
+ENCODE_CHUNK_BYTES = 57 * 16 * 1024
+# Content is stored in the database in chunks of this size, well below max_allowed_packet
+CONTENT_CHUNK_BYTES = 1024 * 1024
+
+
+class AttachmentError(Exception):
+    """Base class for attachment failures"""
+
+
+class AttachmentNotFound(AttachmentError):
+    """No attachment with this id was uploaded by the application"""
+
+
+class AttachmentTooLarge(AttachmentError):
+    """An attachment exceeds ATTACHMENT_MAX_BYTES"""
+
+
+class AttachmentEmpty(AttachmentError):
+    """An upload has no content"""
+
+
+def clean_filename(filename: str) -> str:
+    """Last path component of a client supplied filename, without control characters"""
+    filename = re.split(r"[\\/]", filename or "")[-1]
+    filename = "".join(char for char in filename if char.isprintable()).strip()
+    return filename[:255] or "attachment"
+
+
+def clean_content_type(content_type: str) -> str:
+    """The media type of a Content-Type value, or application/octet-stream if unusable"""
+    media_type = (content_type or "").split(";")[0].strip().lower()
+    return media_type if CONTENT_TYPE_PATTERN.match(media_type) else DEFAULT_CONTENT_TYPE
+
+
+class AttachmentPart:
+    """One attachment of a message: its MIME headers and the shared base64 encoded content"""
+
+    def __init__(self, headers: bytes, body: bytes):
+        self.headers = headers
+        self.body = body
+
+    def __len__(self):
+        return len(self.headers) + len(self.body)
+
+
+class AttachmentStore:
+    """Content-addressed attachment storage for raw MIME sends.
+
+    Uploads are streamed to disk while being hashed, then stored once under their
+    sha256, whichever application uploads them, in the database (in chunks), so
+    every node can send them; an email_attachments row grants an application the
+    right to reference the content. ATTACHMENT_STORE_DIR is a per-node cache:
+    content missing there is restored from the database on first use. Sending
+    reads and base64-encodes an attachment once: the encoded bytes are kept in
+    an LRU bounded by ATTACHMENT_ENCODED_CACHE_BYTES and shared by every message
+    that references it, so a file sent to many recipients is not re-read or
+    re-encoded per message. Concurrent misses share a single encode.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, metadata_cache_size: int, encoded_cache_bytes: int,
+                 executor: BlockingExecutor):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.metadata_cache_size = metadata_cache_size
+        self.encoded_cache_bytes = encoded_cache_bytes
+        self.executor = executor
+        self._metadata = OrderedDict()
+        self._encoded = OrderedDict()
+        self._encoded_size = 0
+        self._inflight = {}
+
+    def path(self, sha256: str) -> str:
+        return os.path.join(self.directory, sha256[:2], sha256)
+
+    @staticmethod
+    def _open_temp(directory: str):
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f".upload-{uuid.uuid4().hex}")
+        return path, open(path, "wb")
+
+    @staticmethod
+    def _discard(handle, path: str):
+        handle.close()
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _publish(self, handle, temp_path: str, sha256: str):
+        handle.close()
+        path = self.path(sha256)
+        if os.path.exists(path):
+            # Same content uploaded before: keep the stored copy
+            os.remove(temp_path)
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(temp_path, path)
+
+    async def save_stream(self, app_id: int, chunks, filename: str, content_type: str) -> dict:
+        """
+        Store an upload read from an async iterator of bytes, hashing it on the way,
+        and register it for the application. Returns the attachment metadata;
+        raises AttachmentTooLarge once more than ATTACHMENT_MAX_BYTES arrived and
+        AttachmentEmpty for an empty body.
+        """
+        filename, content_type = clean_filename(filename), clean_content_type(content_type)
+        digest = hashlib.sha256()
+        size = 0
+        buffer = []
+        buffered = 0
+        temp_path, handle = await self.executor.run(self._open_temp, self.directory)
+        try:
+            async for chunk in chunks:
+                if not chunk:
+                    continue
+                size += len(chunk)
+                if size > self.max_bytes:
+                    raise AttachmentTooLarge(f"Attachment exceeds {self.max_bytes} bytes")
+                digest.update(chunk)
+                buffer.append(chunk)
+                buffered += len(chunk)
+                if buffered >= WRITE_BUFFER_BYTES:
+                    await self.executor.run(handle.write, b"".join(buffer))
+                    buffer, buffered = [], 0
+            if buffer:
+                await self.executor.run(handle.write, b"".join(buffer))
+            if size == 0:
+                raise AttachmentEmpty("Attachment is empty")
+            sha256 = digest.hexdigest()
+            await self.executor.run(self._publish, handle, temp_path, sha256)
+        except BaseException:
+            await self.executor.run(self._discard, handle, temp_path)
+            raise
+
+        conn = await acquire_connection()
+        try:
+            await self._store_content(conn, sha256, size)
+            await AttachmentRepository.save(conn, app_id, sha256, filename, content_type, size)
+        finally:
+            await release_connection(conn)
+        metrics.increment("attachments.uploaded")
+        metadata = {"sha256": sha256, "filename": filename, "content_type": content_type, "size": size}
+        self._remember(app_id, metadata)
+        return metadata
+
+    def _read_chunk(self, sha256: str, seq: int) -> bytes:
+        with open(self.path(sha256), "rb") as handle:
+            handle.seek(seq * CONTENT_CHUNK_BYTES)
+            return handle.read(CONTENT_CHUNK_BYTES)
+
+    async def _store_content(self, conn, sha256: str, size: int):
+        """Copy content from the local file to the database, unless it is there already"""
+        if await AttachmentRepository.get_chunk_count(conn, sha256) is not None:
+            return
+        chunk_count = (size + CONTENT_CHUNK_BYTES - 1) // CONTENT_CHUNK_BYTES
+        for seq in range(chunk_count):
+            data = await self.executor.run(self._read_chunk, sha256, seq)
+            await AttachmentRepository.save_chunk(conn, sha256, seq, data)
+        await AttachmentRepository.complete_content(conn, sha256, size, chunk_count)
+
+    async def _restore(self, sha256: str):
+        """Write content stored by another node to the local cache directory"""
+        conn = await acquire_connection()
+        try:
+            chunk_count = await AttachmentRepository.get_chunk_count(conn, sha256)
+            if chunk_count is None:
+                raise AttachmentNotFound(f"Attachment content missing: {sha256}")
+            digest = hashlib.sha256()
+            temp_path, handle = await self.executor.run(self._open_temp, self.directory)
+            try:
+                for seq in range(chunk_count):
+                    data = await AttachmentRepository.get_chunk(conn, sha256, seq)
+                    if data is None:
+                        raise AttachmentNotFound(f"Attachment content incomplete: {sha256}")
+                    digest.update(data)
+                    await self.executor.run(handle.write, data)
+                if digest.hexdigest() != sha256:
+                    raise AttachmentNotFound(f"Attachment content corrupt: {sha256}")
+                await self.executor.run(self._publish, handle, temp_path, sha256)
+            except BaseException:
+                await self.executor.run(self._discard, handle, temp_path)
+                raise
+        finally:
+            await release_connection(conn)
+        metrics.increment("attachments.restored")
+
+    def _remember(self, app_id: int, metadata: dict):
+        key = (app_id, metadata["sha256"])
+        self._metadata[key] = metadata
+        self._metadata.move_to_end(key)
+        while len(self._metadata) > self.metadata_cache_size:
+            self._metadata.popitem(last=False)
+
+    async def resolve(self, app_id: int, references: list) -> list:
+        """
+        Metadata for each attachment reference, with its filename/content_type
+        overrides applied. Raises AttachmentNotFound for ids the application did not upload.
+        app_id must be the application authenticated by verify_token: the email_attachments
+        grant is all that stops a client from sending another application's content.
+        """
+        found = {}
+        for reference in references:
+            metadata = self._metadata.get((app_id, reference.attachment_id))
+            if metadata is not None:
+                self._metadata.move_to_end((app_id, reference.attachment_id))
+                found[reference.attachment_id] = metadata
+        missing = list(dict.fromkeys(
+            reference.attachment_id for reference in references if reference.attachment_id not in found
+        ))
+
+        if missing:
+            conn = await acquire_connection()
+            try:
+                rows = await AttachmentRepository.get_many(conn, app_id, missing)
+            finally:
+                await release_connection(conn)
+            unknown = [sha256 for sha256 in missing if sha256 not in rows]
+            if unknown:
+                raise AttachmentNotFound(f"Attachment not found: {', '.join(unknown)}")
+            for row in rows.values():
+                self._remember(app_id, row)
+            found.update(rows)
+
+        resolved = []
+        for reference in references:
+            metadata = dict(found[reference.attachment_id])
+            if reference.filename:
+                metadata["filename"] = clean_filename(reference.filename)
+            if reference.content_type:
+                metadata["content_type"] = clean_content_type(reference.content_type)
+            resolved.append(metadata)
+        return resolved
+
+    def _encode_file(self, sha256: str) -> bytes:
+        # Read and encode in line-aligned chunks; only the encoded result is held in full
+        encoded = []
+        with open(self.path(sha256), "rb") as handle:
+            while True:
+                chunk = handle.read(ENCODE_CHUNK_BYTES)
+                if not chunk:
+                    break
+                encoded.append(base64.encodebytes(chunk).replace(b"\n", b"\r\n"))
+        return b"".join(encoded)
+
+    async def encoded(self, sha256: str) -> bytes:
+        """The base64 (CRLF, 76-character lines) encoding of an attachment's content"""
+        body = self._encoded.get(sha256)
+        if body is not None:
+            self._encoded.move_to_end(sha256)
+            metrics.increment("attachments.encoded_cache_hits")
+            return body
+
+        task = self._inflight.get(sha256)
+        if task is None:
+            metrics.increment("attachments.encoded_cache_misses")
+            task = asyncio.create_task(self._load(sha256))
+            self._inflight[sha256] = task
+        return await asyncio.shield(task)
+
+    async def _load(self, sha256: str) -> bytes:
+        try:
+            started_at = time.perf_counter()
+            try:
+                body = await self.executor.run(self._encode_file, sha256)
+            except FileNotFoundError:
+                # Uploaded through another node (or the cache was cleared)
+                await self._restore(sha256)
+                body = await self.executor.run(self._encode_file, sha256)
+            metrics.observe("attachments.encode_seconds", time.perf_counter() - started_at)
+
+            if len(body) <= self.encoded_cache_bytes:
+                self._encoded[sha256] = body
+                self._encoded_size += len(body)
+                while self._encoded_size > self.encoded_cache_bytes:
+                    _, evicted = self._encoded.popitem(last=False)
+                    self._encoded_size -= len(evicted)
+            return body
+        finally:
+            self._inflight.pop(sha256, None)
+
+    @staticmethod
+    def part_headers(filename: str, content_type: str) -> bytes:
+        part = Message(policy=SMTP)
+        part["Content-Type"] = content_type
+        part.set_param("name", filename)
+        part.add_header("Content-Disposition", "attachment", filename=filename)
+        part["Content-Transfer-Encoding"] = "base64"
+        return part.as_bytes()
+
+    async def parts(self, app_id: int, references: list) -> list:
+        """The MIME parts of an email's attachments, sharing the cached encoded content"""
+        resolved = await self.resolve(app_id, references)
+        bodies = await asyncio.gather(*(self.encoded(metadata["sha256"]) for metadata in resolved))
+        return [
+            AttachmentPart(self.part_headers(metadata["filename"], metadata["content_type"]), body)
+            for metadata, body in zip(resolved, bodies)
+        ]
+
+
+# File reads and base64 encoding are blocking; they get their own pool instead of the SES executor
+attachment_executor = BlockingExecutor("attachment", max_workers=settings.ATTACHMENT_IO_WORKERS)
+
+attachment_store = AttachmentStore(
+    directory=settings.ATTACHMENT_STORE_DIR,
+    max_bytes=settings.ATTACHMENT_MAX_BYTES,
+    metadata_cache_size=settings.ATTACHMENT_METADATA_CACHE_SIZE,
+    encoded_cache_bytes=settings.ATTACHMENT_ENCODED_CACHE_BYTES,
+    executor=attachment_executor,
+)
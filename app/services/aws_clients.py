@@ -0,0 +1,61 @@
+import threading
+
+import boto3
+from botocore.config import Config
+
+from app.config import settings
+
+# Long-lived clients shared by the whole process. boto3 clients are thread-safe
+# once created, but client creation (and the default session) is not, so
+# construction is serialised behind a lock.
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def _client_config(max_attempts: int = None):
+    """Connection pool and keep-alive configuration shared by all AWS clients"""
+    config = Config(
+        max_pool_connections=settings.AWS_MAX_POOL_CONNECTIONS,
+        tcp_keepalive=settings.AWS_TCP_KEEPALIVE,
+        connect_timeout=settings.AWS_CONNECT_TIMEOUT,
+        read_timeout=settings.AWS_READ_TIMEOUT,
+    )
+    if max_attempts is not None:
+        config = config.merge(Config(retries={"mode": "standard", "total_max_attempts": max_attempts}))
+    return config
+
+
+def get_aws_client(service_name: str, region_name: str = None, aws_access_key_id: str = None,
+                   aws_secret_access_key: str = None, endpoint_url: str = None, max_attempts: int = None):
+    """Return a cached boto3 client, creating it on first use.
+
+    Clients are keyed by service, region, credentials, endpoint and retry budget,
+    so callers with their own credentials (e.g. the legacy app.py) still share
+    the cache. max_attempts overrides botocore's built-in retry attempts.
+    """
+    region_name = region_name or settings.AWS_REGION
+    aws_access_key_id = aws_access_key_id if aws_access_key_id is not None else settings.AWS_ACCESS_KEY_ID
+    aws_secret_access_key = aws_secret_access_key if aws_secret_access_key is not None else settings.AWS_SECRET_ACCESS_KEY
+
+    key = (service_name, region_name, aws_access_key_id, aws_secret_access_key, endpoint_url, max_attempts)
+    client = _clients.get(key)
+    if client is not None:
+        return client
+
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            session = boto3.session.Session(
+                aws_access_key_id=aws_access_key_id or None,
+                aws_secret_access_key=aws_secret_access_key or None,
+                region_name=region_name,
+            )
+            client = session.client(service_name, endpoint_url=endpoint_url, config=_client_config(max_attempts))
+            _clients[key] = client
+        return client
+
+
+def reset_aws_clients():
+    """Forget all cached clients (e.g. after credential rotation)"""
+    with _clients_lock:
+        _clients.clear()
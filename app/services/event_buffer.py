@@ -0,0 +1,262 @@
+import asyncio
+import itertools
+import logging
+import time
+from collections import OrderedDict, defaultdict
+
+from app.config import settings
+from app.database.database import acquire_connection, release_connection, transaction
+from app.repositories.email_repositories import EmailRepository
+from app.repositories.recipient_repositories import RecipientRepository
+from app.repositories.sns_event_repositories import SNSEventRepository
+from app.services.metrics import metrics
+from app.services.suppression import suppression_list
+
+logger = logging.getLogger(__name__)
+
+# SES event type -> (status, is_success) for events that change the message status
+STATUS_EVENTS = {
+    "bounce": ("Bounced", False),
+    "complaint": ("Complaint", False),
+    "delivery": ("Delivered", True),
+}
+COUNTER_EVENTS = {"open", "click"}
+PURGE_BATCH_SIZE = 10000
+
+
+class SESEventBuffer:
+    """Buffers SES webhook events in-process and applies them in coalesced batches.
+
+    Events are flushed every SES_EVENT_FLUSH_INTERVAL_MS or as soon as
+    SES_EVENT_FLUSH_MAX_EVENTS are waiting. Within a flush, opens/clicks are summed
+    per message_id and the latest status per message_id (and per recipient) wins,
+    so a campaign's event storm becomes a few UPDATE statements per flush.
+    Pending events are flushed on shutdown. When the buffer is not running,
+    each event is applied immediately.
+
+    SNS redeliveries are dropped by their SNS MessageId: recently seen ids are kept
+    in an LRU, so a retry costs one dict lookup, and every flush records its ids in
+    sns_processed_events in the same transaction, skipping ids already there.
+
+    The email log writer stores a send's message_id with its deferred status, so
+    an event can arrive before any row carries its message_id. Such events are
+    kept in the buffer and retried on later flushes for up to
+    SES_EVENT_UNMATCHED_RETRY_SECONDS before being applied regardless.
+    """
+
+    def __init__(self, flush_interval: float, max_events: int, dedupe_cache_size: int = 0,
+                 dedupe_ttl: int = 86400, dedupe_cleanup_interval: float = 600, unmatched_retry: float = 0):
+        self.flush_interval = flush_interval
+        self.max_events = max_events
+        self.unmatched_retry = unmatched_retry
+        self._held_until = {}
+        self.dedupe_cache_size = dedupe_cache_size
+        self.dedupe_ttl = dedupe_ttl
+        self.dedupe_cleanup_interval = dedupe_cleanup_interval
+        self._seen = OrderedDict()
+        self._unnamed = itertools.count()
+        self._purged_at = 0.0
+        self._reset()
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    def _reset(self):
+        # event key -> (event_type, message_id, recipient keys, suppress), in arrival order.
+        # The key is the SNS MessageId, or (None, n) for events without one.
+        self._events = {}
+
+    @staticmethod
+    def handles(event_type: str) -> bool:
+        return event_type in STATUS_EVENTS or event_type in COUNTER_EVENTS
+
+    @staticmethod
+    def _recipient_keys(message_id: str, recipients) -> list:
+        return [(message_id, RecipientRepository.address_hash(address)) for address in recipients or [] if address]
+
+    @staticmethod
+    def _coalesce(events) -> tuple:
+        """Fold events into (statuses, opens, clicks, recipient_statuses, suppressions) for apply_event_rows"""
+        statuses = {}
+        recipient_statuses = {}
+        suppressions = {}
+        opens = defaultdict(int)
+        clicks = defaultdict(int)
+        for event_type, message_id, recipient_keys, suppress in events:
+            if event_type in STATUS_EVENTS:
+                statuses[message_id] = STATUS_EVENTS[event_type]
+                for key in recipient_keys:
+                    recipient_statuses[key] = STATUS_EVENTS[event_type][0]
+                    if suppress:
+                        suppressions.setdefault(key[1], (key[1], event_type, message_id))
+            elif event_type == "open":
+                opens[message_id] += 1
+            elif event_type == "click":
+                clicks[message_id] += 1
+        return statuses, dict(opens), dict(clicks), recipient_statuses, list(suppressions.values())
+
+    def _is_duplicate(self, sns_message_id: str) -> bool:
+        """True if the id was seen recently, otherwise remember it"""
+        if sns_message_id in self._seen:
+            self._seen.move_to_end(sns_message_id)
+            return True
+        if self.dedupe_cache_size > 0:
+            self._seen[sns_message_id] = None
+            while len(self._seen) > self.dedupe_cache_size:
+                self._seen.popitem(last=False)
+        return False
+
+    async def add(self, event_type: str, message_id: str, recipients=None, suppress: bool = False,
+                  sns_message_id: str = None) -> bool:
+        """
+        Queue one SES event (bounce/complaint/delivery/open/click) for message_id.
+        recipients are the addresses a bounce/complaint/delivery applies to; with
+        suppress=True (hard bounce, complaint) they are added to the suppression list.
+        Returns False when the SNS notification (sns_message_id) was already received.
+        """
+        if sns_message_id is not None and self._is_duplicate(sns_message_id):
+            metrics.increment("ses_events.duplicates")
+            return False
+
+        metrics.increment(f"ses_events.received.{event_type}")
+        recipient_keys = self._recipient_keys(message_id, recipients)
+        if suppress:
+            # Stop sending to them from this process right away, before the flush
+            suppression_list.add_local(key[1] for key in recipient_keys)
+
+        event = (event_type, message_id, recipient_keys, suppress)
+        key = sns_message_id if sns_message_id is not None else (None, next(self._unnamed))
+        if self._task is None:
+            try:
+                await self._apply({key: event})
+            except BaseException:
+                # Not applied: SNS will redeliver it, which must not count as a duplicate
+                self._seen.pop(sns_message_id, None)
+                raise
+            return True
+
+        self._events[key] = event
+        metrics.set_gauge("ses_event_buffer.depth", len(self._events))
+        if len(self._events) >= self.max_events:
+            self._wakeup.set()
+        return True
+
+    async def _apply(self, events: dict, hold_unmatched: bool = False) -> dict:
+        """
+        Apply events in one transaction, skipping SNS notifications processed before.
+        With hold_unmatched, events whose message_id no email_logs row carries yet are
+        not applied (nor recorded as processed) but returned, until their retry time is up.
+        """
+        held = {}
+        conn = await acquire_connection()
+        try:
+            async with transaction(conn), conn.cursor() as cursor:
+                if hold_unmatched:
+                    known = await EmailRepository.find_message_ids(cursor, {event[1] for event in events.values()})
+                    now = time.monotonic()
+                    for key, event in events.items():
+                        if event[1] not in known:
+                            if self._held_until.setdefault(key, now + self.unmatched_retry) > now:
+                                held[key] = event
+                            else:
+                                metrics.increment("ses_events.unmatched")
+                    events = {key: event for key, event in events.items() if key not in held}
+                sns_message_ids = [key for key in events if isinstance(key, str)]
+                fresh = await SNSEventRepository.claim(cursor, sns_message_ids)
+                duplicates = len(sns_message_ids) - len(fresh)
+                await EmailRepository.apply_event_rows(cursor, *self._coalesce(
+                    event for key, event in events.items() if not isinstance(key, str) or key in fresh
+                ))
+        finally:
+            await release_connection(conn)
+        for key in events:
+            self._held_until.pop(key, None)
+        if duplicates:
+            metrics.increment("ses_events.duplicates", duplicates)
+        return held
+
+    async def flush(self, hold_unmatched: bool = True):
+        """Apply everything buffered so far, except events still waiting for their email log row"""
+        if not self._events:
+            return
+        events = self._events
+        self._reset()
+        metrics.set_gauge("ses_event_buffer.depth", 0)
+
+        started_at = time.perf_counter()
+        try:
+            held = await self._apply(events, hold_unmatched=hold_unmatched)
+        except BaseException:
+            # Put the batch back ahead of newer events so it is retried on the next flush
+            events.update(self._events)
+            self._events = events
+            raise
+        if held:
+            held.update(self._events)
+            self._events = held
+            metrics.set_gauge("ses_event_buffer.depth", len(self._events))
+
+        metrics.observe("ses_event_buffer.flush_seconds", time.perf_counter() - started_at)
+        metrics.observe("ses_event_buffer.flush_events", len(events))
+
+    async def purge_processed(self) -> int:
+        """Delete recorded SNS MessageIds older than the dedupe TTL; returns the number deleted"""
+        purged = 0
+        conn = await acquire_connection()
+        try:
+            while True:
+                deleted = await SNSEventRepository.purge_expired(conn, self.dedupe_ttl, PURGE_BATCH_SIZE)
+                purged += deleted
+                if deleted < PURGE_BATCH_SIZE:
+                    break
+        finally:
+            await release_connection(conn)
+        self._purged_at = time.monotonic()
+        metrics.increment("ses_events.dedupe_purged", purged)
+        return purged
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Failed to flush SES events: {e}", exc_info=True)
+            if time.monotonic() - self._purged_at >= self.dedupe_cleanup_interval:
+                try:
+                    await self.purge_processed()
+                except Exception as e:
+                    self._purged_at = time.monotonic()
+                    logger.error(f"Failed to purge processed SNS message ids: {e}", exc_info=True)
+
+    def start(self):
+        """Start the periodic flush task on the running event loop"""
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run(), name="ses-event-buffer")
+
+    async def stop(self):
+        """Stop the flush task and apply whatever is still buffered"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        try:
+            # The log writer has flushed by now: anything still unmatched will stay so
+            await self.flush(hold_unmatched=False)
+        except Exception as e:
+            logger.error(f"Failed to flush SES events on shutdown: {e}", exc_info=True)
+
+
+ses_event_buffer = SESEventBuffer(
+    flush_interval=settings.SES_EVENT_FLUSH_INTERVAL_MS / 1000,
+    max_events=settings.SES_EVENT_FLUSH_MAX_EVENTS,
+    dedupe_cache_size=settings.SES_EVENT_DEDUPE_CACHE_SIZE,
+    dedupe_ttl=settings.SES_EVENT_DEDUPE_TTL_SECONDS,
+    dedupe_cleanup_interval=settings.SES_EVENT_DEDUPE_CLEANUP_INTERVAL_SECONDS,
+    unmatched_retry=settings.SES_EVENT_UNMATCHED_RETRY_SECONDS,
+)
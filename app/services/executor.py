@@ -0,0 +1,67 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.config import settings
+from app.services.metrics import metrics
+
+
+class BlockingExecutor:
+    """Dedicated, bounded thread pool for blocking calls made from async code.
+
+    At most ``max_workers`` calls run at once and at most ``max_pending`` more
+    wait in the queue; further callers wait on the event loop instead of piling
+    up unbounded work. Queue wait and execution time are recorded separately so
+    the pool can be sized against the underlying connection pool.
+    """
+
+    def __init__(self, name: str, max_workers: int, max_pending: int = 0):
+        self.name = name
+        self.max_workers = max_workers
+        self._slots = asyncio.Semaphore(max_workers + max_pending)
+        self._executor = None
+        self._in_flight = 0
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers,
+                thread_name_prefix=f"{self.name}-executor"
+            )
+        return self._executor
+
+    async def run(self, func, *args, **kwargs):
+        """Run func(*args, **kwargs) on the pool and await its result"""
+        submitted_at = time.perf_counter()
+
+        def call():
+            started_at = time.perf_counter()
+            metrics.observe(f"{self.name}_executor.queue_wait_seconds", started_at - submitted_at)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                metrics.observe(f"{self.name}_executor.execution_seconds", time.perf_counter() - started_at)
+
+        async with self._slots:
+            self._in_flight += 1
+            metrics.set_gauge(f"{self.name}_executor.in_flight", self._in_flight)
+            try:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self._get_executor(), call)
+            finally:
+                self._in_flight -= 1
+                metrics.set_gauge(f"{self.name}_executor.in_flight", self._in_flight)
+
+    def shutdown(self, wait: bool = True):
+        """Stop the worker threads; the pool is recreated lazily if used again"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+
+# Executor for blocking boto3 SES/SNS calls
+ses_executor = BlockingExecutor(
+    "ses",
+    max_workers=settings.SES_EXECUTOR_MAX_WORKERS,
+    max_pending=settings.SES_EXECUTOR_MAX_PENDING,
+)
@@ -0,0 +1,190 @@
+import asyncio
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+
+from app.config import settings
+from app.database.database import acquire_connection, release_connection
+from app.repositories.idempotency_repositories import IdempotencyRepository
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class IdempotencyKeyReused(Exception):
+    """An Idempotency-Key was sent again with a different request body"""
+
+
+class IdempotencyKeyInFlight(Exception):
+    """Another process is still sending the request for this Idempotency-Key"""
+
+
+class IdempotencyStore:
+    """Replays the outcome of sends retried with the same Idempotency-Key.
+
+    Completed responses are kept in an LRU cache in front of the idempotency_keys
+    table, so a retry is answered without touching SES. Concurrent duplicates in
+    this process wait on the in-flight send; a duplicate arriving while another
+    process holds the key gets IdempotencyKeyInFlight. Sends that fail before the
+    email went out release their key so the client can retry them; any other
+    failure keeps the claim until its lease expires, so a retry cannot send twice.
+    Expired keys are purged in the background.
+    """
+
+    def __init__(self, ttl: int, lease: int, cache_size: int, cleanup_interval: float, cleanup_batch_size: int):
+        self.ttl = ttl
+        self.lease = lease
+        self.cache_size = cache_size
+        self.cleanup_interval = cleanup_interval
+        self.cleanup_batch_size = cleanup_batch_size
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._task = None
+
+    @staticmethod
+    def fingerprint(request) -> str:
+        """Hash of a request body, to detect a key being reused for a different request"""
+        return hashlib.sha256(request.model_dump_json().encode("utf-8")).hexdigest()
+
+    def _cached(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        request_hash, response, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return request_hash, response
+
+    def _remember(self, key, request_hash: str, response: dict):
+        if self.cache_size <= 0:
+            return
+        self._entries[key] = (request_hash, response, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.cache_size:
+            self._entries.popitem(last=False)
+
+    async def run(self, app_id: int, idempotency_key: str, request_hash: str, send, release_on: tuple = ()):
+        """
+        Return (response, replayed): the stored response for a known key, or the result of
+        awaiting send(conn) once. send is a coroutine function returning a JSON-serializable
+        dict; it gets a connection of its own, since it outlives a disconnecting client's
+        request. release_on lists the exceptions that mean nothing was sent.
+        """
+        key = (app_id, idempotency_key)
+        cached = self._cached(key)
+        if cached is not None:
+            if cached[0] != request_hash:
+                raise IdempotencyKeyReused("Idempotency-Key was already used with a different request")
+            metrics.increment("idempotency.replayed")
+            return cached[1], True
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            if inflight[0] != request_hash:
+                raise IdempotencyKeyReused("Idempotency-Key was already used with a different request")
+            metrics.increment("idempotency.coalesced")
+            response, _ = await asyncio.shield(inflight[1])
+            return response, True
+
+        # A separate task, so a disconnecting client does not cancel the send for the duplicates
+        task = asyncio.create_task(self._execute(key, request_hash, send, release_on))
+        self._inflight[key] = (request_hash, task)
+        return await asyncio.shield(task)
+
+    async def _execute(self, key, request_hash: str, send, release_on: tuple):
+        app_id, idempotency_key = key
+        try:
+            conn = await acquire_connection()
+            try:
+                existing = await IdempotencyRepository.claim(conn, app_id, idempotency_key, request_hash, self.lease)
+            finally:
+                await release_connection(conn)
+
+            if existing is not None:
+                stored_hash, response = existing
+                if stored_hash != request_hash:
+                    raise IdempotencyKeyReused("Idempotency-Key was already used with a different request")
+                if response is None:
+                    raise IdempotencyKeyInFlight("A request with this Idempotency-Key is still being processed")
+                self._remember(key, request_hash, response)
+                metrics.increment("idempotency.replayed")
+                return response, True
+
+            try:
+                conn = await acquire_connection()
+                try:
+                    response = await send(conn)
+                finally:
+                    await release_connection(conn)
+            except release_on:
+                conn = await acquire_connection()
+                try:
+                    await IdempotencyRepository.release(conn, app_id, idempotency_key)
+                finally:
+                    await release_connection(conn)
+                raise
+            except Exception as e:
+                # The email may be out: keep the claim so a retry is answered 409 instead of resending
+                logger.error(f"Send for idempotency key {idempotency_key!r} failed, keeping its claim: {e}", exc_info=True)
+                raise
+
+            # The email is out: from here on only a replay may answer this key
+            self._remember(key, request_hash, response)
+            try:
+                conn = await acquire_connection()
+                try:
+                    await IdempotencyRepository.complete(conn, app_id, idempotency_key, response, self.ttl)
+                finally:
+                    await release_connection(conn)
+            except Exception as e:
+                logger.error(f"Failed to store the response for idempotency key {idempotency_key!r}: {e}", exc_info=True)
+            return response, False
+        finally:
+            self._inflight.pop(key, None)
+
+    async def purge_expired(self) -> int:
+        """Delete expired keys from the table in batches; returns the number deleted"""
+        purged = 0
+        conn = await acquire_connection()
+        try:
+            while True:
+                deleted = await IdempotencyRepository.purge_expired(conn, self.cleanup_batch_size)
+                purged += deleted
+                if deleted < self.cleanup_batch_size:
+                    break
+        finally:
+            await release_connection(conn)
+        metrics.increment("idempotency.purged", purged)
+        return purged
+
+    async def _run(self):
+        while True:
+            try:
+                await self.purge_expired()
+            except Exception as e:
+                logger.error(f"Failed to purge expired idempotency keys: {e}", exc_info=True)
+            await asyncio.sleep(self.cleanup_interval)
+
+    def start(self):
+        """Start the periodic cleanup task on the running event loop"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="idempotency-cleanup")
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+
+idempotency_store = IdempotencyStore(
+    ttl=settings.IDEMPOTENCY_TTL_SECONDS,
+    lease=settings.IDEMPOTENCY_LEASE_SECONDS,
+    cache_size=settings.IDEMPOTENCY_CACHE_MAX_SIZE,
+    cleanup_interval=settings.IDEMPOTENCY_CLEANUP_INTERVAL_SECONDS,
+    cleanup_batch_size=settings.IDEMPOTENCY_CLEANUP_BATCH_SIZE,
+)
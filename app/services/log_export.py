@@ -0,0 +1,100 @@
+import asyncio
+import csv
+import io
+import json
+import logging
+import zlib
+
+from app.config import settings
+from app.database.database import acquire_connection, release_connection
+from app.repositories.email_repositories import EmailRepository
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+# Each export pins a pooled connection for its whole duration
+_export_slots = asyncio.Semaphore(settings.EXPORT_MAX_CONCURRENT)
+
+
+def _json_default(value):
+    return value.isoformat() if hasattr(value, "isoformat") else str(value)
+
+
+def _encode_ndjson(columns: list, rows: list) -> bytes:
+    return "".join(
+        json.dumps(dict(zip(columns, row)), default=_json_default) + "\n" for row in rows
+    ).encode("utf-8")
+
+
+def _encode_csv(columns: list, rows: list, header: bool) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(columns)
+    writer.writerows(
+        [value.isoformat() if hasattr(value, "isoformat") else value for value in row] for row in rows
+    )
+    return buffer.getvalue().encode("utf-8")
+
+
+def export_slot_available() -> bool:
+    return not _export_slots.locked()
+
+
+async def stream_export(export_format: str, columns: list, compress: bool = False, **filters):
+    """
+    Async generator producing an email log export as NDJSON or CSV chunks.
+
+    Rows come from an unbuffered server-side cursor, one fetch at a time, and the next
+    fetch only happens once the client has consumed the previous chunk, so memory use is
+    constant and a slow client slows the query down instead of filling buffers.
+    With compress=True the chunks are gzip-encoded incrementally.
+    """
+    compressor = zlib.compressobj(settings.GZIP_COMPRESS_LEVEL, zlib.DEFLATED, 31) if compress else None
+    rows_sent = 0
+
+    async with _export_slots:
+        conn = await acquire_connection()
+        completed = False
+        try:
+            async with conn.cursor() as cursor:
+                # A slow client must not trip the server's write timeout mid-stream
+                await cursor.execute("SET SESSION net_write_timeout = %s", (settings.EXPORT_NET_WRITE_TIMEOUT,))
+
+            if export_format == "csv":
+                chunk = _encode_csv(columns, [], header=True)
+                yield compressor.compress(chunk) if compressor else chunk
+
+            batches = EmailRepository.stream_email_logs(
+                conn, columns, settings.EXPORT_FETCH_SIZE, **filters
+            )
+            async for rows in batches:
+                if export_format == "csv":
+                    chunk = _encode_csv(columns, rows, header=False)
+                else:
+                    chunk = _encode_ndjson(columns, rows)
+                rows_sent += len(rows)
+                if compressor:
+                    chunk = compressor.compress(chunk)
+                    if not chunk:
+                        continue
+                yield chunk
+
+            if compressor:
+                yield compressor.flush()
+
+            async with conn.cursor() as cursor:
+                await cursor.execute("SET SESSION net_write_timeout = DEFAULT")
+            completed = True
+        finally:
+            if not completed:
+                # Client went away mid-export: drop the connection instead of draining the result set
+                conn.close()
+                logger.info(f"Email log export aborted after {rows_sent} rows")
+            await release_connection(conn)
+            metrics.increment("log_export.rows", rows_sent)
@@ -0,0 +1,109 @@
+import asyncio
+import logging
+import time
+
+from app.config import settings
+from app.database.database import acquire_connection, release_connection
+from app.repositories.email_repositories import EmailRepository
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class EmailLogWriter:
+    """Batches the final status write of email log rows.
+
+    The send path inserts its row synchronously (to get the row id) and hands the
+    outcome to this writer, which applies all pending outcomes, message_id
+    included, every EMAIL_LOG_FLUSH_INTERVAL_MS with one UPDATE ... CASE statement.
+    SES events that arrive before their message_id is written are held back by
+    the event buffer until it is, and a status set by an SES event is not
+    overwritten by a later flush. When the writer is not running (disabled, or
+    outside the app lifespan) updates are written immediately on the caller's
+    connection.
+    """
+
+    def __init__(self, flush_interval: float, max_batch: int):
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self._pending = {}
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    async def update(self, db, log_id: int, status: str, message_id: str = None,
+                     is_success: bool = True, error_message: str = None):
+        """Record the outcome of a send for the given email log row"""
+        update = {
+            "id": log_id,
+            "status": status,
+            "message_id": message_id,
+            "is_success": is_success,
+            "error_message": error_message,
+        }
+        if self._task is None:
+            await EmailRepository.update_email_logs(db, [update])
+            return
+
+        # Later outcomes for the same row replace earlier ones
+        self._pending[log_id] = update
+        metrics.set_gauge("email_log_writer.pending", len(self._pending))
+        if len(self._pending) >= self.max_batch:
+            self._wakeup.set()
+
+    async def flush(self):
+        """Write all pending updates now"""
+        if not self._pending:
+            return
+        updates, self._pending = list(self._pending.values()), {}
+        metrics.set_gauge("email_log_writer.pending", 0)
+
+        started_at = time.perf_counter()
+        conn = await acquire_connection()
+        try:
+            for offset in range(0, len(updates), self.max_batch):
+                await EmailRepository.update_email_logs(conn, updates[offset:offset + self.max_batch])
+        except BaseException:
+            # Put the batch back (without clobbering newer outcomes) and retry next flush
+            for update in updates:
+                self._pending.setdefault(update["id"], update)
+            raise
+        finally:
+            await release_connection(conn)
+        metrics.observe("email_log_writer.flush_seconds", time.perf_counter() - started_at)
+        metrics.observe("email_log_writer.flush_size", len(updates))
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Failed to flush email log updates: {e}", exc_info=True)
+
+    def start(self):
+        """Start the periodic flush task on the running event loop"""
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run(), name="email-log-writer")
+
+    async def stop(self):
+        """Stop the flush task and write whatever is still pending"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"Failed to flush email log updates on shutdown: {e}", exc_info=True)
+
+
+email_log_writer = EmailLogWriter(
+    flush_interval=settings.EMAIL_LOG_FLUSH_INTERVAL_MS / 1000,
+    max_batch=settings.EMAIL_LOG_FLUSH_MAX_BATCH,
+)
@@ -0,0 +1,50 @@
+import threading
+from collections import defaultdict
+
+
+class MetricsRegistry:
+    """Minimal in-process metrics registry (counters, gauges and timers).
+
+    Safe to update from executor threads as well as the event loop.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(float)
+        self._gauges = {}
+        self._timers = {}
+
+    def increment(self, name: str, value: float = 1):
+        """Increase a monotonically growing counter"""
+        with self._lock:
+            self._counters[name] += value
+
+    def set_gauge(self, name: str, value):
+        """Record the current value of something (queue depth, circuit state...)"""
+        with self._lock:
+            self._gauges[name] = value
+
+    def observe(self, name: str, value: float):
+        """Record one timing/size sample"""
+        with self._lock:
+            timer = self._timers.get(name)
+            if timer is None:
+                timer = self._timers[name] = {"count": 0, "sum": 0.0, "max": 0.0}
+            timer["count"] += 1
+            timer["sum"] += value
+            timer["max"] = max(timer["max"], value)
+
+    def snapshot(self):
+        """Return a JSON-serialisable copy of all metrics"""
+        with self._lock:
+            timers = {}
+            for name, timer in self._timers.items():
+                timers[name] = dict(timer, avg=timer["sum"] / timer["count"] if timer["count"] else 0.0)
+            return {
+                "counters": dict(self._counters),
+                "gauges": dict(self._gauges),
+                "timers": timers,
+            }
+
+
+metrics = MetricsRegistry()
@@ -0,0 +1,70 @@
+import asyncio
+import logging
+
+from app.config import settings
+from app.database.database import acquire_connection, release_connection, transaction
+from app.repositories.metrics_repositories import MetricsRepository, pending_rollup
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class MetricsRollupWriter:
+    """Applies the email_metrics_daily deltas recorded by the send paths in batches.
+
+    While running, the email_logs write paths only add their deltas to
+    pending_rollup; every METRICS_ROLLUP_FLUSH_INTERVAL_MS they are summed into one
+    multi-row upsert in a short transaction of its own, so concurrent sends of an
+    application no longer queue on its rollup row inside their insert transactions.
+    """
+
+    def __init__(self, flush_interval: float):
+        self.flush_interval = flush_interval
+        self._task = None
+
+    async def flush(self):
+        """Apply all pending deltas now"""
+        deltas = pending_rollup.take()
+        if not deltas:
+            return
+        conn = await acquire_connection()
+        try:
+            async with transaction(conn), conn.cursor() as cursor:
+                rows = await MetricsRepository.apply_deltas(cursor, deltas)
+        except BaseException:
+            # Keep the deltas (on top of newer ones) for the next flush
+            pending_rollup.add(deltas)
+            raise
+        finally:
+            await release_connection(conn)
+        metrics.observe("metrics_rollup.flush_size", rows)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Failed to flush metrics rollup deltas: {e}", exc_info=True)
+
+    def start(self):
+        """Start batching rollup deltas on the running event loop"""
+        if self._task is None:
+            pending_rollup.enabled = True
+            self._task = asyncio.create_task(self._run(), name="metrics-rollup-writer")
+
+    async def stop(self):
+        """Stop batching and apply whatever is still pending"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        pending_rollup.enabled = False
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"Failed to flush metrics rollup deltas on shutdown: {e}", exc_info=True)
+
+
+metrics_rollup_writer = MetricsRollupWriter(flush_interval=settings.METRICS_ROLLUP_FLUSH_INTERVAL_MS / 1000)
@@ -0,0 +1,189 @@
+import asyncio
+import logging
+import math
+
+from app.config import settings
+from app.database.database import acquire_connection, release_connection
+from app.models.email_models import EmailRequest
+from app.repositories.email_repositories import EmailRepository
+from app.services.metrics import metrics
+from app.services.ses_service import SESService
+from app.services.rate_limiter import send_rate_limiter, SendQuotaExceeded
+from app.services.ses_resilience import SESSendError, PERMANENT, CIRCUIT_OPEN, ses_circuit_breaker
+from app.services.suppression import suppression_list, RecipientsSuppressed
+
+logger = logging.getLogger(__name__)
+
+
+class OutboxWorker:
+    """Pool of background tasks draining queued emails from the email_logs outbox.
+
+    Each task claims a batch of rows with SELECT ... FOR UPDATE SKIP LOCKED, so any
+    number of tasks across any number of API nodes can share the same queue
+    without sending an email twice.
+
+    Failed attempts are requeued with exponential backoff (next_attempt_at), and
+    nothing is claimed while the SES circuit is open, so an outage does not burn
+    through OUTBOX_MAX_ATTEMPTS in a tight loop.
+    """
+
+    def __init__(self, concurrency: int, batch_size: int, poll_interval: float):
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self._tasks = []
+        self._stopping = asyncio.Event()
+
+    def start(self):
+        """Start the worker tasks on the running event loop"""
+        if self._tasks:
+            return
+        self._stopping = asyncio.Event()
+        self._tasks = [
+            asyncio.create_task(self._run(index), name=f"outbox-worker-{index}")
+            for index in range(self.concurrency)
+        ]
+        logger.info(f"Started {self.concurrency} outbox workers")
+
+    async def stop(self, timeout: float = 30):
+        """Ask workers to finish their current batch, then cancel any stragglers"""
+        if not self._tasks:
+            return
+        self._stopping.set()
+        done, pending = await asyncio.wait(self._tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        self._tasks = []
+        logger.info("Stopped outbox workers")
+
+    async def _run(self, index: int):
+        while not self._stopping.is_set():
+            try:
+                sent = await self.process_batch()
+            except Exception as e:
+                logger.error(f"Outbox worker {index} failed to process a batch: {e}", exc_info=True)
+                sent = 0
+
+            # Go straight on only while batches make progress
+            if not sent:
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def process_batch(self) -> int:
+        """Claim and send one batch of queued emails; returns the number of emails sent"""
+        if not send_rate_limiter.can_send_bulk(self.batch_size):
+            # Leave queued mail in the outbox until the 24h quota allows bulk traffic again
+            return 0
+        if ses_circuit_breaker.is_open():
+            # Claiming now would only defer every row again
+            return 0
+
+        conn = await acquire_connection()
+        try:
+            rows = await EmailRepository.claim_queued_emails(
+                conn, self.batch_size, settings.OUTBOX_CLAIM_TIMEOUT_SECONDS
+            )
+        finally:
+            await release_connection(conn)
+
+        if not rows:
+            return 0
+
+        metrics.increment("outbox.claimed", len(rows))
+        outcomes = await asyncio.gather(*(self._send(*row) for row in rows))
+        await self._record([dict(outcome, id=row[0]) for row, outcome in zip(rows, outcomes)])
+        return sum(1 for outcome in outcomes if outcome["status"] == "Sent")
+
+    async def _record(self, updates: list):
+        """
+        Write the outcomes of a batch. If the batched UPDATE fails, fall back to one row at
+        a time, sent rows first: a sent row left 'Sending' would be reclaimed and sent again.
+        """
+        conn = await acquire_connection()
+        try:
+            try:
+                await EmailRepository.update_email_logs(conn, updates)
+                return
+            except Exception as e:
+                logger.error(f"Failed to record {len(updates)} outbox outcomes, retrying row by row: {e}", exc_info=True)
+
+            for update in sorted(updates, key=lambda update: update["status"] != "Sent"):
+                try:
+                    await EmailRepository.update_email_logs(conn, [update])
+                except Exception as e:
+                    metrics.increment("outbox.unrecorded")
+                    logger.error(
+                        f"Failed to record outbox email {update['id']} as {update['status']} "
+                        f"(message_id={update.get('message_id')}): {e}"
+                    )
+        finally:
+            await release_connection(conn)
+
+    @staticmethod
+    def retry_delay(attempts: int, retry_after: float = None) -> int:
+        """Seconds before a row that failed `attempts` times is retried, at least what SES asked for"""
+        delay = min(settings.OUTBOX_RETRY_MAX_SECONDS, settings.OUTBOX_RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+        return math.ceil(max(delay, retry_after or 0))
+
+    @staticmethod
+    def _requeue(error: Exception, attempts: int, retry_after: float = None) -> dict:
+        return {
+            "status": "Queued", "is_success": True, "error_message": str(error),
+            "retry_in": OutboxWorker.retry_delay(attempts, retry_after)
+        }
+
+    @staticmethod
+    def _defer(error: Exception, retry_after: float = None) -> dict:
+        """Requeue without counting the attempt: the email never reached SES"""
+        return {
+            "status": "Queued", "is_success": True, "error_message": str(error),
+            "retry_in": OutboxWorker.retry_delay(1, retry_after), "deferred": True
+        }
+
+    async def _send(self, log_id: int, payload: str, attempts: int) -> dict:
+        try:
+            email_request = EmailRequest.model_validate_json(payload)
+            to_send, _ = await suppression_list.filter_request(email_request)
+            message_id = await SESService.deliver(to_send, bulk=True)
+            metrics.increment("outbox.sent")
+            return {"status": "Sent", "message_id": message_id, "is_success": True}
+        except RecipientsSuppressed as e:
+            metrics.increment("outbox.suppressed")
+            return {"status": "Suppressed", "is_success": False, "error_message": str(e)}
+        except SendQuotaExceeded as e:
+            metrics.increment("outbox.deferred")
+            return self._defer(e)
+        except SESSendError as e:
+            if e.kind == CIRCUIT_OPEN:
+                metrics.increment("outbox.deferred")
+                return self._defer(e, e.retry_after)
+            if e.kind != PERMANENT and attempts < settings.OUTBOX_MAX_ATTEMPTS:
+                metrics.increment("outbox.requeued")
+                logger.warning(f"Outbox email {log_id} attempt {attempts} failed ({e.kind}), requeueing: {e}")
+                return self._requeue(e, attempts, e.retry_after)
+            metrics.increment("outbox.failed")
+            logger.error(f"Outbox email {log_id} failed after {attempts} attempts ({e.kind}): {e}")
+            return {"status": "Failed", "is_success": False, "error_message": str(e)}
+        except ValueError as e:
+            metrics.increment("outbox.failed")
+            logger.error(f"Outbox email {log_id} has an invalid payload: {e}")
+            return {"status": "Failed", "is_success": False, "error_message": f"Invalid payload: {e}"}
+        except Exception as e:
+            # Anything else (e.g. a database error in the suppression lookup) fails only this row
+            if attempts < settings.OUTBOX_MAX_ATTEMPTS:
+                metrics.increment("outbox.requeued")
+                logger.warning(f"Outbox email {log_id} attempt {attempts} failed unexpectedly, requeueing: {e}")
+                return self._requeue(e, attempts)
+            metrics.increment("outbox.failed")
+            logger.error(f"Outbox email {log_id} failed after {attempts} attempts: {e}", exc_info=True)
+            return {"status": "Failed", "is_success": False, "error_message": str(e)}
+
+
+outbox_worker = OutboxWorker(
+    concurrency=settings.OUTBOX_WORKERS,
+    batch_size=settings.OUTBOX_BATCH_SIZE,
+    poll_interval=settings.OUTBOX_POLL_INTERVAL_SECONDS,
+)
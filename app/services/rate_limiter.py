@@ -0,0 +1,149 @@
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+
+from app.config import settings
+from app.database.database import acquire_connection, release_connection
+from app.repositories.rate_lease_repositories import RateLeaseRepository
+from app.services.metrics import metrics
+from app.services.ses_transport import get_ses_transport
+
+logger = logging.getLogger(__name__)
+
+
+class SendQuotaExceeded(Exception):
+    """Raised when bulk traffic is shed to keep the rest of the 24h SES quota for transactional email"""
+
+
+class SendRateLimiter:
+    """Token-bucket limiter smoothing SES sends to the account's MaxSendRate.
+
+    The account rate comes from SES GetSendQuota and is split evenly between all
+    live processes, which announce themselves through short leases in the
+    ses_rate_leases table. Callers wait for tokens instead of being throttled
+    by SES. The 24h quota is tracked as well so bulk traffic can be shed before
+    it eats the allowance needed for transactional email.
+    """
+
+    def __init__(self):
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.account_rate = settings.SES_DEFAULT_MAX_SEND_RATE
+        self.active_workers = 1
+        self.max_24h_send = None
+        self.sent_last_24h = 0.0
+        self._sent_since_refresh = 0
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+        self._task = None
+
+    @property
+    def rate(self) -> float:
+        """Sends per second allowed for this process"""
+        return max(self.account_rate / self.active_workers, 0.01)
+
+    @property
+    def capacity(self) -> float:
+        """Maximum burst: one second's worth of sends"""
+        return max(self.rate, 1.0)
+
+    @property
+    def remaining_quota(self):
+        """Estimated sends left in the 24h window, or None if unknown/unlimited"""
+        if self.max_24h_send is None or self.max_24h_send < 0:
+            return None
+        return max(0.0, self.max_24h_send - self.sent_last_24h - self._sent_since_refresh)
+
+    def can_send_bulk(self, count: int = 1) -> bool:
+        """Whether bulk traffic of `count` recipients fits outside the transactional reserve"""
+        remaining = self.remaining_quota
+        if remaining is None:
+            return True
+        return remaining - count >= self.max_24h_send * settings.SES_BULK_QUOTA_RESERVE
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    async def acquire(self, count: int = 1, bulk: bool = False):
+        """Wait until `count` recipients may be sent (SES counts each recipient against the rate)"""
+        if not settings.SES_RATE_LIMIT_ENABLED:
+            return
+
+        if bulk and not self.can_send_bulk(count):
+            metrics.increment("ses_rate_limiter.bulk_shed")
+            raise SendQuotaExceeded("Remaining 24h SES quota is reserved for transactional email")
+
+        started_at = time.perf_counter()
+        # Waiters queue on the lock, so tokens are handed out in arrival order
+        async with self._lock:
+            self._refill()
+            # Requests larger than the bucket wait for a full bucket and go into debt
+            needed = min(count, self.capacity)
+            while self._tokens < needed:
+                await asyncio.sleep((needed - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= count
+            self._sent_since_refresh += count
+
+        metrics.observe("ses_rate_limiter.wait_seconds", time.perf_counter() - started_at)
+
+    async def refresh(self):
+        """Reload MaxSendRate/24h quota from SES and renew this process's lease"""
+        try:
+            quota = await get_ses_transport().call("GetSendQuota", {})
+            self.account_rate = float(quota["MaxSendRate"])
+            self.max_24h_send = float(quota["Max24HourSend"])
+            self.sent_last_24h = float(quota["SentLast24Hours"])
+            self._sent_since_refresh = 0
+        except Exception as e:
+            logger.warning(f"Could not refresh SES send quota, keeping previous values: {e}")
+
+        try:
+            conn = await acquire_connection()
+            try:
+                self.active_workers = await RateLeaseRepository.renew_lease(
+                    conn, self.worker_id, settings.SES_RATE_LEASE_TTL_SECONDS
+                )
+            finally:
+                await release_connection(conn)
+        except Exception as e:
+            logger.warning(f"Could not renew SES rate lease, keeping {self.active_workers} workers: {e}")
+
+        metrics.set_gauge("ses_rate_limiter.account_rate", self.account_rate)
+        metrics.set_gauge("ses_rate_limiter.process_rate", self.rate)
+        metrics.set_gauge("ses_rate_limiter.active_workers", self.active_workers)
+        metrics.set_gauge("ses_rate_limiter.remaining_quota", self.remaining_quota)
+
+    async def _run(self):
+        while True:
+            await self.refresh()
+            await asyncio.sleep(settings.SES_QUOTA_REFRESH_SECONDS)
+
+    def start(self):
+        """Start periodic quota/lease refresh on the running event loop"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="ses-rate-limiter")
+
+    async def stop(self):
+        """Stop refreshing and give up this process's lease"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        try:
+            conn = await acquire_connection()
+            try:
+                await RateLeaseRepository.release_lease(conn, self.worker_id)
+            finally:
+                await release_connection(conn)
+        except Exception as e:
+            logger.warning(f"Could not release SES rate lease: {e}")
+
+
+send_rate_limiter = SendRateLimiter()
@@ -0,0 +1,108 @@
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+
+from app.config import settings
+from app.services.metrics import metrics
+
+
+class CachedResponse:
+    """A serialized JSON response body with its validators"""
+
+    def __init__(self, body: bytes, etag: str, last_modified: float, expires_at: float):
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.expires_at = expires_at
+
+    @property
+    def headers(self) -> dict:
+        return {
+            "ETag": self.etag,
+            "Last-Modified": formatdate(self.last_modified, usegmt=True),
+            "Cache-Control": "private, no-cache",
+        }
+
+    def not_modified(self, if_none_match: str = None, if_modified_since: str = None) -> bool:
+        """Evaluate conditional request headers (If-None-Match takes precedence)"""
+        if if_none_match:
+            # Weak comparison: GZip may re-encode the body, so the ETag is weak anyway
+            tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+            return "*" in tags or self.etag.removeprefix("W/") in tags
+        if if_modified_since:
+            try:
+                return int(self.last_modified) <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+
+class ResponseCache:
+    """Short-TTL LRU cache of JSON responses with single-flight computation.
+
+    Concurrent requests for the same key while it is being computed wait on the
+    same task instead of each running the query. When an expired entry is
+    recomputed with an identical body, its Last-Modified is kept so clients
+    polling with If-Modified-Since still get 304s.
+    """
+
+    def __init__(self, name: str, ttl: float, max_size: int):
+        self.name = name
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._inflight = {}
+
+    async def get_or_compute(self, key, compute) -> CachedResponse:
+        """Return the cached response for key, or await compute() (a coroutine function) once to fill it"""
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires_at > time.monotonic():
+            self._entries.move_to_end(key)
+            metrics.increment(f"{self.name}_cache.hits")
+            return entry
+
+        task = self._inflight.get(key)
+        if task is None:
+            metrics.increment(f"{self.name}_cache.misses")
+            # A separate task, so a disconnecting client does not cancel the query for the others
+            task = asyncio.create_task(self._fill(key, entry, compute))
+            self._inflight[key] = task
+        else:
+            metrics.increment(f"{self.name}_cache.coalesced")
+        return await asyncio.shield(task)
+
+    async def _fill(self, key, previous, compute) -> CachedResponse:
+        try:
+            entry = self._build(previous, await compute())
+            self._store(key, entry)
+            return entry
+        finally:
+            self._inflight.pop(key, None)
+
+    def _build(self, previous, payload) -> CachedResponse:
+        body = json.dumps(payload, separators=(",", ":"), default=str).encode("utf-8")
+        etag = f'W/"{hashlib.sha256(body).hexdigest()[:32]}"'
+        last_modified = previous.last_modified if previous is not None and previous.etag == etag else time.time()
+        return CachedResponse(body, etag, last_modified, time.monotonic() + self.ttl)
+
+    def _store(self, key, entry: CachedResponse):
+        if self.max_size <= 0 or self.ttl <= 0:
+            return
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self):
+        """Drop every cached response"""
+        self._entries.clear()
+
+
+metrics_response_cache = ResponseCache(
+    name="email_metrics",
+    ttl=settings.METRICS_CACHE_TTL_SECONDS,
+    max_size=settings.METRICS_CACHE_MAX_SIZE,
+)
@@ -0,0 +1,173 @@
+import asyncio
+import logging
+import random
+import time
+
+from botocore.exceptions import (
+    BotoCoreError, ClientError, ConnectionClosedError, ConnectTimeoutError, EndpointConnectionError,
+    HTTPClientError, ReadTimeoutError
+)
+
+from app.config import settings
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+THROTTLE = "throttle"
+TRANSIENT = "transient"
+PERMANENT = "permanent"
+CIRCUIT_OPEN = "circuit_open"
+
+THROTTLE_ERROR_CODES = {
+    "Throttling", "ThrottlingException", "TooManyRequestsException", "RequestThrottled",
+}
+TRANSIENT_ERROR_CODES = {
+    "ServiceUnavailable", "ServiceUnavailableException", "InternalFailure", "InternalError",
+    "InternalServerError", "RequestTimeout", "RequestTimeoutException",
+}
+# HTTPClientError covers other connection-level failures; botocore's own retries treat it as retryable
+TRANSIENT_BOTOCORE_ERRORS = (
+    ConnectionClosedError, ConnectTimeoutError, EndpointConnectionError, ReadTimeoutError, HTTPClientError,
+)
+
+
+class SESSendError(Exception):
+    """An SES call that failed after classification and retries"""
+
+    def __init__(self, kind: str, message: str, retry_after: float = None):
+        super().__init__(message)
+        self.kind = kind
+        self.retry_after = retry_after
+
+
+def classify_error(error: Exception) -> str:
+    """Classify an SES/botocore error as throttle, transient or permanent"""
+    if isinstance(error, ClientError):
+        code = error.response.get("Error", {}).get("Code", "")
+        message = error.response.get("Error", {}).get("Message", "")
+        status = error.response.get("ResponseMetadata", {}).get("HTTPStatusCode") or 0
+        if code in THROTTLE_ERROR_CODES:
+            # Running out of the 24h quota will not be fixed by retrying in a few seconds
+            return PERMANENT if "daily message quota" in message.lower() else THROTTLE
+        if code in TRANSIENT_ERROR_CODES or status >= 500:
+            return TRANSIENT
+        return PERMANENT
+    if isinstance(error, TRANSIENT_BOTOCORE_ERRORS):
+        return TRANSIENT
+    return PERMANENT
+
+
+class CircuitBreaker:
+    """Fails fast while SES is degraded.
+
+    Opens after `failure_threshold` consecutive transient failures, rejects calls
+    for `reset_timeout` seconds, then lets a single probe through (half-open);
+    the probe's outcome closes or re-opens the circuit.
+    """
+
+    STATE_VALUES = {"closed": 0, "half_open": 1, "open": 2}
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+    def _set_state(self, state: str):
+        if state != self.state:
+            logger.warning(f"Circuit {self.name} {self.state} -> {state}")
+            self.state = state
+            metrics.increment(f"{self.name}_circuit.transitions.{state}")
+        metrics.set_gauge(f"{self.name}_circuit.state", self.STATE_VALUES[state])
+
+    def retry_after(self) -> float:
+        """Seconds until the circuit will allow a probe"""
+        return max(0.0, self._opened_at + self.reset_timeout - time.monotonic())
+
+    def is_open(self) -> bool:
+        """Whether calls are being rejected; unlike allow_request, never takes the probe slot"""
+        return self.state == "open" and self.retry_after() > 0
+
+    def allow_request(self) -> bool:
+        if self.state == "open":
+            if self.retry_after() > 0:
+                return False
+            self._set_state("half_open")
+        if self.state == "half_open":
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+        return True
+
+    def record_success(self):
+        self._failures = 0
+        self._probe_in_flight = False
+        self._set_state("closed")
+
+    def record_failure(self):
+        self._failures += 1
+        self._probe_in_flight = False
+        if self.state == "half_open" or self._failures >= self.failure_threshold:
+            self._opened_at = time.monotonic()
+            self._set_state("open")
+
+    def record_neutral(self):
+        """Outcome that says nothing about SES health (e.g. throttling); frees a probe slot"""
+        self._probe_in_flight = False
+
+
+ses_circuit_breaker = CircuitBreaker(
+    "ses",
+    failure_threshold=settings.SES_CIRCUIT_FAILURE_THRESHOLD,
+    reset_timeout=settings.SES_CIRCUIT_RESET_SECONDS,
+)
+
+
+def backoff_delay(attempt: int) -> float:
+    """Exponential backoff with full jitter for the given (1-based) attempt"""
+    ceiling = min(settings.SES_RETRY_MAX_DELAY, settings.SES_RETRY_BASE_DELAY * (2 ** (attempt - 1)))
+    return random.uniform(0, ceiling)
+
+
+async def call_with_retry(operation, breaker: CircuitBreaker = ses_circuit_breaker):
+    """
+    Await operation() with bounded, jittered retries for throttling and transient errors.
+    Raises SESSendError (kind throttle/transient/permanent/circuit_open) once it gives up.
+    """
+    max_attempts = max(1, settings.SES_RETRY_MAX_ATTEMPTS)
+    for attempt in range(1, max_attempts + 1):
+        if not breaker.allow_request():
+            metrics.increment(f"{breaker.name}.errors.{CIRCUIT_OPEN}")
+            raise SESSendError(CIRCUIT_OPEN, "SES is temporarily unavailable (circuit open)",
+                               retry_after=breaker.retry_after() or breaker.reset_timeout)
+
+        try:
+            result = await operation()
+        except (ClientError, BotoCoreError) as e:
+            kind = classify_error(e)
+            if kind == TRANSIENT:
+                breaker.record_failure()
+            elif kind == PERMANENT:
+                breaker.record_success()  # SES answered; the request itself was bad
+            else:
+                breaker.record_neutral()
+
+            if kind == PERMANENT or attempt == max_attempts:
+                metrics.increment(f"{breaker.name}.errors.{kind}")
+                retry_after = None if kind == PERMANENT else backoff_delay(attempt + 1) or settings.SES_RETRY_BASE_DELAY
+                raise SESSendError(kind, str(e), retry_after=retry_after) from e
+
+            delay = backoff_delay(attempt)
+            metrics.increment(f"{breaker.name}.retries.{kind}")
+            logger.info(f"Retrying {breaker.name} call after {kind} error (attempt {attempt}/{max_attempts}, "
+                        f"sleeping {delay:.2f}s): {e}")
+            await asyncio.sleep(delay)
+        except BaseException:
+            breaker.record_neutral()
+            raise
+        else:
+            breaker.record_success()
+            return result
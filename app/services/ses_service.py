@@ -1,35 +1,48 @@
-import boto3
+import asyncio
+import json
 import logging
-from botocore.exceptions import ClientError
+import uuid
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from email.policy import SMTP
+from email.utils import formataddr
+from typing import List
 from sqlalchemy.orm import Session
 from fastapi import HTTPException
-from app.models.email_models import EmailRequest
+from app.models.email_models import (
+    BatchEmailRequest, EmailContent, EmailRecipient, EmailRequest, EmailTemplateRequest
+)
 from app.repositories.email_repositories import EmailRepository
+from app.repositories.recipient_repositories import RecipientRepository
 from app.config import settings
+from app.services.aws_clients import get_aws_client
+from app.services.ses_transport import get_ses_transport
+from app.services.rate_limiter import send_rate_limiter, SendQuotaExceeded
+from app.services.ses_resilience import call_with_retry, SESSendError, PERMANENT
+from app.services.log_writer import email_log_writer
+from app.services.metrics import metrics
+from app.services.suppression import suppression_list, RecipientsSuppressed
+from app.services.templates import template_store, TemplateRenderError
+from app.services.ses_templates import ses_template_sync
+from app.services.attachments import attachment_store, AttachmentError
 
 logger = logging.getLogger(__name__)
 
+# Most destinations SES accepts in one SendBulkTemplatedEmail call
+SES_BULK_MAX_DESTINATIONS = 50
+
 class SESService:
     """AWS SES service for sending emails"""
     
     @staticmethod
     def get_ses_client():
-        """Create and return an Amazon SES client"""
-        return boto3.client(
-            'ses',
-            aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-            aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-            region_name=settings.AWS_REGION
-        )
+        """Return the shared Amazon SES client"""
+        return get_aws_client('ses', endpoint_url=settings.SES_ENDPOINT_URL or None)
+
     @staticmethod
     def get_sns_client():
-        """Create and return an Amazon SNS client"""
-        return boto3.client(
-            'sns',
-            aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-            aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-            region_name=settings.AWS_REGION
-        )
+        """Return the shared Amazon SNS client"""
+        return get_aws_client('sns')
     
     @staticmethod
     def setup_real_time_tracking():
@@ -101,95 +114,410 @@ class SESService:
             logger.error(f"Error setting up real-time tracking: {e}")
             raise HTTPException(status_code=500, detail=f"Setup failed: {str(e)}")
         
+    @staticmethod
+    def build_message(email_request: EmailRequest) -> dict:
+        """Build the SES SendEmail parameters for an email request"""
+        # Format sender
+        sender = f"{email_request.sender_name} <{email_request.sender}>" if email_request.sender_name else email_request.sender
+        
+        # Prepare the message
+        message = {
+            'Source': sender,
+            'Destination': {
+                'ToAddresses': [recipient.email for recipient in email_request.recipients],
+            },
+            'Message': {
+                'Subject': {
+                    'Data': email_request.content.subject,
+                    'Charset': 'UTF-8'
+                },
+                'Body': {
+                    'Text': {
+                        'Data': email_request.content.body_text,
+                        'Charset': 'UTF-8'
+                    }
+                }
+            },
+            'ConfigurationSetName': "my-first-configuration-set"
+        }
+        
+        # Add HTML body if provided
+        if email_request.content.body_html:
+            message['Message']['Body']['Html'] = {
+                'Data': email_request.content.body_html,
+                'Charset': 'UTF-8'
+            }
+        
+        # Add CC if provided
+        if email_request.cc:
+            message['Destination']['CcAddresses'] = [recipient.email for recipient in email_request.cc]
+        
+        # Add BCC if provided
+        if email_request.bcc:
+            message['Destination']['BccAddresses'] = [recipient.email for recipient in email_request.bcc]
+        
+        # Add Reply-To if provided
+        if email_request.reply_to:
+            message['ReplyToAddresses'] = email_request.reply_to
+        
+        return message
+
+    @staticmethod
+    def _header(name: str, value: str) -> bytes:
+        # RFC 2047-encodes non-ASCII values and folds long lines
+        return SMTP.fold_binary(*SMTP.header_store_parse(name, value))
+
+    @staticmethod
+    def build_raw_message(email_request: EmailRequest, attachments: list) -> list:
+        """
+        Build the MIME message of an email with attachments, as a list of byte segments.
+        The attachment segments are the shared, already encoded content from the attachment
+        store; deliver() joins everything once, right before the SendRawEmail call.
+        Bcc recipients appear only in the SES Destinations, never in the headers.
+        """
+        header = SESService._header
+        boundary = f"=_{uuid.uuid4().hex}"
+        headers = [header("From", formataddr((email_request.sender_name, email_request.sender)))]
+        headers.append(header("To", ", ".join(
+            formataddr((recipient.name, recipient.email)) for recipient in email_request.recipients
+        )))
+        if email_request.cc:
+            headers.append(header("Cc", ", ".join(
+                formataddr((recipient.name, recipient.email)) for recipient in email_request.cc
+            )))
+        if email_request.reply_to:
+            headers.append(header("Reply-To", ", ".join(email_request.reply_to)))
+        headers.append(header("Subject", email_request.content.subject))
+        headers.append(b"MIME-Version: 1.0\r\n")
+        headers.append(f'Content-Type: multipart/mixed; boundary="{boundary}"\r\n\r\n'.encode("ascii"))
+
+        text = MIMEText(email_request.content.body_text, "plain", "utf-8")
+        if email_request.content.body_html:
+            body = MIMEMultipart("alternative")
+            body.attach(text)
+            body.attach(MIMEText(email_request.content.body_html, "html", "utf-8"))
+        else:
+            body = text
+        del body["MIME-Version"]
+
+        delimiter = f"--{boundary}\r\n".encode("ascii")
+        segments = headers + [delimiter, body.as_bytes(policy=SMTP), b"\r\n"]
+        for part in attachments:
+            segments += [delimiter, part.headers, part.body]
+        segments.append(f"--{boundary}--\r\n".encode("ascii"))
+        return segments
+
+    @staticmethod
+    async def build_raw_params(email_request: EmailRequest) -> tuple:
+        """
+        Build the SES SendRawEmail parameters (without RawMessage) and the message segments
+        for an email with attachments. Unusable attachments and oversized messages are
+        permanent failures.
+        """
+        try:
+            attachments = await attachment_store.parts(email_request.app_id, email_request.attachments)
+        except AttachmentError as e:
+            raise SESSendError(PERMANENT, str(e)) from e
+
+        segments = SESService.build_raw_message(email_request, attachments)
+        size = sum(len(segment) for segment in segments)
+        if size > settings.SES_RAW_MESSAGE_MAX_BYTES:
+            raise SESSendError(
+                PERMANENT, f"Message is {size} bytes, over the {settings.SES_RAW_MESSAGE_MAX_BYTES} byte limit"
+            )
+
+        destinations = [recipient.email for recipient in email_request.recipients]
+        destinations += [recipient.email for recipient in email_request.cc or []]
+        destinations += [recipient.email for recipient in email_request.bcc or []]
+        params = {
+            'Source': formataddr((email_request.sender_name, email_request.sender)),
+            'Destinations': destinations,
+            'ConfigurationSetName': "my-first-configuration-set"
+        }
+        return params, segments
+
+    @staticmethod
+    def count_recipients(email_request: EmailRequest) -> int:
+        """Number of recipients SES counts against the send rate and quota"""
+        return len(email_request.recipients) + len(email_request.cc or []) + len(email_request.bcc or [])
+
+    @staticmethod
+    async def deliver(email_request: EmailRequest, bulk: bool = False) -> str:
+        """
+        Send an email through the configured SES transport and return the SES message id.
+        Waits for the account-wide send rate; bulk sends may be shed with SendQuotaExceeded
+        when the remaining 24h quota is reserved for transactional email.
+        Throttling and transient errors are retried with jittered backoff; once retries are
+        exhausted (or the circuit is open) an SESSendError carrying the error kind is raised.
+        Emails with attachments go out as raw MIME through SendRawEmail.
+        """
+        segments = None
+        if email_request.attachments:
+            message, segments = await SESService.build_raw_params(email_request)
+        else:
+            message = SESService.build_message(email_request)
+        recipient_count = SESService.count_recipients(email_request)
+
+        async def attempt():
+            await send_rate_limiter.acquire(recipient_count, bulk=bulk)
+            if segments is None:
+                return await get_ses_transport().call("SendEmail", message)
+            # Joined only once the send is let through: waiting messages hold just the shared parts
+            raw = {**message, 'RawMessage': {'Data': b"".join(segments)}}
+            return await get_ses_transport().call("SendRawEmail", raw)
+
+        response = await call_with_retry(attempt)
+        return response['MessageId']
+
     @staticmethod
     async def send_email(email_request: EmailRequest, db: Session):
         """Send email using AWS SES service and log the operation"""
         print("Setting up real-time tracking...")
         # SESService.setup_real_time_tracking()
+        email_request = await template_store.render_request(email_request)
+        if email_request.attachments:
+            # Unknown attachment ids are a client error, reported before anything is logged
+            await attachment_store.resolve(email_request.app_id, email_request.attachments)
+        # Drop hard-bounced/complained addresses before paying SES for them
         try:
-            # Log the email sending attempt
-            email_log = await EmailRepository.create_email_log(
-                db=db, 
-                email_request=email_request,
-                message_id=0,
-                status="Sending"
-            )
-            
-            ses_client = SESService.get_ses_client()
-            
-            # Format sender
-            sender = f"{email_request.sender_name} <{email_request.sender}>" if email_request.sender_name else email_request.sender
-            
-            # Prepare the message
-            message = {
-                'Source': sender,
-                'Destination': {
-                    'ToAddresses': [recipient.email for recipient in email_request.recipients],
-                },
-                'Message': {
-                    'Subject': {
-                        'Data': email_request.content.subject,
-                        'Charset': 'UTF-8'
-                    },
-                    'Body': {
-                        'Text': {
-                            'Data': email_request.content.body_text,
-                            'Charset': 'UTF-8'
-                        }
-                    }
-                },
-                'ConfigurationSetName': "my-first-configuration-set"
-            }
-            
-            # Add HTML body if provided
-            if email_request.content.body_html:
-                message['Message']['Body']['Html'] = {
-                    'Data': email_request.content.body_html,
-                    'Charset': 'UTF-8'
-                }
-            
-            # Add CC if provided
-            if email_request.cc:
-                message['Destination']['CcAddresses'] = [recipient.email for recipient in email_request.cc]
-            
-            # Add BCC if provided
-            if email_request.bcc:
-                message['Destination']['BccAddresses'] = [recipient.email for recipient in email_request.bcc]
-            
-            # Add Reply-To if provided
-            if email_request.reply_to:
-                message['ReplyToAddresses'] = email_request.reply_to
-            
-            # Send the email
-            response = ses_client.send_email(**message)
-            message_id = response['MessageId']
-            
-            # Update the email log with success information
+            to_send, suppressed = await suppression_list.filter_request(email_request)
+        except RecipientsSuppressed as e:
             await EmailRepository.create_email_log(
                 db=db,
                 email_request=email_request,
-                message_id=message_id,
-                status="Sent",
-                is_success=True
+                status="Suppressed",
+                is_success=False,
+                error_message=str(e)
             )
-            
-            return {
-                "message_id": message_id,
-                "status": "Email sent successfully"
-            }
+            raise
+
+        # Log the email sending attempt; the outcome updates this same row
+        log_id = await EmailRepository.create_email_log(
+            db=db, 
+            email_request=email_request,
+            status="Sending",
+            suppressed=suppressed
+        )
         
-        except ClientError as e:
-            error_message = str(e)
-            
-            # Log the failure
-            if 'email_log' in locals():
-                await EmailRepository.create_email_log(
-                    db=db,
-                    email_request=email_request,
-                    message_id=0,
+        try:
+            # Send the email
+            message_id = await SESService.deliver(to_send)
+        
+        except SESSendError as e:
+            # Log the failure; a logging error must not hide that nothing was sent
+            try:
+                await email_log_writer.update(
+                    db,
+                    log_id,
                     status="Failed",
                     is_success=False,
-                    error_message=error_message
+                    error_message=str(e)
                 )
-            
-            raise Exception(f"Failed to send email: {error_message}")
\ No newline at end of file
+            except Exception as log_error:
+                logger.error(f"Failed to log the failure of email log {log_id}: {log_error}", exc_info=True)
+            raise
+        
+        # Update the email log with success information. The email is out at this point,
+        # so a logging error is reported but the send still succeeds.
+        try:
+            await email_log_writer.update(
+                db,
+                log_id,
+                status="Sent",
+                message_id=message_id,
+                is_success=True
+            )
+        except Exception as e:
+            logger.error(f"Failed to log message {message_id} as sent (email log {log_id}): {e}", exc_info=True)
+        
+        return {
+            "message_id": message_id,
+            "status": "Email sent successfully"
+        }
+
+    @staticmethod
+    async def send_batch(email_requests: List[EmailRequest], db: Session) -> List[dict]:
+        """
+        Send many emails concurrently (at most BATCH_SEND_CONCURRENCY in flight)
+        and log all of them with a single multi-row INSERT
+        """
+        email_requests = await template_store.render_requests(email_requests)
+        semaphore = asyncio.Semaphore(settings.BATCH_SEND_CONCURRENCY)
+        suppressed = [None] * len(email_requests)
+
+        async def send_one(index: int, email_request: EmailRequest) -> dict:
+            async with semaphore:
+                try:
+                    to_send, suppressed[index] = await suppression_list.filter_request(email_request)
+                    message_id = await SESService.deliver(to_send, bulk=True)
+                    return {"index": index, "message_id": message_id, "status": "Sent", "error": None}
+                except RecipientsSuppressed as e:
+                    return {"index": index, "message_id": None, "status": "Suppressed", "error": str(e)}
+                except (SESSendError, SendQuotaExceeded) as e:
+                    logger.warning(f"Batch item {index} failed: {e}")
+                    return {"index": index, "message_id": None, "status": "Failed", "error": str(e)}
+                except Exception as e:
+                    # E.g. a database error in the suppression lookup: fail this item, keep the others
+                    logger.error(f"Batch item {index} failed unexpectedly: {e}", exc_info=True)
+                    return {"index": index, "message_id": None, "status": "Failed", "error": str(e)}
+
+        results = await asyncio.gather(*(
+            send_one(index, email_request) for index, email_request in enumerate(email_requests)
+        ))
+
+        await SESService.log_batch_results(db, [
+            {
+                "email_request": email_request,
+                "message_id": result["message_id"],
+                "status": result["status"],
+                "is_success": result["status"] == "Sent",
+                "error_message": result["error"],
+                "suppressed": suppressed[index],
+            }
+            for index, (email_request, result) in enumerate(zip(email_requests, results))
+        ])
+
+        return results
+
+    @staticmethod
+    async def log_batch_results(db: Session, entries: list):
+        """
+        Write the email_logs rows of a batch that has already been sent. The emails are out,
+        so a failing write is logged (with the message ids) instead of failing the request.
+        """
+        try:
+            await EmailRepository.create_email_logs(db, entries)
+        except Exception as e:
+            metrics.increment("batch.log_failures")
+            message_ids = [entry["message_id"] for entry in entries if entry["message_id"]]
+            logger.error(f"Failed to log a batch of {len(entries)} emails (sent message ids: {message_ids}): {e}",
+                         exc_info=True)
+
+    @staticmethod
+    async def send_bulk_templated(template: EmailTemplateRequest, recipients: List[EmailRecipient],
+                                  db: Session) -> List[dict]:
+        """
+        Send a stored template to many recipients with SES SendBulkTemplatedEmail: SES
+        personalises up to 50 destinations per call from each recipient's template_data.
+        Chunks are sent concurrently (at most BATCH_SEND_CONCURRENCY in flight) within the
+        send rate, and each destination's status is logged on its own email_logs row.
+        Templates SES cannot express are rendered locally and sent through send_batch.
+        """
+        compiled = await template_store.get(template.app_id, template.template_id)
+        template_name = await ses_template_sync.ensure(template.app_id, compiled)
+        if template_name is None:
+            return await SESService.send_batch(BatchEmailRequest(template=template, recipients=recipients).expand(), db)
+
+        shared = template.template_data or {}
+        required = ses_template_sync.variables(compiled)
+        hashes = [RecipientRepository.address_hash(recipient.email) for recipient in recipients]
+        results = [None] * len(recipients)
+        variables = [{**shared, **(recipient.template_data or {})} for recipient in recipients]
+        try:
+            suppressed = await suppression_list.suppressed_hashes(hashes) if settings.SUPPRESSION_ENABLED else set()
+        except Exception as e:
+            # Nothing is sent without the suppression check; every destination is still logged
+            logger.error(f"Suppression lookup for a bulk send failed: {e}", exc_info=True)
+            suppressed = None
+            for index in range(len(recipients)):
+                results[index] = {"index": index, "message_id": None, "status": "Failed", "error": str(e)}
+
+        pending = []
+        for index in range(len(recipients) if suppressed is not None else 0):
+            missing = required - variables[index].keys()
+            if hashes[index] in suppressed:
+                results[index] = {"index": index, "message_id": None, "status": "Suppressed",
+                                  "error": "Recipient is on the suppression list"}
+            elif missing:
+                # SES would accept the call and drop the message at render time
+                results[index] = {"index": index, "message_id": None, "status": "Failed",
+                                  "error": f"Missing template variables: {', '.join(sorted(missing))}"}
+            else:
+                pending.append(index)
+
+        sender = f"{template.sender_name} <{template.sender}>" if template.sender_name else template.sender
+        default_data = json.dumps(shared, default=str)
+        semaphore = asyncio.Semaphore(settings.BATCH_SEND_CONCURRENCY)
+
+        async def send_chunk(indexes: list):
+            params = {
+                'Source': sender,
+                'Template': template_name,
+                'DefaultTemplateData': default_data,
+                'Destinations': [
+                    {
+                        'Destination': {'ToAddresses': [recipients[index].email]},
+                        'ReplacementTemplateData': json.dumps(variables[index], default=str),
+                    }
+                    for index in indexes
+                ],
+                'ConfigurationSetName': "my-first-configuration-set"
+            }
+            if template.reply_to:
+                params['ReplyToAddresses'] = template.reply_to
+
+            async def attempt():
+                await send_rate_limiter.acquire(len(indexes), bulk=True)
+                return await get_ses_transport().call("SendBulkTemplatedEmail", params)
+
+            async with semaphore:
+                try:
+                    response = await call_with_retry(attempt)
+                except (SESSendError, SendQuotaExceeded) as e:
+                    logger.warning(f"Bulk chunk of {len(indexes)} destinations failed: {e}")
+                    for index in indexes:
+                        results[index] = {"index": index, "message_id": None, "status": "Failed", "error": str(e)}
+                    return
+
+            # One status per destination, in request order
+            statuses = response.get('Status') or []
+            for position, index in enumerate(indexes):
+                status = statuses[position] if position < len(statuses) else {}
+                if status.get('Status') == "Success":
+                    results[index] = {"index": index, "message_id": status.get('MessageId'), "status": "Sent", "error": None}
+                else:
+                    error = f"{status.get('Status') or 'NoStatus'}: {status.get('Error') or ''}".rstrip(": ")
+                    results[index] = {"index": index, "message_id": None, "status": "Failed", "error": error}
+
+        async def send_chunk_safely(indexes: list):
+            try:
+                await send_chunk(indexes)
+            except Exception as e:
+                # Only this chunk's destinations without an outcome yet are marked failed
+                logger.error(f"Bulk chunk of {len(indexes)} destinations failed unexpectedly: {e}", exc_info=True)
+                for index in indexes:
+                    if results[index] is None:
+                        results[index] = {"index": index, "message_id": None, "status": "Failed", "error": str(e)}
+
+        await asyncio.gather(*(
+            send_chunk_safely(pending[start:start + SES_BULK_MAX_DESTINATIONS])
+            for start in range(0, len(pending), SES_BULK_MAX_DESTINATIONS)
+        ))
+
+        def log_request(index: int) -> EmailRequest:
+            try:
+                subject = compiled.render_subject(variables[index])
+            except TemplateRenderError:
+                subject = " ".join(compiled.sources[0].split())
+            return EmailRequest(
+                sender=template.sender,
+                sender_name=template.sender_name,
+                recipients=[recipients[index]],
+                content=EmailContent(subject=subject, body_text=""),
+                reply_to=template.reply_to,
+                app_id=template.app_id,
+            )
+
+        await SESService.log_batch_results(db, [
+            {
+                "email_request": log_request(index),
+                "message_id": result["message_id"],
+                "status": result["status"],
+                "is_success": result["status"] == "Sent",
+                "error_message": result["error"],
+                "suppressed": {hashes[index]} if result["status"] == "Suppressed" else None,
+            }
+            for index, result in enumerate(results)
+        ])
+
+        return results
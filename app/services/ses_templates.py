@@ -0,0 +1,154 @@
+import asyncio
+import hashlib
+import logging
+import re
+
+from botocore.exceptions import ClientError
+from jinja2 import meta, nodes
+
+from app.config import settings
+from app.services.metrics import metrics
+from app.services.ses_resilience import call_with_retry, SESSendError
+from app.services.ses_transport import get_ses_transport
+from app.services.templates import CompiledTemplate, html_env, text_env
+
+logger = logging.getLogger(__name__)
+
+SES_TEMPLATE_NAME_MAX_LENGTH = 64
+SES_TEMPLATE_PARTS = ("SubjectPart", "TextPart", "HtmlPart")
+
+
+def _handlebars(source: str, env, escape: bool) -> str:
+    """
+    Translate a Jinja2 template made only of text and {{ variable }} / {{ a.b }}
+    substitutions to SES (Handlebars) syntax; None if it uses anything else.
+    """
+    parts = []
+    for node in env.parse(source).body:
+        if not isinstance(node, nodes.Output):
+            return None
+        for child in node.nodes:
+            if isinstance(child, nodes.TemplateData):
+                if "{{" in child.data or "}}" in child.data:
+                    return None
+                parts.append(child.data)
+                continue
+            path = []
+            while isinstance(child, nodes.Getattr):
+                path.insert(0, child.attr)
+                child = child.node
+            if not isinstance(child, nodes.Name):
+                return None
+            path.insert(0, child.name)
+            expression = ".".join(path)
+            # Jinja escapes only the HTML part (autoescape); {{{ }}} is Handlebars' unescaped form
+            parts.append(f"{{{{{expression}}}}}" if escape else f"{{{{{{{expression}}}}}}}")
+    return "".join(parts)
+
+
+class SESTemplateSync:
+    """Publishes stored templates to SES as SES templates, for SendBulkTemplatedEmail.
+
+    Each version gets its own SES template name, which also carries a hash of the
+    template's content, so a bulk send keeps using the version it started with
+    while the template is being edited and a name never stands for other content.
+    Versions already published by this process are remembered. If the name exists
+    in SES already (usually published by another process first), its content is
+    checked and replaced with UpdateTemplate if it differs. Only templates made of
+    plain text and {{ variable }} substitutions can be expressed as SES templates;
+    the others are rendered locally instead.
+    """
+
+    def __init__(self, prefix: str):
+        self.prefix = prefix
+        self._synced = set()
+        self._local_only = set()
+        self._inflight = {}
+
+    def template_name(self, app_id: int, compiled: CompiledTemplate) -> str:
+        sources = "\0".join(source or "" for source in compiled.sources)
+        content = hashlib.sha256(sources.encode("utf-8")).hexdigest()[:8]
+        name = re.sub(
+            r"[^A-Za-z0-9_-]", "_", f"{self.prefix}-{app_id}-{compiled.template_id}-v{compiled.version}-{content}"
+        )
+        if len(name) > SES_TEMPLATE_NAME_MAX_LENGTH:
+            digest = hashlib.sha256(name.encode("utf-8")).hexdigest()[:16]
+            name = f"{name[:SES_TEMPLATE_NAME_MAX_LENGTH - len(digest) - 1]}-{digest}"
+        return name
+
+    @staticmethod
+    def variables(compiled: CompiledTemplate) -> set:
+        """Top-level variables the template needs"""
+        subject, body_text, body_html = compiled.sources
+        found = set()
+        for source, env in ((subject, text_env), (body_text, text_env), (body_html, html_env)):
+            if source:
+                found |= meta.find_undeclared_variables(env.parse(source))
+        return found
+
+    def ses_template(self, app_id: int, compiled: CompiledTemplate) -> dict:
+        """The SES CreateTemplate parameters for a template, or None if it cannot be expressed"""
+        subject, body_text, body_html = compiled.sources
+        subject_part = _handlebars(" ".join(subject.split()), text_env, escape=False)
+        text_part = _handlebars(body_text, text_env, escape=False)
+        html_part = _handlebars(body_html, html_env, escape=True) if body_html else None
+        if subject_part is None or text_part is None or (body_html and html_part is None):
+            return None
+        template = {
+            "TemplateName": self.template_name(app_id, compiled),
+            "SubjectPart": subject_part,
+            "TextPart": text_part,
+        }
+        if html_part:
+            template["HtmlPart"] = html_part
+        return template
+
+    async def ensure(self, app_id: int, compiled: CompiledTemplate) -> str:
+        """Make sure this template version exists in SES; returns its name, or None if not expressible"""
+        name = self.template_name(app_id, compiled)
+        if name in self._synced:
+            return name
+        if name in self._local_only:
+            return None
+
+        task = self._inflight.get(name)
+        if task is None:
+            task = asyncio.create_task(self._publish(app_id, compiled))
+            self._inflight[name] = task
+        return await asyncio.shield(task)
+
+    @staticmethod
+    async def _call(operation: str, params: dict) -> dict:
+        async def attempt():
+            return await get_ses_transport().call(operation, params)
+        return await call_with_retry(attempt)
+
+    async def _publish(self, app_id: int, compiled: CompiledTemplate) -> str:
+        name = self.template_name(app_id, compiled)
+        try:
+            template = self.ses_template(app_id, compiled)
+            if template is None:
+                logger.info(f"Template {compiled.template_id!r} uses Jinja features SES templates lack; rendering locally")
+                self._local_only.add(name)
+                return None
+
+            try:
+                await self._call("CreateTemplate", {"Template": template})
+                metrics.increment("ses_templates.published")
+            except SESSendError as e:
+                cause = e.__cause__
+                if not (isinstance(cause, ClientError) and cause.response.get("Error", {}).get("Code") == "AlreadyExists"):
+                    raise
+                # Usually published by another process in the meantime; never trust the name alone
+                existing = (await self._call("GetTemplate", {"TemplateName": name})).get("Template") or {}
+                if any((existing.get(part) or None) != template.get(part) for part in SES_TEMPLATE_PARTS):
+                    logger.warning(f"SES template {name} has different content; updating it")
+                    await self._call("UpdateTemplate", {"Template": template})
+                    metrics.increment("ses_templates.updated")
+            self._synced.add(name)
+            return name
+        finally:
+            self._inflight.pop(name, None)
+
+
+ses_template_sync = SESTemplateSync(prefix=settings.SES_TEMPLATE_PREFIX)
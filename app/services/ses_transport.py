@@ -0,0 +1,201 @@
+import base64
+import logging
+import xml.etree.ElementTree as ElementTree
+from urllib.parse import urlencode
+
+import boto3
+import httpx
+from botocore import xform_name
+from botocore.auth import SigV4Auth
+from botocore.awsrequest import AWSRequest
+from botocore.exceptions import (
+    ClientError, ConnectionClosedError, ConnectTimeoutError, EndpointConnectionError, HTTPClientError, ReadTimeoutError
+)
+
+from app.config import settings
+from app.services.aws_clients import get_aws_client
+from app.services.executor import ses_executor
+
+logger = logging.getLogger(__name__)
+
+SES_API_VERSION = "2010-12-01"
+
+
+class Boto3SESTransport:
+    """SES transport backed by the shared boto3 client, run on the SES executor"""
+
+    async def call(self, operation: str, params: dict) -> dict:
+        """Invoke an SES API operation (e.g. "SendEmail") with boto3-style params"""
+        # Retries are handled by ses_resilience, so botocore makes a single attempt
+        client = get_aws_client('ses', endpoint_url=settings.SES_ENDPOINT_URL or None, max_attempts=1)
+        method = getattr(client, xform_name(operation))
+        return await ses_executor.run(method, **params)
+
+    async def close(self):
+        pass
+
+
+class AsyncSESTransport:
+    """Native asyncio SES transport.
+
+    Requests are encoded for the SES Query API, signed with SigV4 and sent over a
+    shared httpx connection pool, so an in-flight send costs a coroutine rather
+    than an executor thread. Accepts and returns the same shapes as boto3 and
+    raises the same botocore exceptions, so callers can swap transports freely.
+    """
+
+    def __init__(self, region_name: str = None, endpoint_url: str = None):
+        self.region_name = region_name or settings.AWS_REGION
+        self.endpoint_url = endpoint_url or f"https://email.{self.region_name}.amazonaws.com/"
+        self._credentials = None
+        self._client = None
+
+    def _get_client(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=settings.SES_ASYNC_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.SES_ASYNC_MAX_CONNECTIONS,
+                ),
+                timeout=httpx.Timeout(settings.AWS_READ_TIMEOUT, connect=settings.AWS_CONNECT_TIMEOUT),
+            )
+        return self._client
+
+    def _get_credentials(self):
+        if self._credentials is None:
+            session = boto3.session.Session(
+                aws_access_key_id=settings.AWS_ACCESS_KEY_ID or None,
+                aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY or None,
+                region_name=self.region_name,
+            )
+            self._credentials = session.get_credentials()
+        # Frozen credentials pick up refreshes of temporary credentials
+        return self._credentials.get_frozen_credentials()
+
+    def _signed_request(self, operation: str, params: dict):
+        fields = {"Action": operation, "Version": SES_API_VERSION}
+        flatten_query_params(params, "", fields)
+        body = urlencode(fields).encode("utf-8")
+
+        request = AWSRequest(
+            method="POST",
+            url=self.endpoint_url,
+            data=body,
+            headers={"Content-Type": "application/x-www-form-urlencoded; charset=utf-8"},
+        )
+        SigV4Auth(self._get_credentials(), "ses", self.region_name).add_auth(request)
+        return body, dict(request.headers.items())
+
+    async def call(self, operation: str, params: dict) -> dict:
+        """Invoke an SES API operation (e.g. "SendEmail") with boto3-style params"""
+        body, headers = self._signed_request(operation, params)
+        try:
+            response = await self._get_client().post(self.endpoint_url, content=body, headers=headers)
+        except httpx.ConnectTimeout as e:
+            raise ConnectTimeoutError(endpoint_url=self.endpoint_url, error=e)
+        except httpx.ConnectError as e:
+            raise EndpointConnectionError(endpoint_url=self.endpoint_url, error=e)
+        except httpx.TimeoutException as e:
+            raise ReadTimeoutError(endpoint_url=self.endpoint_url, error=e)
+        except (httpx.NetworkError, httpx.RemoteProtocolError) as e:
+            # Reset/dropped connections: transient, as they are for the boto3 transport
+            raise ConnectionClosedError(endpoint_url=self.endpoint_url, error=e)
+        except httpx.HTTPError as e:
+            raise HTTPClientError(error=e)
+
+        return parse_query_response(operation, response.status_code, response.content)
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+def flatten_query_params(value, prefix: str, out: dict):
+    """Flatten boto3-style params into AWS Query API fields (Destination.ToAddresses.member.1=...)"""
+    if value is None:
+        return
+    if isinstance(value, dict):
+        for key, item in value.items():
+            flatten_query_params(item, f"{prefix}.{key}" if prefix else key, out)
+    elif isinstance(value, (list, tuple)):
+        for index, item in enumerate(value, start=1):
+            flatten_query_params(item, f"{prefix}.member.{index}", out)
+    elif isinstance(value, (bytes, bytearray, memoryview)):
+        out[prefix] = base64.b64encode(value).decode("ascii")
+    elif isinstance(value, bool):
+        out[prefix] = "true" if value else "false"
+    else:
+        out[prefix] = str(value)
+
+
+def _local_name(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+
+def _xml_to_python(element):
+    children = list(element)
+    if not children:
+        return element.text or ""
+    if all(_local_name(child.tag) == "member" for child in children):
+        return [_xml_to_python(child) for child in children]
+    return {_local_name(child.tag): _xml_to_python(child) for child in children}
+
+
+def parse_query_response(operation: str, status_code: int, content: bytes) -> dict:
+    """Turn an SES Query API XML response into a boto3-shaped dict or raise ClientError"""
+    try:
+        root = ElementTree.fromstring(content)
+    except ElementTree.ParseError:
+        root = None
+
+    request_id = None
+    if root is not None:
+        for element in root.iter():
+            if _local_name(element.tag) == "RequestId":
+                request_id = element.text
+                break
+    metadata = {"RequestId": request_id, "HTTPStatusCode": status_code}
+
+    if status_code >= 400 or root is None:
+        error = {"Code": str(status_code), "Message": content[:500].decode("utf-8", errors="replace")}
+        if root is not None:
+            for element in root.iter():
+                if _local_name(element.tag) == "Error":
+                    error.update({_local_name(child.tag): child.text or "" for child in element})
+                    break
+        raise ClientError({"Error": error, "ResponseMetadata": metadata}, operation)
+
+    result = {}
+    for element in root:
+        if _local_name(element.tag) == f"{operation}Result":
+            parsed = _xml_to_python(element)
+            result = parsed if isinstance(parsed, dict) else {}
+            break
+    result["ResponseMetadata"] = metadata
+    return result
+
+
+_transport = None
+
+
+def get_ses_transport():
+    """Return the process-wide SES transport selected by settings.SES_TRANSPORT"""
+    global _transport
+    if _transport is None:
+        if settings.SES_TRANSPORT == "async":
+            _transport = AsyncSESTransport(endpoint_url=settings.SES_ENDPOINT_URL or None)
+        elif settings.SES_TRANSPORT == "boto3":
+            _transport = Boto3SESTransport()
+        else:
+            raise ValueError(f"Unknown SES_TRANSPORT: {settings.SES_TRANSPORT}")
+        logger.info(f"Using {settings.SES_TRANSPORT} SES transport")
+    return _transport
+
+
+async def close_ses_transport():
+    """Close the transport's connection pool (called from the app lifespan)"""
+    global _transport
+    if _transport is not None:
+        await _transport.close()
+        _transport = None
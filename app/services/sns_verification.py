@@ -0,0 +1,155 @@
+import asyncio
+import base64
+import fnmatch
+import logging
+import time
+from collections import OrderedDict
+from urllib.parse import urlsplit
+
+import httpx
+from cryptography import x509
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import padding
+
+from app.config import settings
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Keys covered by the signature, in the order SNS builds the string to sign
+NOTIFICATION_FIELDS = ("Message", "MessageId", "Subject", "Timestamp", "TopicArn", "Type")
+SUBSCRIPTION_FIELDS = ("Message", "MessageId", "SubscribeURL", "Timestamp", "Token", "TopicArn", "Type")
+SIGNED_FIELDS = {
+    "Notification": NOTIFICATION_FIELDS,
+    "SubscriptionConfirmation": SUBSCRIPTION_FIELDS,
+    "UnsubscribeConfirmation": SUBSCRIPTION_FIELDS,
+}
+SIGNATURE_HASHES = {
+    "1": hashes.SHA1,
+    "2": hashes.SHA256,
+}
+
+
+class SNSSignatureError(Exception):
+    """An SNS message is not signed by an allowed SNS signing certificate"""
+
+
+async def fetch_certificate_https(url: str) -> bytes:
+    """Default certificate source: download the PEM from the (already allow-listed) URL"""
+    async with httpx.AsyncClient(timeout=settings.SNS_CERT_FETCH_TIMEOUT, follow_redirects=False) as client:
+        response = await client.get(url)
+        response.raise_for_status()
+        return response.content
+
+
+class SNSMessageVerifier:
+    """Verifies SNS message signatures against a cache of parsed signing certificates.
+
+    Certificates are fetched once per SigningCertURL (only from allow-listed hosts,
+    over https) and cached as public keys until they expire, so verifying a message
+    is one RSA signature check. Concurrent messages with an uncached certificate
+    share a single fetch. fetch_certificate (an async callable url -> PEM bytes)
+    can be replaced, e.g. with a local stand-in in tests.
+    """
+
+    def __init__(self, allowed_hosts: list, allowed_topics: list = None, cache_size: int = 16,
+                 fetch_certificate=fetch_certificate_https):
+        self.allowed_hosts = [host.lower() for host in allowed_hosts]
+        self.allowed_topics = set(allowed_topics or [])
+        self.cache_size = cache_size
+        self.fetch_certificate = fetch_certificate
+        self._keys = OrderedDict()
+        self._inflight = {}
+
+    @staticmethod
+    def string_to_sign(message: dict) -> bytes:
+        fields = SIGNED_FIELDS.get(message.get("Type"))
+        if fields is None:
+            raise SNSSignatureError(f"Unsupported SNS message type {message.get('Type')!r}")
+        return "".join(
+            f"{field}\n{message[field]}\n" for field in fields if message.get(field) is not None
+        ).encode("utf-8")
+
+    @staticmethod
+    def host_matches(host: str, pattern: str) -> bool:
+        """Match a host against a pattern where * stands for exactly one DNS label"""
+        labels, pattern_labels = host.split("."), pattern.split(".")
+        # Per label, so sns.*.amazonaws.com cannot match e.g. sns.bucket.s3.amazonaws.com
+        return len(labels) == len(pattern_labels) and all(
+            fnmatch.fnmatchcase(label, pattern_label) for label, pattern_label in zip(labels, pattern_labels)
+        )
+
+    def check_certificate_url(self, url: str):
+        parts = urlsplit(url or "")
+        host = (parts.hostname or "").lower()
+        if parts.scheme != "https" or not parts.path.endswith(".pem") \
+                or not any(self.host_matches(host, pattern) for pattern in self.allowed_hosts):
+            raise SNSSignatureError(f"Signing certificate URL not allowed: {url!r}")
+
+    async def public_key(self, url: str):
+        """Public key of the certificate at url, from the cache or fetched once"""
+        entry = self._keys.get(url)
+        if entry is not None and entry[1] > time.time():
+            self._keys.move_to_end(url)
+            return entry[0]
+
+        task = self._inflight.get(url)
+        if task is None:
+            metrics.increment("sns_verification.certificate_fetches")
+            task = asyncio.create_task(self._load(url))
+            self._inflight[url] = task
+        return await asyncio.shield(task)
+
+    async def _load(self, url: str):
+        try:
+            try:
+                pem = await self.fetch_certificate(url)
+                certificate = x509.load_pem_x509_certificate(pem)
+            except Exception as e:
+                raise SNSSignatureError(f"Could not load signing certificate {url!r}: {e}") from e
+
+            now = time.time()
+            not_before = certificate.not_valid_before_utc.timestamp()
+            not_after = certificate.not_valid_after_utc.timestamp()
+            if not not_before <= now < not_after:
+                raise SNSSignatureError(f"Signing certificate {url!r} is not valid at this time")
+
+            public_key = certificate.public_key()
+            if self.cache_size > 0:
+                self._keys[url] = (public_key, not_after)
+                self._keys.move_to_end(url)
+                while len(self._keys) > self.cache_size:
+                    self._keys.popitem(last=False)
+            return public_key
+        finally:
+            self._inflight.pop(url, None)
+
+    async def verify(self, message: dict):
+        """Raise SNSSignatureError unless message (the parsed SNS POST body) is authentic"""
+        if self.allowed_topics and message.get("TopicArn") not in self.allowed_topics:
+            raise SNSSignatureError(f"Topic not allowed: {message.get('TopicArn')!r}")
+
+        algorithm = SIGNATURE_HASHES.get(str(message.get("SignatureVersion")))
+        if algorithm is None:
+            raise SNSSignatureError(f"Unsupported SignatureVersion {message.get('SignatureVersion')!r}")
+        try:
+            signature = base64.b64decode(message.get("Signature") or "", validate=True)
+        except ValueError as e:
+            raise SNSSignatureError("Malformed signature") from e
+
+        url = message.get("SigningCertURL")
+        self.check_certificate_url(url)
+        public_key = await self.public_key(url)
+        try:
+            public_key.verify(signature, self.string_to_sign(message), padding.PKCS1v15(), algorithm())
+        except (InvalidSignature, TypeError, ValueError) as e:
+            metrics.increment("sns_verification.rejected")
+            raise SNSSignatureError("Invalid SNS message signature") from e
+
+
+sns_verifier = SNSMessageVerifier(
+    allowed_hosts=[host.strip() for host in settings.SNS_CERT_ALLOWED_HOSTS.split(",") if host.strip()],
+    allowed_topics=[arn.strip() for arn in settings.SNS_ALLOWED_TOPIC_ARNS.split(",") if arn.strip()],
+    cache_size=settings.SNS_CERT_CACHE_MAX_SIZE,
+)
@@ -0,0 +1,274 @@
+import asyncio
+import logging
+import math
+import time
+from collections import OrderedDict
+
+from app.config import settings
+from app.database.database import acquire_connection, release_connection
+from app.repositories.recipient_repositories import RecipientRepository
+from app.repositories.suppression_repositories import SuppressionRepository
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+SYNC_FETCH_SIZE = 10000
+
+
+class RecipientsSuppressed(Exception):
+    """Every recipient of an email is on the suppression list"""
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over sha256 address hashes (hex strings)"""
+
+    def __init__(self, capacity: int, error_rate: float):
+        capacity = max(1, capacity)
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.capacity = capacity
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, address_hash: str):
+        # The input already is a uniform hash: derive k positions by double hashing
+        h1 = int(address_hash[:16], 16)
+        h2 = int(address_hash[16:32], 16) | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hash_count))
+
+    def add(self, address_hash: str):
+        for position in self._positions(address_hash):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, address_hash: str) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(address_hash))
+
+
+class SuppressionList:
+    """In-process view of the suppressed_addresses table used to filter recipients.
+
+    A Bloom filter holding every suppressed hash answers "definitely not suppressed"
+    for the vast majority of addresses without touching the database. Bloom positives
+    are confirmed through an LRU cache of exact answers, falling back to one batched
+    DB lookup per email. New rows from other processes are picked up every
+    SUPPRESSION_SYNC_INTERVAL_SECONDS, and the filter is rebuilt from scratch every
+    SUPPRESSION_REBUILD_INTERVAL_SECONDS (dropping bits of removed entries).
+    Until the first load completes every address is checked against the database.
+    """
+
+    def __init__(self, sync_interval: float, rebuild_interval: float, cache_size: int, cache_ttl: float,
+                 error_rate: float, min_capacity: int):
+        self.sync_interval = sync_interval
+        self.rebuild_interval = rebuild_interval
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self.error_rate = error_rate
+        self.min_capacity = min_capacity
+        self._bloom = None
+        self._last_id = 0
+        self._rebuilt_at = 0.0
+        self._confirmed = OrderedDict()
+        self._task = None
+
+    # --- exact answer cache ---
+
+    def _cached(self, address_hash: str):
+        entry = self._confirmed.get(address_hash)
+        if entry is None:
+            return None
+        suppressed, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._confirmed[address_hash]
+            return None
+        self._confirmed.move_to_end(address_hash)
+        return suppressed
+
+    def _remember(self, address_hash: str, suppressed: bool):
+        if self.cache_size <= 0:
+            return
+        self._confirmed[address_hash] = (suppressed, time.monotonic() + self.cache_ttl)
+        self._confirmed.move_to_end(address_hash)
+        while len(self._confirmed) > self.cache_size:
+            self._confirmed.popitem(last=False)
+
+    def _loaded(self, address_hash: str):
+        # A row loaded from the table overrides a cached "not suppressed" answer,
+        # e.g. for a complaint handled by another process after the lookup
+        entry = self._confirmed.get(address_hash)
+        if entry is not None and not entry[0]:
+            self._confirmed[address_hash] = (True, entry[1])
+
+    # --- lookups ---
+
+    async def suppressed_hashes(self, address_hashes) -> set:
+        """Return which of the given address hashes are suppressed"""
+        suppressed = set()
+        unknown = []
+        for address_hash in set(address_hashes):
+            if self._bloom is not None and address_hash not in self._bloom:
+                continue
+            cached = self._cached(address_hash)
+            if cached is None:
+                unknown.append(address_hash)
+            elif cached:
+                suppressed.add(address_hash)
+
+        if unknown:
+            metrics.increment("suppression.db_lookups")
+            conn = await acquire_connection()
+            try:
+                found = await SuppressionRepository.find(conn, unknown)
+            finally:
+                await release_connection(conn)
+            for address_hash in unknown:
+                self._remember(address_hash, address_hash in found)
+            suppressed |= found
+        return suppressed
+
+    async def filter_request(self, email_request):
+        """
+        Drop suppressed addresses from to/cc/bcc.
+        Returns (request to send, set of suppressed address hashes); raises
+        RecipientsSuppressed when no recipient is left.
+        """
+        if not settings.SUPPRESSION_ENABLED:
+            return email_request, set()
+
+        roles = {
+            role: [(recipient, RecipientRepository.address_hash(recipient.email)) for recipient in recipients or []]
+            for role, recipients in (("recipients", email_request.recipients), ("cc", email_request.cc), ("bcc", email_request.bcc))
+        }
+        suppressed = await self.suppressed_hashes(
+            address_hash for pairs in roles.values() for _, address_hash in pairs
+        )
+        if not suppressed:
+            return email_request, suppressed
+
+        metrics.increment("suppression.dropped_recipients", sum(
+            1 for pairs in roles.values() for _, address_hash in pairs if address_hash in suppressed
+        ))
+        kept = {
+            role: [recipient for recipient, address_hash in pairs if address_hash not in suppressed]
+            for role, pairs in roles.items()
+        }
+        if not any(kept.values()):
+            raise RecipientsSuppressed("All recipients are on the suppression list")
+
+        return email_request.model_copy(update={
+            "recipients": kept["recipients"],
+            "cc": kept["cc"] or None,
+            "bcc": kept["bcc"] or None,
+        }), suppressed
+
+    # --- changes ---
+
+    def add_local(self, address_hashes):
+        """Make new suppressions effective in this process immediately"""
+        for address_hash in address_hashes:
+            if self._bloom is not None:
+                self._bloom.add(address_hash)
+            self._remember(address_hash, True)
+
+    async def add(self, addresses: list, reason: str = "manual") -> int:
+        """Suppress addresses (admin); returns the number of new entries"""
+        hashes = [RecipientRepository.address_hash(address) for address in addresses]
+        conn = await acquire_connection()
+        try:
+            added = await SuppressionRepository.add(conn, [(address_hash, reason, None) for address_hash in hashes])
+        finally:
+            await release_connection(conn)
+        self.add_local(hashes)
+        return added
+
+    async def remove(self, addresses: list) -> int:
+        """Unsuppress addresses (admin); the Bloom bits stay until the next rebuild"""
+        hashes = [RecipientRepository.address_hash(address) for address in addresses]
+        conn = await acquire_connection()
+        try:
+            removed = await SuppressionRepository.remove(conn, hashes)
+        finally:
+            await release_connection(conn)
+        for address_hash in hashes:
+            self._remember(address_hash, False)
+        return removed
+
+    # --- loading ---
+
+    async def rebuild(self):
+        """Load every suppressed hash into a fresh, right-sized Bloom filter and swap it in"""
+        started_at = time.perf_counter()
+        conn = await acquire_connection()
+        try:
+            total, _ = await SuppressionRepository.stats(conn)
+            bloom = BloomFilter(max(self.min_capacity, total * 2), self.error_rate)
+            last_id = 0
+            while True:
+                rows = await SuppressionRepository.fetch_after(conn, last_id, SYNC_FETCH_SIZE)
+                if not rows:
+                    break
+                for row_id, address_hash in rows:
+                    bloom.add(address_hash)
+                    self._loaded(address_hash)
+                last_id = rows[-1][0]
+        finally:
+            await release_connection(conn)
+
+        # Keep local additions that may not be committed yet (e.g. still in the event buffer)
+        for address_hash, (suppressed, _) in self._confirmed.items():
+            if suppressed:
+                bloom.add(address_hash)
+        self._bloom, self._last_id, self._rebuilt_at = bloom, last_id, time.monotonic()
+        metrics.set_gauge("suppression.entries", bloom.count)
+        metrics.observe("suppression.rebuild_seconds", time.perf_counter() - started_at)
+
+    async def sync(self):
+        """Add entries created since the last load (by any process) to the filter"""
+        if self._bloom is None or time.monotonic() - self._rebuilt_at >= self.rebuild_interval \
+                or self._bloom.count >= self._bloom.capacity:
+            await self.rebuild()
+            return
+
+        conn = await acquire_connection()
+        try:
+            while True:
+                rows = await SuppressionRepository.fetch_after(conn, self._last_id, SYNC_FETCH_SIZE)
+                if not rows:
+                    break
+                for _, address_hash in rows:
+                    self._bloom.add(address_hash)
+                    self._loaded(address_hash)
+                self._last_id = rows[-1][0]
+        finally:
+            await release_connection(conn)
+        metrics.set_gauge("suppression.entries", self._bloom.count)
+
+    async def _run(self):
+        while True:
+            try:
+                await self.sync()
+            except Exception as e:
+                logger.error(f"Failed to load the suppression list: {e}", exc_info=True)
+            await asyncio.sleep(self.sync_interval)
+
+    def start(self):
+        """Start the periodic load/sync task on the running event loop"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="suppression-list")
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+
+suppression_list = SuppressionList(
+    sync_interval=settings.SUPPRESSION_SYNC_INTERVAL_SECONDS,
+    rebuild_interval=settings.SUPPRESSION_REBUILD_INTERVAL_SECONDS,
+    cache_size=settings.SUPPRESSION_CACHE_MAX_SIZE,
+    cache_ttl=settings.SUPPRESSION_CACHE_TTL_SECONDS,
+    error_rate=settings.SUPPRESSION_BLOOM_ERROR_RATE,
+    min_capacity=settings.SUPPRESSION_BLOOM_MIN_CAPACITY,
+)
@@ -0,0 +1,213 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+from jinja2 import StrictUndefined, TemplateError as JinjaTemplateError
+from jinja2.sandbox import SandboxedEnvironment
+
+from app.config import settings
+from app.database.database import acquire_connection, release_connection
+from app.models.email_models import EmailContent
+from app.repositories.template_repositories import TemplateRepository
+from app.services.executor import BlockingExecutor
+from app.services.metrics import metrics
+
+
+class TemplateError(Exception):
+    """Base class for stored template failures"""
+
+
+class TemplateNotFound(TemplateError):
+    """No template with this id exists for the application"""
+
+
+class TemplateInvalid(TemplateError):
+    """A template does not compile"""
+
+
+class TemplateRenderError(TemplateError):
+    """A template failed to render with the given variables"""
+
+
+# Sandboxed: templates are written by API clients. Missing variables are errors, not blanks.
+text_env = SandboxedEnvironment(undefined=StrictUndefined, autoescape=False, keep_trailing_newline=True)
+html_env = SandboxedEnvironment(undefined=StrictUndefined, autoescape=True, keep_trailing_newline=True)
+
+
+class CompiledTemplate:
+    """The compiled subject/text/HTML of one version of a stored template"""
+
+    def __init__(self, template_id: str, version: int, subject: str, body_text: str, body_html: str = None):
+        self.template_id = template_id
+        self.version = version
+        self.sources = (subject, body_text, body_html)
+        try:
+            self.subject = text_env.from_string(subject)
+            self.body_text = text_env.from_string(body_text)
+            self.body_html = html_env.from_string(body_html) if body_html else None
+        except JinjaTemplateError as e:
+            raise TemplateInvalid(f"Template {template_id!r} does not compile: {e}") from e
+
+    # Templates are client code: besides Jinja errors they can raise anything at render
+    # time (e.g. ZeroDivisionError for {{ 1 / b }}), and all of it is the client's error
+    def render_subject(self, variables: dict) -> str:
+        try:
+            return " ".join(self.subject.render(variables).split())
+        except Exception as e:
+            raise TemplateRenderError(f"Template {self.template_id!r} failed to render: {e}") from e
+
+    def render(self, variables: dict) -> EmailContent:
+        subject = self.render_subject(variables)
+        try:
+            return EmailContent(
+                subject=subject,
+                body_text=self.body_text.render(variables),
+                body_html=self.body_html.render(variables) if self.body_html else None,
+            )
+        except Exception as e:
+            raise TemplateRenderError(f"Template {self.template_id!r} failed to render: {e}") from e
+
+
+class TemplateStore:
+    """Compiled-template cache in front of the email_templates table.
+
+    Templates are compiled once per version and kept in an LRU keyed by
+    (app_id, template_id, version). The current version of a template is looked
+    up at most every TEMPLATE_VERSION_TTL_SECONDS (a one-column query), so edits
+    made on other nodes are picked up quickly without re-reading the bodies.
+    Large recipient lists are rendered in chunks on a dedicated worker pool so
+    the event loop stays responsive.
+    """
+
+    def __init__(self, cache_size: int, version_ttl: float, chunk_size: int, executor: BlockingExecutor):
+        self.cache_size = cache_size
+        self.version_ttl = version_ttl
+        self.chunk_size = max(1, chunk_size)
+        self.executor = executor
+        self._compiled = OrderedDict()
+        self._versions = {}
+        self._inflight = {}
+
+    def forget(self, app_id: int, template_id: str):
+        """Drop the cached version and compiled versions of a template after it was changed or deleted"""
+        self._versions.pop((app_id, template_id), None)
+        for key in [key for key in self._compiled if key[:2] == (app_id, template_id)]:
+            del self._compiled[key]
+
+    async def _current_version(self, app_id: int, template_id: str) -> int:
+        entry = self._versions.get((app_id, template_id))
+        if entry is not None and entry[1] > time.monotonic():
+            return entry[0]
+
+        conn = await acquire_connection()
+        try:
+            version = await TemplateRepository.get_version(conn, app_id, template_id)
+        finally:
+            await release_connection(conn)
+        if version is None:
+            self.forget(app_id, template_id)
+            raise TemplateNotFound(f"Template {template_id!r} not found")
+        self._versions[(app_id, template_id)] = (version, time.monotonic() + self.version_ttl)
+        return version
+
+    async def get(self, app_id: int, template_id: str) -> CompiledTemplate:
+        """The compiled current version of a template"""
+        key = (app_id, template_id, await self._current_version(app_id, template_id))
+        compiled = self._compiled.get(key)
+        if compiled is not None:
+            self._compiled.move_to_end(key)
+            metrics.increment("templates.cache_hits")
+            return compiled
+
+        task = self._inflight.get(key)
+        if task is None:
+            metrics.increment("templates.cache_misses")
+            task = asyncio.create_task(self._load(key))
+            self._inflight[key] = task
+        return await asyncio.shield(task)
+
+    async def _load(self, key) -> CompiledTemplate:
+        app_id, template_id, _ = key
+        try:
+            conn = await acquire_connection()
+            try:
+                row = await TemplateRepository.get(conn, app_id, template_id)
+            finally:
+                await release_connection(conn)
+            if row is None:
+                self.forget(app_id, template_id)
+                raise TemplateNotFound(f"Template {template_id!r} not found")
+
+            compiled = await self.executor.run(
+                CompiledTemplate, template_id, row["version"], row["subject"], row["body_text"], row["body_html"]
+            )
+            # The row may be newer than the version we asked for; cache it under its own version
+            if self.cache_size > 0:
+                compiled_key = (app_id, template_id, compiled.version)
+                self._compiled[compiled_key] = compiled
+                self._compiled.move_to_end(compiled_key)
+                while len(self._compiled) > self.cache_size:
+                    self._compiled.popitem(last=False)
+            return compiled
+        finally:
+            self._inflight.pop(key, None)
+
+    @staticmethod
+    def _rendered(email_request, content: EmailContent):
+        # The result is a plain content email (also what gets stored in the outbox)
+        return email_request.model_copy(update={"content": content, "template_id": None, "template_data": None})
+
+    async def render_request(self, email_request):
+        """Fill in the content of a templated email request; other requests are returned as is"""
+        if not email_request.template_id:
+            return email_request
+        compiled = await self.get(email_request.app_id, email_request.template_id)
+        content = await self.executor.run(compiled.render, email_request.template_data or {})
+        return self._rendered(email_request, content)
+
+    @staticmethod
+    def _render_chunk(compiled: CompiledTemplate, items: list) -> list:
+        contents = []
+        for index, variables in items:
+            try:
+                contents.append(compiled.render(variables))
+            except TemplateRenderError as e:
+                raise TemplateRenderError(f"Item {index}: {e}") from e
+        return contents
+
+    async def render_requests(self, email_requests: list) -> list:
+        """
+        Render every templated request of a batch. Requests are grouped per template and
+        rendered in chunks of TEMPLATE_RENDER_CHUNK_SIZE on the render pool, concurrently.
+        """
+        groups = {}
+        for index, email_request in enumerate(email_requests):
+            if email_request.template_id:
+                groups.setdefault((email_request.app_id, email_request.template_id), []).append(index)
+        if not groups:
+            return email_requests
+
+        rendered = list(email_requests)
+        for (app_id, template_id), indexes in groups.items():
+            compiled = await self.get(app_id, template_id)
+            items = [(index, email_requests[index].template_data or {}) for index in indexes]
+            chunks = [items[start:start + self.chunk_size] for start in range(0, len(items), self.chunk_size)]
+            results = await asyncio.gather(*(
+                self.executor.run(self._render_chunk, compiled, chunk) for chunk in chunks
+            ))
+            for chunk, contents in zip(chunks, results):
+                for (index, _), content in zip(chunk, contents):
+                    rendered[index] = self._rendered(email_requests[index], content)
+        metrics.increment("templates.rendered", sum(len(indexes) for indexes in groups.values()))
+        return rendered
+
+
+# Template rendering is CPU-bound; it gets its own small pool instead of the SES executor
+template_executor = BlockingExecutor("template", max_workers=settings.TEMPLATE_RENDER_WORKERS)
+
+template_store = TemplateStore(
+    cache_size=settings.TEMPLATE_CACHE_MAX_SIZE,
+    version_ttl=settings.TEMPLATE_VERSION_TTL_SECONDS,
+    chunk_size=settings.TEMPLATE_RENDER_CHUNK_SIZE,
+    executor=template_executor,
+)
@@ -0,0 +1,81 @@
+import hashlib
+import time
+from collections import OrderedDict
+
+from app.config import settings
+
+
+class TokenCache:
+    """Bounded LRU + TTL cache of application token verification results.
+
+    Entries are keyed by (app_id, sha256(token)) so raw tokens are never kept
+    in memory. Failed lookups are cached too (with a shorter TTL) so a client
+    hammering with a bad token does not translate into database traffic.
+
+    Applications are edited outside this service, so nothing here observes a
+    token rotation or deactivation: a cached verification stays valid for up to
+    TOKEN_CACHE_TTL_SECONDS unless invalidate_application_token() is called
+    (the admin token-cache endpoint does).
+    """
+
+    def __init__(self, max_size: int, ttl: float, negative_ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries = OrderedDict()
+
+    @staticmethod
+    def _key(app_id, token: str):
+        return str(app_id), hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+    def get(self, app_id, token: str):
+        """Return (hit, application) where application is None for a cached rejection"""
+        key = self._key(app_id, token)
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+
+        application, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return False, None
+
+        self._entries.move_to_end(key)
+        return True, application
+
+    def set(self, app_id, token: str, application):
+        """Cache a verification result; pass application=None to cache a rejection"""
+        if self.max_size <= 0:
+            return
+
+        ttl = self.ttl if application is not None else self.negative_ttl
+        if ttl <= 0:
+            return
+
+        key = self._key(app_id, token)
+        self._entries[key] = (application, time.monotonic() + ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, app_id=None):
+        """Drop cached entries for one application, or everything if app_id is None"""
+        if app_id is None:
+            self._entries.clear()
+            return
+
+        app_id = str(app_id)
+        for key in [key for key in self._entries if key[0] == app_id]:
+            del self._entries[key]
+
+
+token_cache = TokenCache(
+    max_size=settings.TOKEN_CACHE_MAX_SIZE,
+    ttl=settings.TOKEN_CACHE_TTL_SECONDS,
+    negative_ttl=settings.TOKEN_CACHE_NEGATIVE_TTL_SECONDS,
+)
+
+
+def invalidate_application_token(app_id=None):
+    """Drop this process's cached verifications after a token rotation or is_active change"""
+    token_cache.invalidate(app_id)